@@ -1,4 +1,5 @@
 # src/config_scanner.py
+import os
 from pathlib import Path
 
 # --- 1. RUTAS RAÍZ A ESCANEAR (Dinamismo PC Trabajo vs Casa) ---
@@ -103,4 +104,50 @@ EXTENSIONES_PERMITIDAS = {
 
     # -- COMPRESIÓN ARCHIVOS -- 
      ".7z", ".rar"
-}
\ No newline at end of file
+}
+
+# --- 5. RENDIMIENTO DEL ESCANEO (pipeline_escaneo.py) ---
+# hashlib suelta el GIL al hashear, así que varios hilos aprovechan varios núcleos.
+# En discos mecánicos o unidades de red conviene bajar HILOS_HASH (2-4) para no
+# provocar saltos de cabezal / peticiones concurrentes.
+HILOS_HASH = min(8, os.cpu_count() or 2)
+TAM_COLA_ESCANEO = 1000     # Máximo de archivos esperando en cada cola (memoria acotada)
+INTERVALO_PROGRESO = 5      # Segundos entre mensajes de progreso
+MODO_RECORRIDO = "profundidad"  # "profundidad" (menos memoria) o "anchura" (primero lo más superficial)
+
+# Huella de los archivos en el inventario:
+#   "escalonado" -> tamaño + huella parcial (principio/medio/final); el SHA-256 completo
+#                   solo cuando hace falta (colisiones, duplicados, indexado RAG).
+#   "completo"   -> SHA-256 de todo el archivo siempre (comportamiento original, más lento).
+MODO_HUELLA = "escalonado"
+
+# --- 6. VIGILANTE EN TIEMPO REAL (monitores/monitor_archivos.py) ---
+# Las unidades de red (Google Drive en G:, rutas UNC) no siempre emiten eventos nativos
+# del sistema de archivos: para esas raíces se usa un observador por sondeo.
+UNIDADES_DE_RED = ("G:", "\\\\", "//")
+INTERVALO_SONDEO_RED = 30   # Segundos entre barridos del observador por sondeo
+
+# --- 7. ESTIMACIÓN DE TOKENS POR TAMAÑO (utils.estimar_tokens) ---
+# Antes de extraer el texto solo se conoce el tamaño en disco. "1 token ~= 4 bytes" vale
+# para texto plano, pero un .xlsx/.docx es XML comprimido y un .dwg casi no lleva texto
+# útil para el LLM. Bytes en disco por token de texto, según el formato:
+BYTES_POR_TOKEN_TEXTO = 4
+BYTES_POR_TOKEN_EXTENSION = {
+    # Ofimática OOXML / ODF (zip de XML: mucho marcado, comprimido)
+    ".docx": 8, ".docm": 8, ".dotx": 8, ".dotm": 8, ".docb": 8, ".odt": 8,
+    ".xlsx": 8, ".xlsm": 8, ".xltx": 8, ".xltm": 8, ".xlsb": 8, ".ods": 8, ".xls": 12,
+    ".pptx": 40, ".pptm": 40, ".potx": 40, ".potm": 40, ".ppsx": 40, ".ppsm": 40, ".ppam": 40, ".odp": 40,
+    ".pdf": 20, ".rtf": 10, ".wps": 12,
+    # Intercambio CAD/BIM en texto (códigos de grupo / STEP): el texto útil es una fracción
+    ".dxf": 40, ".ifc": 12,
+    # Buzones / correo (cabeceras y adjuntos en base64)
+    ".eml": 8, ".mbox": 8,
+}
+# Formatos binarios sin texto que leer: cuentan 0 tokens
+EXTENSIONES_SIN_TEXTO = {
+    ".fcstd", ".blend", ".dwg", ".rvt", ".rfa", ".stl", ".obj", ".3dm", ".sat", ".skp",
+    ".pc3", ".ctb", ".pzh", ".ico",
+    ".png", ".jpg", ".jpeg", ".bmp", ".webp", ".tiff", ".gif", ".jpe", ".exif",
+    ".aep", ".ai", ".aif", ".ait", ".eps",
+    ".7z", ".rar",
+}
@@ -0,0 +1,286 @@
+# src/enlazador_activos.py
+# Enlaza títulos de ventana ("Autodesk AutoCAD 2024 - [Plano_P01.dwg]") con su activo, sin LLM.
+#
+#   Activos (nombre, raíz) --índice en memoria--> {patrón: IDs}
+#   título --tramos alineados a palabras--> patrón más largo --proceso/extensión--> (ID, confianza)
+#
+# - Patrones: el nombre completo ("plano_p01.dwg") y la raíz sin extensión ("plano_p01"),
+#   en minúsculas y sin signos en los extremos. Un nombre de archivo siempre empieza y acaba
+#   en el borde de una palabra del título, así que basta probar los tramos del título que van
+#   de un inicio de palabra a un final de palabra: unas decenas de búsquedas en un dict por
+#   título (microsegundos), y la memoria es la de un dict, no la de un autómata por carácter.
+# - Confianza: ALTA = nombre completo de un único activo; MEDIA = nombre repetido en varias
+#   carpetas (se elige el de Mtime_ns más reciente) o solo la raíz, compatible con el programa de la
+#   ventana; NULA = nada o demasiado ambiguo (sin ID).
+# - Refresco incremental: solo los activos con Fecha_Modificacion_DB desde el último refresco
+#   (índice idx_activos_fecha_modificacion). Un activo re-insertado con otro ID se reconoce
+#   por su ruta; las lápidas (Eliminado = 1) salen del índice.
+
+import re
+import sys
+import threading
+import time
+from collections import namedtuple
+
+try:
+    from src import gestor_db
+except ImportError:
+    import gestor_db
+
+MIN_LETRAS_RAIZ = 5             # Raíces más cortas ("a1", "plan") darían demasiados falsos positivos
+MAX_CANDIDATOS_RAIZ = 3         # Una raíz compartida por más activos (tras filtrar) no enlaza
+SEGUNDOS_ENTRE_REFRESCOS = 30   # 'enlazar' refresca el índice como mucho con esta frecuencia
+TAM_LOTE_HISTORICO = 2000
+
+ALTA, MEDIA, NULA = "ALTA", "MEDIA", "NULA"
+
+# Qué abre cada programa (ejecutable en minúsculas, sin ".exe"): filtra candidatos y valida raíces
+EXTENSIONES_POR_PROCESO = {
+    "acad": {".dwg", ".dxf", ".dwt", ".dws"},
+    "revit": {".rvt", ".rfa", ".rte"},
+    "3dsmax": {".max"},
+    "blender": {".blend"},
+    "sketchup": {".skp"},
+    "rhino": {".3dm"},
+    "archicad": {".pln", ".pla", ".tpl"},
+    "winword": {".docx", ".doc", ".docm", ".rtf", ".odt"},
+    "excel": {".xlsx", ".xls", ".xlsm", ".csv", ".ods"},
+    "powerpnt": {".pptx", ".ppt", ".odp"},
+    "acrord32": {".pdf"},
+    "acrobat": {".pdf"},
+    "soffice.bin": {".odt", ".ods", ".odp", ".docx", ".xlsx", ".pptx", ".doc", ".xls", ".ppt"},
+}
+
+_PALABRA = re.compile(r"[^\W_]+")
+
+Enlace = namedtuple("Enlace", "id_activo confianza patron")
+SIN_ENLACE = Enlace(None, NULA, None)
+
+
+_EXTREMOS = re.compile(r"^[\W_]+|[\W_]+$")
+
+def normalizar(texto):
+    """Minúsculas (casefold) y sin signos ni espacios en los extremos."""
+    texto = (texto or "").casefold()
+    if texto[:1].isalnum() and texto[-1:].isalnum():
+        return texto # Lo normal en un nombre de archivo: sin regex
+    return _EXTREMOS.sub("", texto)
+
+def _nombre_proceso(proceso):
+    proceso = (proceso or "").lower()
+    return proceso[:-4] if proceso.endswith(".exe") else proceso
+
+def _patrones(nombre):
+    """(clave del nombre completo, clave de la raíz o None) de un Nombre_Archivo."""
+    clave = normalizar(nombre)
+    punto = nombre.rfind(".")
+    raiz = normalizar(nombre[:punto]) if punto > 0 else None
+    if raiz == clave or not raiz or len(raiz) < MIN_LETRAS_RAIZ or raiz.isdigit():
+        raiz = None
+    return clave, raiz
+
+
+class EnlazadorActivos:
+    """
+    Índice en memoria nombre/raíz -> activos. Seguro entre hilos. 'enlazar' lo refresca solo;
+    'refrescar' y 'reconstruir' fuerzan la lectura de la DB.
+    """
+    def __init__(self, segundos_entre_refrescos=SEGUNDOS_ENTRE_REFRESCOS):
+        self.segundos_entre_refrescos = segundos_entre_refrescos
+        self._lock = threading.Lock()
+        self._vaciar()
+
+    def _vaciar(self):
+        # clave -> ID_Activo, o {ID_Activo} si varios comparten la clave (un set por clave
+        # multiplicaría la memoria: casi todas las claves son de un solo activo)
+        self._nombres = {}
+        self._raices = {}
+        self._activos = {}   # ID_Activo -> (Nombre_Archivo, extensión, hash de la ruta, Mtime_ns)
+        self._por_ruta = {}  # hash de la ruta -> ID_Activo
+        self._max_largo = 0
+        self._marca = ""     # Fecha_Modificacion_DB más alta ya leída
+        self._refrescado = None
+
+    # --- ÍNDICE ---
+
+    @staticmethod
+    def _poner_en(indice, clave, activo_id):
+        ids = indice.get(clave)
+        if ids is None:
+            indice[clave] = activo_id
+        elif isinstance(ids, set):
+            ids.add(activo_id)
+        elif ids != activo_id:
+            indice[clave] = {ids, activo_id}
+
+    @staticmethod
+    def _quitar_de(indice, clave, activo_id):
+        ids = indice.get(clave)
+        if ids == activo_id:
+            del indice[clave]
+        elif isinstance(ids, set):
+            ids.discard(activo_id)
+            if len(ids) == 1:
+                indice[clave] = ids.pop()
+
+    def _quitar(self, activo_id):
+        nombre, _, ruta, _ = self._activos.pop(activo_id)
+        if self._por_ruta.get(ruta) == activo_id:
+            del self._por_ruta[ruta]
+        clave, raiz = _patrones(nombre)
+        self._quitar_de(self._nombres, clave, activo_id)
+        if raiz:
+            self._quitar_de(self._raices, raiz, activo_id)
+
+    def _poner(self, activo_id, ruta, nombre, extension, eliminado, mtime_ns=None):
+        ruta = hash(ruta.casefold()) # Solo para reconocer la misma ruta con otro ID: basta un entero
+        if activo_id in self._activos:
+            self._quitar(activo_id)
+        anterior = self._por_ruta.get(ruta)
+        if anterior is not None and anterior in self._activos:
+            self._quitar(anterior) # INSERT OR REPLACE: el activo vuelve con un ID nuevo
+        if eliminado or not nombre:
+            return
+        clave, raiz = _patrones(nombre)
+        if not clave:
+            return
+        self._activos[activo_id] = (nombre, sys.intern((extension or "").lower()), ruta, mtime_ns or 0)
+        self._por_ruta[ruta] = activo_id
+        self._poner_en(self._nombres, clave, activo_id)
+        if raiz:
+            self._poner_en(self._raices, raiz, activo_id)
+        self._max_largo = max(self._max_largo, len(clave))
+
+    def refrescar(self):
+        """Aplica los activos cambiados desde el último refresco. Devuelve cuántos ha leído."""
+        leidos = 0
+        with self._lock:
+            try:
+                for filas in gestor_db.obtener_activos_modificados_desde(self._marca):
+                    for activo_id, ruta, nombre, extension, eliminado, mtime_ns, fecha in filas:
+                        self._poner(activo_id, ruta, nombre, extension, eliminado, mtime_ns)
+                        if fecha and fecha > self._marca:
+                            self._marca = fecha
+                    leidos += len(filas)
+            except Exception as e:
+                print(f"Error refrescando el enlazador de activos: {e}")
+            self._refrescado = time.monotonic()
+        return leidos
+
+    def reconstruir(self):
+        """Vuelve a leer todos los activos (por si se borraron filas sin dejar lápida)."""
+        with self._lock:
+            self._vaciar()
+        return self.refrescar()
+
+    def _refrescar_si_toca(self):
+        if self._refrescado is None or time.monotonic() - self._refrescado >= self.segundos_entre_refrescos:
+            self.refrescar()
+
+    # --- ENLACE ---
+
+    def _candidatos(self, ids, proceso):
+        """Filtra 'ids' por las extensiones que abre 'proceso' (si se conoce y deja alguno)."""
+        extensiones = EXTENSIONES_POR_PROCESO.get(proceso)
+        if not extensiones:
+            return ids, None
+        compatibles = [activo_id for activo_id in ids if self._activos[activo_id][1] in extensiones]
+        return (compatibles or ids), bool(compatibles)
+
+    def _mas_reciente(self, ids):
+        """El de Mtime_ns más alto (el ID solo desempata: es orden de inserción, no de edición)."""
+        return max(ids, key=lambda activo_id: (self._activos[activo_id][3], activo_id))
+
+    def _buscar(self, titulo):
+        """(patrón, ids, es_nombre_completo) del patrón más largo del título; los nombres ganan a las raíces."""
+        mejor = None
+        palabras = list(_PALABRA.finditer(titulo))
+        finales = [palabra.end() for palabra in palabras]
+        for i, palabra in enumerate(palabras):
+            inicio = palabra.start()
+            for fin in finales[i:]:
+                if fin - inicio > self._max_largo:
+                    break
+                tramo = titulo[inicio:fin]
+                for completo, indice in ((True, self._nombres), (False, self._raices)):
+                    ids = indice.get(tramo)
+                    if ids is not None and (mejor is None or (completo, len(tramo)) > (mejor[2], len(mejor[0]))):
+                        mejor = (tramo, ids, completo)
+        return mejor
+
+    def enlazar(self, titulo, proceso=None, refrescar=True):
+        """Enlace (id_activo, confianza, patrón) para un título de ventana y su proceso."""
+        if refrescar:
+            self._refrescar_si_toca()
+        titulo = (titulo or "").casefold()
+        proceso = _nombre_proceso(proceso)
+        with self._lock:
+            encontrado = self._buscar(titulo)
+            if encontrado is None:
+                return SIN_ENLACE
+            patron, ids, completo = encontrado
+            ids, compatible = self._candidatos(list(ids) if isinstance(ids, set) else [ids], proceso)
+            if completo:
+                if len(ids) == 1:
+                    return Enlace(ids[0], ALTA, patron)
+                return Enlace(self._mas_reciente(ids), MEDIA, patron) # Mismo nombre en varias carpetas
+            # Solo la raíz: hace falta que el programa de la ventana la respalde (o no saber cuál es).
+            # Con un programa que no abre esa extensión, o uno genérico (navegador, explorador...),
+            # una palabra suelta del título no basta.
+            if compatible is False or (compatible is None and proceso):
+                return SIN_ENLACE
+            if len(ids) > MAX_CANDIDATOS_RAIZ:
+                return SIN_ENLACE
+            return Enlace(self._mas_reciente(ids), MEDIA, patron)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "activos": len(self._activos),
+                "nombres": len(self._nombres),
+                "raices": len(self._raices),
+                "marca": self._marca,
+            }
+
+ENLAZADOR_ACTIVOS = EnlazadorActivos()
+
+def enlazar_titulo(titulo, proceso=None):
+    return ENLAZADOR_ACTIVOS.enlazar(titulo, proceso)
+
+
+def enlazar_historico(tam_lote=TAM_LOTE_HISTORICO, enlazador=None):
+    """
+    Rellena ID_Activo_Asociado y Confianza_Enlace de los focos antiguos (Registros FOCO_VENTANA y
+    Sesiones_Foco) que aún no lo tienen, por lotes. NULA también se guarda: no se reintenta.
+    Devuelve {confianza: filas}.
+    """
+    enlazador = enlazador or ENLAZADOR_ACTIVOS
+    enlazador.refrescar()
+    totales = {ALTA: 0, MEDIA: 0, NULA: 0}
+    for tabla in ("Registros", "Sesiones_Foco"):
+        desde_id = 0
+        while True:
+            filas = gestor_db.obtener_focos_sin_enlazar(tabla, desde_id, tam_lote)
+            if not filas:
+                break
+            enlaces = []
+            for fila_id, titulo, proceso in filas:
+                enlace = enlazador.enlazar(titulo, proceso, refrescar=False)
+                enlaces.append((enlace.id_activo, enlace.confianza, fila_id))
+                totales[enlace.confianza] += 1
+            gestor_db.guardar_enlaces(tabla, enlaces)
+            desde_id = filas[-1][0]
+    return totales
+
+
+if __name__ == "__main__":
+    # python -m src.enlazador_activos "Autodesk AutoCAD 2024 - [Plano_P01.dwg]" [acad.exe]
+    # python -m src.enlazador_activos --historico
+    gestor_db.inicializar_base_de_datos()
+    inicio = time.perf_counter()
+    print(f"Índice: {ENLAZADOR_ACTIVOS.refrescar()} activos en {time.perf_counter() - inicio:.2f} s")
+    if "--historico" in sys.argv:
+        print(f"Enlazados: {enlazar_historico()}")
+    elif len(sys.argv) > 1:
+        print(enlazar_titulo(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None))
+    gestor_db.cerrar_conexiones()
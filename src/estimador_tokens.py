@@ -0,0 +1,243 @@
+# src/estimador_tokens.py
+# Cuántos tokens ocupa un texto para un modelo concreto, sin llamar al modelo.
+#
+#   texto --regex tipo BPE--> tokens aproximados --x factor del modelo--> tokens estimados
+#                                                        ^
+#   Ollama (prompt_eval_count de cada respuesta) --------+  calibración (media móvil)
+#
+# La aproximación imita a los tokenizadores de Llama/Mistral: una palabra corta es un token,
+# las largas se parten cada ~4 letras, cada dígito y cada signo son un token. El factor de
+# cada modelo corrige el resto (idioma, vocabulario) con lo que Ollama cuenta de verdad y se
+# guarda en RUTA_CALIBRACION para no empezar de cero en cada arranque.
+#
+# 'empaquetar_por_prioridad' usa la estimación para que el contexto del LLM quepa en un
+# presupuesto fijo de tokens (ver gestor_ollama.CacheContexto).
+
+import json
+import math
+import re
+import threading
+from collections import deque, namedtuple
+from functools import lru_cache
+from pathlib import Path
+
+RUTA_CALIBRACION = Path(__file__).parent.parent / "calibracion_tokens.json"
+
+LETRAS_POR_TOKEN = 4            # Una palabra de N letras ~ 1 + (N-1) // 4 tokens
+MAX_CARACTERES_CACHE = 4096     # Textos más largos se cuentan sin caché (la clave sería el texto entero)
+MIN_TOKENS_CALIBRAR = 64        # Prompts más cortos no calibran: la plantilla del modelo pesa demasiado
+RANGO_RAZON_VALIDA = (0.6, 2.5) # Razones reales/aproximados fuera de aquí se descartan
+# Ollama reaprovecha el prefijo común con los prompts anteriores del mismo modelo y entonces
+# prompt_eval_count solo cuenta lo nuevo. Con el contexto estable de CacheContexto eso es lo
+# normal, así que solo calibran los prompts sin apenas prefijo común con los últimos enviados.
+PROMPTS_RECORDADOS = 4          # Prompts anteriores por modelo (Ollama puede tener varias ranuras)
+CARACTERES_PREFIJO = 2048       # De cada uno basta el principio
+FRACCION_PREFIJO_TOLERADA = 0.05
+PESO_MUESTRA_MINIMO = 0.05      # Media móvil: las primeras muestras pesan 1/n, luego al menos esto
+GUARDAR_CADA = 20               # Muestras entre escrituras del archivo de calibración
+MARCA_RECORTE = "[...]"
+
+_PIEZAS = re.compile(r"[^\W\d_]+|\d|\n+|[ \t]{2,}|[^\w\s]|_")
+
+
+def _contar_piezas(texto):
+    tokens = 0
+    for pieza in _PIEZAS.findall(texto):
+        if pieza[0].isalpha():
+            tokens += 1 + (len(pieza) - 1) // LETRAS_POR_TOKEN
+        else:
+            tokens += 1 # Dígito, signo, salto(s) de línea o tira de espacios
+    return tokens
+
+@lru_cache(maxsize=1024)
+def _contar_cacheado(texto):
+    return _contar_piezas(texto)
+
+def contar_tokens_aproximados(texto):
+    """Tokens de 'texto' con la aproximación local (sin factor de modelo). Cacheado si es corto."""
+    if len(texto) > MAX_CARACTERES_CACHE:
+        return _contar_piezas(texto)
+    return _contar_cacheado(texto)
+
+def _largo_prefijo_comun(a, b):
+    """Caracteres iniciales que comparten 'a' y 'b' (búsqueda binaria: las comparaciones van en C)."""
+    bajo, alto = 0, min(len(a), len(b))
+    while bajo < alto:
+        medio = (bajo + alto + 1) // 2
+        if a[:medio] == b[:medio]:
+            bajo = medio
+        else:
+            alto = medio - 1
+    return bajo
+
+
+class EstimadorTokens:
+    """
+    Estimación de tokens por modelo: aproximación local x factor calibrado con Ollama.
+    Seguro entre hilos (lo usan a la vez el cliente de Ollama y quien monta los prompts).
+    """
+    def __init__(self, ruta=RUTA_CALIBRACION):
+        self.ruta = Path(ruta) if ruta else None
+        self._lock = threading.Lock()
+        self._calibracion = {}  # modelo -> {"factor": float, "muestras": int}
+        self._recientes = {}    # modelo -> deque con el principio de sus últimos prompts
+        self._sin_guardar = 0
+        self._cargar()
+
+    def _cargar(self):
+        if self.ruta is None or not self.ruta.exists():
+            return
+        try:
+            self._calibracion = json.loads(self.ruta.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            print(f"Calibración de tokens ilegible ({self.ruta}): {e}")
+
+    def guardar(self):
+        if self.ruta is None:
+            return
+        with self._lock:
+            datos = json.dumps(self._calibracion, indent=2, sort_keys=True)
+            self._sin_guardar = 0
+        try:
+            self.ruta.write_text(datos, encoding="utf-8")
+        except OSError as e:
+            print(f"No se pudo guardar la calibración de tokens: {e}")
+
+    def factor(self, modelo=None):
+        with self._lock:
+            return self._calibracion.get(modelo, {}).get("factor", 1.0)
+
+    def contar(self, texto, modelo=None):
+        """Tokens estimados de 'texto' para 'modelo' (None = sin calibrar)."""
+        if not texto:
+            return 0
+        return math.ceil(contar_tokens_aproximados(texto) * self.factor(modelo))
+
+    def _prefijo_reaprovechado(self, modelo, prompt):
+        """
+        Anota 'prompt' como enviado a 'modelo' y devuelve cuántos caracteres del principio
+        pudo reaprovechar Ollama de los anteriores (None si puede ser más de CARACTERES_PREFIJO).
+        """
+        principio = prompt[:CARACTERES_PREFIJO]
+        with self._lock:
+            recientes = self._recientes.setdefault(modelo, deque(maxlen=PROMPTS_RECORDADOS))
+            comun = max((_largo_prefijo_comun(principio, anterior) for anterior in recientes), default=0)
+            recientes.append(principio)
+        return None if comun == CARACTERES_PREFIJO else comun
+
+    def calibrar(self, modelo, prompt, tokens_reales):
+        """
+        Ajusta el factor de 'modelo' con lo que Ollama ha contado de verdad para 'prompt'
+        (prompt_eval_count). Solo valen las evaluaciones completas: si el prompt comparte un
+        prefijo apreciable con los anteriores del modelo, se descarta. Devuelve True si la
+        muestra se ha usado.
+        """
+        if not modelo or not prompt:
+            return False
+        comun = self._prefijo_reaprovechado(modelo, prompt)
+        if not tokens_reales:
+            return False
+        aproximados = contar_tokens_aproximados(prompt)
+        if aproximados < MIN_TOKENS_CALIBRAR:
+            return False
+        if comun is None or contar_tokens_aproximados(prompt[:comun]) > FRACCION_PREFIJO_TOLERADA * aproximados:
+            return False # Evaluación parcial: parte del prompt salió de la caché de Ollama
+        razon = tokens_reales / aproximados
+        if not RANGO_RAZON_VALIDA[0] <= razon <= RANGO_RAZON_VALIDA[1]:
+            return False
+        with self._lock:
+            datos = self._calibracion.setdefault(modelo, {"factor": 1.0, "muestras": 0})
+            datos["muestras"] += 1
+            peso = max(1 / datos["muestras"], PESO_MUESTRA_MINIMO)
+            datos["factor"] += peso * (razon - datos["factor"])
+            self._sin_guardar += 1
+            toca_guardar = datos["muestras"] == 1 or self._sin_guardar >= GUARDAR_CADA
+        if toca_guardar:
+            self.guardar()
+        return True
+
+    def calibracion(self):
+        with self._lock:
+            return {modelo: dict(datos) for modelo, datos in self._calibracion.items()}
+
+
+ESTIMADOR_TOKENS = EstimadorTokens()
+
+def estimar_tokens_texto(texto, modelo=None):
+    return ESTIMADOR_TOKENS.contar(texto, modelo)
+
+
+# --- RECORTE Y EMPAQUETADO ---
+
+def recortar_a_tokens(texto, max_tokens, modelo=None, desde="inicio", separador="\n", estimador=None):
+    """
+    Recorta 'texto' para que quepa en 'max_tokens', por unidades enteras ('separador':
+    líneas, fragmentos...). desde="inicio" conserva el principio; desde="final", el final
+    (ej. el historial, donde lo último es lo más reciente). Determinista: mismo texto y
+    mismo presupuesto -> mismo resultado (el prefijo del prompt se reaprovecha en Ollama).
+    """
+    estimador = estimador or ESTIMADOR_TOKENS
+    if max_tokens <= 0 or not texto:
+        return ""
+    if estimador.contar(texto, modelo) <= max_tokens:
+        return texto
+    factor = estimador.factor(modelo)
+    disponible = max_tokens / factor - _contar_piezas(MARCA_RECORTE) - 1
+    if disponible <= 0:
+        return "" # No cabe ni la marca de recorte
+    unidades = texto.split(separador)
+    if desde == "final":
+        unidades.reverse()
+    elegidas, usados = [], 0
+    for unidad in unidades:
+        coste = _contar_piezas(unidad) + _contar_piezas(separador)
+        if usados + coste > disponible:
+            if not elegidas:
+                # Ni la primera unidad cabe entera: se corta por caracteres (a la baja)
+                proporcion = disponible / max(coste, 1)
+                corte = int(len(unidad) * proporcion)
+                elegidas.append(unidad[:corte] if desde == "inicio" else unidad[len(unidad) - corte:])
+            break
+        elegidas.append(unidad)
+        usados += coste
+    if desde == "final":
+        elegidas.reverse()
+        return MARCA_RECORTE + separador + separador.join(elegidas)
+    return separador.join(elegidas) + separador + MARCA_RECORTE
+
+# Una parte del contexto. 'prioridad': menor = se sirve antes del presupuesto.
+# 'desde' y 'separador': cómo se recorta si no cabe entera (ver 'recortar_a_tokens').
+SeccionContexto = namedtuple("SeccionContexto", "titulo texto prioridad desde separador")
+
+def empaquetar_por_prioridad(secciones, presupuesto, modelo=None, estimador=None):
+    """
+    Llena un presupuesto fijo de tokens con 'secciones' (SeccionContexto) por orden de
+    prioridad: cada una recibe lo que dejan las anteriores y se recorta si no cabe.
+    Devuelve el texto con las secciones en el orden en que se pasaron (de lo más estático
+    a lo más volátil, para que el prefijo del prompt se repita entre consultas) y los
+    tokens estimados que ocupa.
+    """
+    estimador = estimador or ESTIMADOR_TOKENS
+    cabeceras = [f"{seccion.titulo}:\n" for seccion in secciones]
+    restante = presupuesto - sum(estimador.contar(cabecera, modelo) + 1 for cabecera in cabeceras)
+    textos = [""] * len(secciones)
+    orden = sorted(range(len(secciones)), key=lambda i: secciones[i].prioridad)
+    for i in orden:
+        seccion = secciones[i]
+        texto = recortar_a_tokens(
+            seccion.texto or "", restante, modelo, seccion.desde, seccion.separador, estimador
+        )
+        textos[i] = texto
+        restante -= estimador.contar(texto, modelo)
+    contexto = "\n\n".join(cabecera + texto for cabecera, texto in zip(cabeceras, textos))
+    return contexto, estimador.contar(contexto, modelo)
+
+
+if __name__ == "__main__":
+    # python -m src.estimador_tokens archivo.txt [modelo]
+    import sys
+    texto = Path(sys.argv[1]).read_text(encoding="utf-8", errors="replace")
+    modelo = sys.argv[2] if len(sys.argv) > 2 else None
+    print(f"{len(texto)} caracteres | bytes/4: {len(texto.encode('utf-8')) // 4} | "
+          f"aproximados: {contar_tokens_aproximados(texto)} | {modelo or 'sin modelo'}: "
+          f"{estimar_tokens_texto(texto, modelo)} (factor {ESTIMADOR_TOKENS.factor(modelo):.3f})")
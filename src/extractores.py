@@ -0,0 +1,524 @@
+# src/extractores.py
+# Extracción de texto de ofimática e intercambio CAD/BIM para el RAG y los resúmenes.
+#
+#   extensión -> extractor (registro EXTRACTORES)
+#   lote de activos --hash completo--> caché Textos_Extraidos (por contenido)
+#                                         | fallos de caché
+#                                         v
+#                            PoolExtraccion: N procesos, timeout por archivo
+#
+# Los extractores leen en streaming (openpyxl en modo read_only, iterparse sobre el XML
+# de los zips OOXML/ODF, líneas sueltas en CSV/DXF/IFC) y paran en MAX_CARACTERES_EXTRAIDOS:
+# la memoria no crece con el tamaño del archivo. Van en procesos aparte porque un archivo
+# corrupto puede colgar o tumbar la librería que lo lee; si se pasa de TIMEOUT_EXTRACCION,
+# su proceso se mata y se arranca otro. La caché va por hash de contenido: un archivo que
+# no cambia no se extrae dos veces, aunque se mueva o se copie.
+
+import atexit
+import csv
+import multiprocessing
+import os
+import queue
+import re
+import threading
+import zipfile
+import xml.etree.ElementTree as ET
+
+try:
+    from src import estimador_tokens
+    from src import gestor_db
+    from src import huellas
+except ImportError:
+    import estimador_tokens
+    import gestor_db
+    import huellas
+
+try:
+    import pypdf # Opcional (no está en requirements.txt): sin él los .pdf quedan 'Sin_Texto'
+except ImportError:
+    pypdf = None
+
+VERSION_EXTRACTORES = 1          # Subirla invalida la caché (cuando un extractor mejora)
+MAX_CARACTERES_EXTRAIDOS = 1_000_000 # Por archivo: más no cabe en ningún contexto ni resumen
+TIMEOUT_EXTRACCION = 60          # Segundos por archivo antes de matar su proceso
+# Timeouts, procesos caídos y archivos bloqueados (OSError) pueden ser pasajeros: no se cachean
+# como definitivos, se reintentan pasado un rato hasta MAX_INTENTOS_EXTRACCION veces.
+MAX_INTENTOS_EXTRACCION = 3
+ESPERA_REINTENTO_EXTRACCION = 3600
+PROCESOS_EXTRACCION = max(1, min(4, (os.cpu_count() or 2) - 1))
+
+# Se leen tal cual (sin proceso aparte ni caché: leerlos cuesta lo mismo que la caché)
+EXTENSIONES_TEXTO = {
+    ".md", ".txt", ".rst", ".adoc", ".text",
+    ".py", ".json", ".toml", ".css", ".html", ".js", ".ts", ".sql", ".xml", ".yaml", ".yml",
+    ".c", ".cpp", ".cs", ".java", ".config", ".lsp", ".eml",
+}
+
+EXTRACTORES = {}  # extensión -> función(ruta, max_caracteres) -> texto
+
+
+class ErrorExtraccion(Exception):
+    """El formato tiene extractor pero este archivo no se ha podido leer (corrupto, timeout...)."""
+
+
+def registrar(*extensiones):
+    """Decorador: registra la función como extractor de esas extensiones."""
+    def decorador(funcion):
+        for extension in extensiones:
+            EXTRACTORES[extension] = funcion
+        return funcion
+    return decorador
+
+def tiene_extractor(extension):
+    return (extension or "").lower() in EXTRACTORES
+
+
+class _Texto:
+    """Acumula líneas hasta 'max_caracteres'. 'anadir' devuelve False cuando ya está lleno."""
+    def __init__(self, max_caracteres):
+        self.partes = []
+        self.restante = max_caracteres
+
+    def anadir(self, linea):
+        if self.restante <= 0:
+            return False
+        linea = linea.strip()
+        if linea:
+            linea = linea[:self.restante]
+            self.partes.append(linea)
+            self.restante -= len(linea) + 1
+        return self.restante > 0
+
+    def texto(self):
+        return "\n".join(self.partes)
+
+
+# --- EXTRACTORES ---
+
+@registrar(*EXTENSIONES_TEXTO)
+def extraer_texto_plano(ruta, max_caracteres=MAX_CARACTERES_EXTRAIDOS):
+    with open(ruta, encoding="utf-8", errors="replace") as f:
+        return f.read(max_caracteres)
+
+@registrar(".csv")
+def extraer_csv(ruta, max_caracteres=MAX_CARACTERES_EXTRAIDOS):
+    with open(ruta, "rb") as f:
+        muestra = f.read(65536)
+    try:
+        muestra.decode("utf-8")
+        codificacion = "utf-8-sig"
+    except UnicodeDecodeError as e:
+        # Un corte a mitad de carácter al final de la muestra no cuenta
+        codificacion = "utf-8-sig" if e.start >= len(muestra) - 3 else "cp1252" # Excel en Windows
+    try:
+        dialecto = csv.Sniffer().sniff(muestra[:8192].decode(codificacion, errors="replace"), ";,\t|")
+    except csv.Error:
+        dialecto = csv.excel
+    salida = _Texto(max_caracteres)
+    with open(ruta, encoding=codificacion, errors="replace", newline="") as f:
+        for fila in csv.reader(f, dialecto):
+            if not salida.anadir(" | ".join(celda.strip() for celda in fila if celda.strip())):
+                break
+    return salida.texto()
+
+@registrar(".xlsx", ".xlsm", ".xltx", ".xltm")
+def extraer_xlsx(ruta, max_caracteres=MAX_CARACTERES_EXTRAIDOS):
+    import openpyxl # Import tardío: solo lo cargan los procesos de extracción
+    libro = openpyxl.load_workbook(ruta, read_only=True, data_only=True)
+    salida = _Texto(max_caracteres)
+    try:
+        for hoja in libro.worksheets:
+            if not salida.anadir(f"## Hoja: {hoja.title}"):
+                break
+            for fila in hoja.iter_rows(values_only=True):
+                celdas = [str(valor).strip() for valor in fila if valor is not None and str(valor).strip()]
+                if celdas and not salida.anadir(" | ".join(celdas)):
+                    return salida.texto()
+    finally:
+        libro.close()
+    return salida.texto()
+
+def _parrafos_xml(archivo, etiquetas_parrafo, texto_de):
+    """
+    Recorre un XML grande con iterparse y devuelve el texto de cada párrafo
+    (elementos con etiqueta en 'etiquetas_parrafo') según termina. Cada párrafo ya
+    leído se suelta del árbol: la memoria no crece con el documento.
+    """
+    pila = []
+    for evento, elemento in ET.iterparse(archivo, events=("start", "end")):
+        if evento == "start":
+            pila.append(elemento)
+            continue
+        pila.pop()
+        if elemento.tag in etiquetas_parrafo:
+            yield texto_de(elemento)
+            if pila:
+                pila[-1].remove(elemento)
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_A = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+_ODF_TEXTO = "{urn:oasis:names:tc:opendocument:xmlns:text:1.0}"
+
+def _texto_ooxml(etiqueta_texto):
+    # Solo los nodos de texto visibles (no códigos de campo ni texto borrado con control de cambios)
+    return lambda parrafo: "".join(t.text or "" for t in parrafo.iter(etiqueta_texto))
+
+@registrar(".docx", ".docm", ".dotx", ".dotm")
+def extraer_docx(ruta, max_caracteres=MAX_CARACTERES_EXTRAIDOS):
+    salida = _Texto(max_caracteres)
+    with zipfile.ZipFile(ruta) as zip_archivo:
+        with zip_archivo.open("word/document.xml") as xml:
+            for parrafo in _parrafos_xml(xml, {_W + "p"}, _texto_ooxml(_W + "t")):
+                if not salida.anadir(parrafo):
+                    break
+    return salida.texto()
+
+@registrar(".pptx", ".pptm", ".potx", ".potm", ".ppsx", ".ppsm")
+def extraer_pptx(ruta, max_caracteres=MAX_CARACTERES_EXTRAIDOS):
+    salida = _Texto(max_caracteres)
+    with zipfile.ZipFile(ruta) as zip_archivo:
+        diapositivas = sorted(
+            (int(m.group(1)), nombre) for nombre in zip_archivo.namelist()
+            if (m := re.fullmatch(r"ppt/slides/slide(\d+)\.xml", nombre))
+        )
+        for numero, nombre in diapositivas:
+            if not salida.anadir(f"## Diapositiva {numero}"):
+                break
+            with zip_archivo.open(nombre) as xml:
+                for parrafo in _parrafos_xml(xml, {_A + "p"}, _texto_ooxml(_A + "t")):
+                    if not salida.anadir(parrafo):
+                        return salida.texto()
+    return salida.texto()
+
+@registrar(".odt", ".ods", ".odp")
+def extraer_odf(ruta, max_caracteres=MAX_CARACTERES_EXTRAIDOS):
+    salida = _Texto(max_caracteres)
+    with zipfile.ZipFile(ruta) as zip_archivo:
+        with zip_archivo.open("content.xml") as xml:
+            # Títulos (text:h) y párrafos (text:p); en hojas de cálculo cada celda es un text:p
+            etiquetas = {_ODF_TEXTO + "p", _ODF_TEXTO + "h"}
+            for parrafo in _parrafos_xml(xml, etiquetas, lambda elemento: "".join(elemento.itertext())):
+                if not salida.anadir(parrafo):
+                    break
+    return salida.texto()
+
+_FORMATO_MTEXT = re.compile(r"\\[ACcFfHhLlOoQTtWw][^;\\{}]*;?|[{}]")
+
+@registrar(".dxf")
+def extraer_dxf(ruta, max_caracteres=MAX_CARACTERES_EXTRAIDOS):
+    """
+    DXF en ASCII: pares (código de grupo, valor). Se quedan los textos de TEXT/MTEXT/atributos/cotas
+    (códigos 1 y 3) y los nombres de capa. Los DXF binarios no llevan texto legible así: quedan vacíos.
+    """
+    with open(ruta, "rb") as f:
+        if f.read(22).startswith(b"AutoCAD Binary DXF"):
+            return ""
+    salida = _Texto(max_caracteres)
+    capas = []
+    entidad = None
+    textos_entidad = ("TEXT", "MTEXT", "ATTRIB", "ATTDEF", "DIMENSION", "MULTILEADER", "MLEADER")
+    with open(ruta, encoding="utf-8", errors="replace") as f:
+        while True:
+            codigo = f.readline()
+            valor = f.readline()
+            if not valor:
+                break
+            codigo, valor = codigo.strip(), valor.rstrip("\r\n")
+            if codigo == "0":
+                entidad = valor.strip()
+                if entidad == "EOF":
+                    break
+            elif entidad == "LAYER" and codigo == "2":
+                capas.append(valor.strip())
+            elif entidad in textos_entidad and codigo in ("1", "3"):
+                # Formato de MTEXT: \P = salto de párrafo; el resto (fuente, color, altura...) fuera
+                texto = _FORMATO_MTEXT.sub("", valor.replace("\\P", "\n"))
+                if not salida.anadir(texto):
+                    break
+    if capas:
+        return f"Capas: {', '.join(capas)}\n{salida.texto()}"
+    return salida.texto()
+
+_CADENA_STEP = re.compile(r"'((?:[^']|'')*)'")
+_ENTIDAD_STEP = re.compile(r"#\d+\s*=\s*(\w+)\s*\(")
+_GUID_IFC = re.compile(r"[0-9A-Za-z_$]{22}")
+
+def _decodificar_step(texto):
+    """Escapes de cadenas STEP (ISO 10303-21): \\X2\\HHHH\\X0\\ (UTF-16), \\X\\HH (latin-1), ''."""
+    texto = re.sub(
+        r"\\X2\\((?:[0-9A-Fa-f]{4})+)\\X0\\",
+        lambda m: bytes.fromhex(m.group(1)).decode("utf-16-be", errors="replace"), texto
+    )
+    texto = re.sub(r"\\X\\([0-9A-Fa-f]{2})", lambda m: bytes.fromhex(m.group(1)).decode("latin-1"), texto)
+    return texto.replace("''", "'")
+
+@registrar(".ifc")
+def extraer_ifc(ruta, max_caracteres=MAX_CARACTERES_EXTRAIDOS):
+    """
+    IFC (STEP en texto): por cada entidad con cadenas, "TIPO: nombre | descripción | ...".
+    Sin GUIDs y sin repetir líneas (los modelos repiten mucho los mismos tipos y propiedades).
+    """
+    salida = _Texto(max_caracteres)
+    vistas = set()
+    sentencia = []
+    with open(ruta, encoding="utf-8", errors="replace") as f:
+        for linea in f:
+            sentencia.append(linea.strip())
+            if not linea.rstrip().endswith(";"):
+                continue
+            texto = "".join(sentencia)
+            sentencia = []
+            entidad = _ENTIDAD_STEP.match(texto)
+            if not entidad:
+                continue
+            cadenas = [
+                _decodificar_step(c) for c in _CADENA_STEP.findall(texto)
+                if c.strip() and not _GUID_IFC.fullmatch(c)
+            ]
+            if not cadenas:
+                continue
+            linea_salida = f"{entidad.group(1)}: {' | '.join(cadenas)}"
+            if linea_salida in vistas:
+                continue
+            if len(vistas) < 100_000:
+                vistas.add(linea_salida)
+            if not salida.anadir(linea_salida):
+                break
+    return salida.texto()
+
+if pypdf is not None:
+    @registrar(".pdf")
+    def extraer_pdf(ruta, max_caracteres=MAX_CARACTERES_EXTRAIDOS):
+        salida = _Texto(max_caracteres)
+        for pagina in pypdf.PdfReader(ruta).pages:
+            if not salida.anadir(pagina.extract_text() or ""):
+                break
+        return salida.texto()
+
+def extraer_texto(ruta, extension=None, max_caracteres=MAX_CARACTERES_EXTRAIDOS):
+    """Texto de un archivo en ESTE proceso (sin timeout ni caché). None si el formato no tiene extractor."""
+    extension = (extension or os.path.splitext(str(ruta))[1]).lower()
+    extractor = EXTRACTORES.get(extension)
+    if extractor is None:
+        return None
+    return extractor(str(ruta), max_caracteres)
+
+
+# --- POOL DE PROCESOS ---
+
+def _bucle_proceso_extraccion(conexion):
+    """
+    Cuerpo de cada proceso de extracción: recibe (ruta, extensión, máx.) y devuelve
+    (texto, error, pasajero). 'pasajero': el fallo es de E/S (archivo bloqueado, borrado...),
+    no del contenido.
+    """
+    while True:
+        try:
+            tarea = conexion.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if tarea is None:
+            return
+        try:
+            resultado = (extraer_texto(*tarea), None, False)
+        except OSError as e:
+            resultado = (None, f"{type(e).__name__}: {e}", True)
+        except Exception as e:
+            resultado = (None, f"{type(e).__name__}: {e}", False)
+        try:
+            conexion.send(resultado)
+        except (OSError, ValueError):
+            return
+
+
+class _ProcesoExtraccion:
+    """Un proceso de extracción con su tubería. Se arranca al usarlo y se reinicia si se cuelga o cae."""
+    def __init__(self, contexto):
+        self.contexto = contexto
+        self.proceso = None
+        self.conexion = None
+
+    def _arrancar(self):
+        self.conexion, extremo_hijo = self.contexto.Pipe()
+        self.proceso = self.contexto.Process(
+            target=_bucle_proceso_extraccion, args=(extremo_hijo,), name="Extractor", daemon=True
+        )
+        self.proceso.start()
+        extremo_hijo.close()
+
+    def matar(self):
+        if self.proceso is not None:
+            self.proceso.kill()
+            self.proceso.join(5)
+            self.conexion.close()
+        self.proceso = self.conexion = None
+
+    def ejecutar(self, ruta, extension, max_caracteres, timeout):
+        if self.proceso is None or not self.proceso.is_alive():
+            self.matar()
+            self._arrancar()
+        try:
+            self.conexion.send((ruta, extension, max_caracteres))
+            if self.conexion.poll(timeout):
+                return self.conexion.recv()
+        except (EOFError, OSError):
+            self.matar()
+            return None, "el proceso de extracción se ha caído", True
+        self.matar()
+        return None, f"más de {timeout} s extrayendo", True
+
+    def cerrar(self):
+        if self.proceso is None:
+            return
+        try:
+            self.conexion.send(None)
+            self.proceso.join(2)
+        except (OSError, ValueError):
+            pass
+        self.matar()
+
+
+class PoolExtraccion:
+    """
+    N procesos de extracción reutilizables (método 'spawn': igual en Windows y Linux, y sin
+    heredar los hilos ni las conexiones SQLite del proceso principal). Un hilo por proceso
+    reparte las tareas; el timeout es por archivo.
+    """
+    def __init__(self, procesos=PROCESOS_EXTRACCION, timeout=TIMEOUT_EXTRACCION,
+                 max_caracteres=MAX_CARACTERES_EXTRAIDOS):
+        contexto = multiprocessing.get_context("spawn")
+        self.procesos = [_ProcesoExtraccion(contexto) for _ in range(max(1, procesos))]
+        self.timeout = timeout
+        self.max_caracteres = max_caracteres
+        self._lock = threading.Lock() # Un lote cada vez
+
+    def extraer(self, tareas):
+        """
+        'tareas' = [(clave, ruta, extensión)]. Generador de (clave, texto, error, pasajero)
+        según van terminando (no en orden). texto es None si hubo error; 'pasajero' indica
+        un fallo que puede no repetirse (timeout, proceso caído, E/S).
+        """
+        tareas = list(tareas)
+        if not tareas:
+            return
+        with self._lock:
+            pendientes = queue.Queue()
+            for tarea in tareas:
+                pendientes.put(tarea)
+            resultados = queue.Queue()
+
+            def repartir(proceso):
+                while True:
+                    try:
+                        clave, ruta, extension = pendientes.get_nowait()
+                    except queue.Empty:
+                        return
+                    resultados.put((clave, *proceso.ejecutar(ruta, extension, self.max_caracteres, self.timeout)))
+
+            hilos = [
+                threading.Thread(target=repartir, args=(proceso,), name="Extraccion", daemon=True)
+                for proceso in self.procesos[:len(tareas)]
+            ]
+            for hilo in hilos:
+                hilo.start()
+            for _ in range(len(tareas)):
+                yield resultados.get()
+            for hilo in hilos:
+                hilo.join()
+
+    def cerrar(self):
+        with self._lock:
+            for proceso in self.procesos:
+                proceso.cerrar()
+
+
+_pool = None
+_lock_pool = threading.Lock()
+
+def obtener_pool():
+    global _pool
+    with _lock_pool:
+        if _pool is None:
+            _pool = PoolExtraccion()
+            atexit.register(_pool.cerrar)
+        return _pool
+
+
+# --- TEXTO DE ACTIVOS (con caché por contenido) ---
+
+def extraer_lote(activos, pool=None):
+    """
+    Texto de varios activos (dicts de Activos) a la vez. Devuelve {ID_Activo: (texto, error)}:
+    (None, None) si el formato no tiene extractor o el archivo ya no es el que se escaneó.
+    Los que faltan en la caché se extraen en paralelo (una vez por contenido) y se guardan;
+    los fallos pasajeros, con fecha de reintento (ver MAX_INTENTOS_EXTRACCION).
+    """
+    resultado = {}
+    tokens = []    # (tokens del texto real, ID_Activo)
+    por_hash = {}  # hash -> [activos con ese contenido]
+    for activo in activos:
+        extension = (activo.get("Extension") or "").lower()
+        if extension not in EXTRACTORES:
+            resultado[activo["ID_Activo"]] = (None, None)
+        elif extension in EXTENSIONES_TEXTO:
+            try:
+                texto = extraer_texto_plano(activo["Ruta_Absoluta"])
+            except OSError as e:
+                resultado[activo["ID_Activo"]] = (None, str(e))
+                continue
+            resultado[activo["ID_Activo"]] = (texto, None)
+            tokens.append((estimador_tokens.estimar_tokens_texto(texto), activo["ID_Activo"]))
+        else:
+            hash_val = huellas.asegurar_hash_completo(activo)
+            if hash_val is None:
+                resultado[activo["ID_Activo"]] = (None, None) # Cambiado o ilegible: lo recogerá el próximo escaneo
+                continue
+            activo["Hash_Contenido"], activo["Nivel_Hash"] = hash_val, "Completo"
+            por_hash.setdefault(hash_val, []).append(activo)
+
+    en_cache = gestor_db.leer_textos_extraidos(por_hash, VERSION_EXTRACTORES)
+    nuevos, pasajeros = [], []
+    tareas = [
+        (hash_val, grupo[0]["Ruta_Absoluta"], grupo[0]["Extension"].lower())
+        for hash_val, grupo in por_hash.items() if hash_val not in en_cache
+    ]
+    for hash_val, texto, error, pasajero in (pool or obtener_pool()).extraer(tareas):
+        en_cache[hash_val] = (texto, error)
+        if pasajero:
+            pasajeros.append((hash_val, error))
+        else:
+            nuevos.append((hash_val, texto, error))
+    if nuevos:
+        gestor_db.guardar_textos_extraidos(nuevos, VERSION_EXTRACTORES)
+    if pasajeros:
+        gestor_db.guardar_fallos_extraccion(
+            pasajeros, VERSION_EXTRACTORES, ESPERA_REINTENTO_EXTRACCION, MAX_INTENTOS_EXTRACCION
+        )
+
+    for hash_val, grupo in por_hash.items():
+        texto, error = en_cache[hash_val]
+        for activo in grupo:
+            resultado[activo["ID_Activo"]] = (texto, error)
+            if texto is not None:
+                tokens.append((estimador_tokens.estimar_tokens_texto(texto), activo["ID_Activo"]))
+    gestor_db.actualizar_tokens_activos(tokens)
+    return resultado
+
+def extraer_texto_activo(activo, pool=None):
+    """
+    Texto de un activo, o None si su formato no tiene extractor.
+    Lanza ErrorExtraccion si el formato se soporta pero este archivo no se pudo leer.
+    """
+    texto, error = extraer_lote([activo], pool)[activo["ID_Activo"]]
+    if error:
+        raise ErrorExtraccion(error)
+    return texto
+
+
+if __name__ == "__main__":
+    # python -m src.extractores archivo.xlsx [más archivos...] -> texto extraído (sin caché)
+    import sys
+    for ruta in sys.argv[1:]:
+        print(f"===== {ruta}")
+        texto = extraer_texto(ruta)
+        print("(formato sin extractor)" if texto is None else texto[:3000])
@@ -0,0 +1,175 @@
+# src/filtro_rutas.py
+# Motor de filtrado de rutas: compila UNA vez las reglas de config_scanner.py
+# y responde sin crear objetos Path por cada archivo o carpeta.
+# Lo comparten el mapeador (os.walk) y el vigilante en tiempo real (watchdog).
+#
+# Tipos de regla en EXTENSIONES_IGNORADAS (se deducen de cómo está escrita):
+#   ".log", ".sv$", ".tar.gz"  -> SUFIJO (también multi-punto, y el nombre exacto ".env", ".netrc")
+#   "~$"                       -> PREFIJO (empieza por "~")
+#   "thumbs.db", "id_rsa"      -> NOMBRE EXACTO
+# Todo se compara en minúsculas.
+
+import os
+import time
+from pathlib import Path
+
+try:
+    from src.config_scanner import CARPETAS_IGNORADAS, EXTENSIONES_IGNORADAS, EXTENSIONES_PERMITIDAS
+except ImportError:
+    from config_scanner import CARPETAS_IGNORADAS, EXTENSIONES_IGNORADAS, EXTENSIONES_PERMITIDAS
+
+# Resultados de 'clasificar_archivo'
+IGNORADO = "ignorado"
+SIN_EXTENSION = "sin_extension"
+PERMITIDO = "permitido"
+DESCONOCIDO = "desconocido"
+
+
+def extension_de(nombre):
+    """
+    Extensión en minúsculas, igual que Path(nombre).suffix.lower() pero sin crear el Path.
+    Los archivos ocultos sin más puntos ('.env') y los acabados en punto no tienen extensión.
+    """
+    i = nombre.rfind(".")
+    if i <= 0 or i == len(nombre) - 1:
+        return ""
+    return nombre[i:].lower()
+
+
+class FiltroRutas:
+    """
+    Reglas de config_scanner compiladas en sets/tuplas para consultas O(1) por archivo.
+    'prefijos_extra' añade prefijos de nombre a ignorar (ej. "~" y "." en el vigilante).
+    """
+    def __init__(self, carpetas_ignoradas, extensiones_ignoradas, extensiones_permitidas, prefijos_extra=()):
+        self.carpetas_ignoradas = frozenset(carpetas_ignoradas)
+        self.extensiones_permitidas = frozenset(ext.lower() for ext in extensiones_permitidas)
+
+        sufijos, prefijos, nombres = set(), set(prefijos_extra), set()
+        for regla in (r.lower() for r in extensiones_ignoradas):
+            if regla.startswith("."):
+                sufijos.add(regla)
+            elif regla.startswith("~"):
+                prefijos.add(regla)
+            else:
+                nombres.add(regla)
+        self.sufijos_ignorados = frozenset(sufijos)
+        self.prefijos_ignorados = tuple(sorted(prefijos))  # str.startswith acepta una tupla
+        self.nombres_ignorados = frozenset(nombres)
+
+    # --- ARCHIVOS ---
+
+    def archivo_ignorado(self, nombre):
+        """True si el nombre de archivo cae en la blacklist (sufijo, prefijo o nombre exacto)."""
+        nombre = nombre.lower()
+        if nombre in self.nombres_ignorados or nombre.startswith(self.prefijos_ignorados):
+            return True
+        # Todos los sufijos desde cada punto: "a.tar.gz" -> ".tar.gz", ".gz"
+        i = nombre.find(".")
+        while i != -1:
+            if nombre[i:] in self.sufijos_ignorados:
+                return True
+            i = nombre.find(".", i + 1)
+        return False
+
+    def clasificar_archivo(self, nombre):
+        """
+        Devuelve (estado, extension) con estado IGNORADO, SIN_EXTENSION, PERMITIDO o DESCONOCIDO.
+        """
+        if self.archivo_ignorado(nombre):
+            return IGNORADO, ""
+        extension = extension_de(nombre)
+        if not extension:
+            return SIN_EXTENSION, ""
+        if extension in self.extensiones_permitidas:
+            return PERMITIDO, extension
+        return DESCONOCIDO, extension
+
+    # --- CARPETAS ---
+
+    def carpeta_ignorada(self, nombre):
+        """True si la carpeta está en la blacklist (para utils.recorrer_directorio)."""
+        return nombre in self.carpetas_ignoradas
+
+    def podar_carpetas(self, dirnames):
+        """
+        Quita de 'dirnames' (lista de os.walk con topdown=True) las carpetas de la blacklist,
+        para que el recorrido ni siquiera entre en ellas.
+        """
+        dirnames[:] = [d for d in dirnames if d not in self.carpetas_ignoradas]
+
+    def ruta_ignorada(self, ruta, raices=()):
+        """
+        Para rutas sueltas (eventos de watchdog): True si el archivo está en la blacklist
+        o cuelga de alguna carpeta ignorada. Solo se miran las carpetas POR DEBAJO de la
+        raíz vigilada (la propia raíz ya la eligió el usuario).
+        """
+        ruta = str(ruta)
+        for raiz in raices:
+            if ruta.startswith(raiz):
+                ruta = ruta[len(raiz):]
+                break
+        partes = ruta.replace("\\", "/").split("/")
+        if self.archivo_ignorado(partes[-1]):
+            return True
+        return not self.carpetas_ignoradas.isdisjoint(partes[:-1])
+
+
+# Filtros compilados al importar
+FILTRO_ESCANEO = FiltroRutas(CARPETAS_IGNORADAS, EXTENSIONES_IGNORADAS, EXTENSIONES_PERMITIDAS)
+# El vigilante además ignora bloqueos de Windows ("~...") y ocultos/temporales de Linux/macOS (".")
+FILTRO_MONITOR = FiltroRutas(
+    CARPETAS_IGNORADAS, EXTENSIONES_IGNORADAS, EXTENSIONES_PERMITIDAS, prefijos_extra=("~", ".")
+)
+
+
+# --- MICRO-BENCHMARK ---
+
+def _recorrido_antiguo(carpetas):
+    """Réplica del filtro anterior (set de partes por carpeta + Path por archivo)."""
+    for dirpath, dirnames, filenames in carpetas:
+        if not CARPETAS_IGNORADAS.isdisjoint(set(Path(dirpath).parts)):
+            continue
+        for filename in filenames:
+            ruta_path = Path(dirpath) / filename
+            extension = ruta_path.suffix.lower()
+            if not extension or extension in EXTENSIONES_IGNORADAS or filename.startswith("~$"):
+                continue
+            str(ruta_path), extension in EXTENSIONES_PERMITIDAS
+
+def _recorrido_compilado(carpetas):
+    for dirpath, dirnames, filenames in carpetas:
+        FILTRO_ESCANEO.podar_carpetas(dirnames)
+        for filename in filenames:
+            estado, extension = FILTRO_ESCANEO.clasificar_archivo(filename)
+            if estado == IGNORADO or estado == SIN_EXTENSION:
+                continue
+            os.path.join(dirpath, filename), estado == PERMITIDO
+
+def benchmark(num_carpetas=10_000, archivos_por_carpeta=20):
+    """Compara el filtro anterior con el compilado sobre un árbol sintético (sin tocar disco)."""
+    nombres = ["Plano_Planta_Baja.dwg", "Informe final.v2.docx", "~$Presupuesto.xlsx",
+               "thumbs.db", "render.blend", "notas.md", "salida.log", "LEEME", "foto.JPG", "x.tar.gz"]
+    base = os.path.join("C:" + os.sep, "Users", "santi", "Desktop", "PROYECTOS", "2022_AMARE")
+    carpetas = [
+        (os.path.join(base, f"OBRA_{i // 100}", f"PLANOS_{i}"), ["REV", "node_modules"],
+         [nombres[j % len(nombres)] for j in range(archivos_por_carpeta)])
+        for i in range(num_carpetas)
+    ]
+    num_archivos = num_carpetas * archivos_por_carpeta
+
+    tiempos = {}
+    for etiqueta, funcion in (("antiguo (Path)", _recorrido_antiguo), ("compilado", _recorrido_compilado)):
+        inicio = time.perf_counter()
+        funcion(carpetas)
+        tiempos[etiqueta] = time.perf_counter() - inicio
+
+    for etiqueta, segundos in tiempos.items():
+        print(f"{etiqueta:>15}: {segundos:.3f} s ({num_archivos / segundos:,.0f} archivos/s)")
+    print(f"Aceleración: x{tiempos['antiguo (Path)'] / tiempos['compilado']:.1f}")
+    return tiempos
+
+
+if __name__ == "__main__":
+    # python -m src.filtro_rutas
+    benchmark()
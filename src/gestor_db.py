@@ -1,7 +1,15 @@
 # gestor_db.py
 # Este script contiene todas las funciones para interactuar con la DB SQLite.
 
+import atexit
+import os
+import queue
+import re
 import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import Future
 from pathlib import Path
 
 # Path(__file__).parent apunta a 'src/'. .parent otra vez apunta a la raíz del proyecto.
@@ -9,12 +17,205 @@ from pathlib import Path
 
 DB_PATH = Path(__file__).parent.parent / "memoria.db" 
 
+# --- 0. GESTOR DE CONEXIONES (LECTURAS POR HILO + ESCRITOR ÚNICO) ---
+# Los monitores (archivos, contexto, recursos) corren a la vez. En vez de abrir y
+# cerrar una conexión por sentencia (y pelearse por el lock del fichero), cada hilo
+# reutiliza su propia conexión de LECTURA y TODAS las escrituras pasan por un único
+# hilo escritor que agrupa lo que haya en cola en una sola transacción.
+
+PRAGMAS_CONEXION = (
+    "PRAGMA journal_mode=WAL",      # Lectores y escritor no se bloquean entre sí
+    "PRAGMA synchronous=NORMAL",    # En WAL es seguro; solo hace fsync en los checkpoints
+    "PRAGMA cache_size=-65536",     # 64 MB de caché de páginas (valor negativo = KiB)
+    "PRAGMA mmap_size=268435456",   # 256 MB mapeados en memoria para lecturas
+    "PRAGMA temp_store=MEMORY",
+)
+TIMEOUT_CONEXION = 30  # Segundos que espera SQLite si otro proceso tiene el lock
+MAX_TAREAS_POR_TRANSACCION = 1000
+
+_local = threading.local()
+_generacion = 0  # Sube al cerrar las conexiones: invalida las de lectura de todos los hilos
+_conexiones_lectura = []
+_lock_conexiones = threading.Lock()
+_escritor = None
+_lock_escritor = threading.Lock()
+_diario = None  # DiarioRegistros (ver sección 3)
+_lock_diario = threading.Lock()
+
+
+def _abrir_conexion():
+    """
+    Abre una conexión ya configurada con los PRAGMAS de rendimiento.
+    isolation_level=None: las transacciones se controlan a mano (BEGIN/COMMIT).
+    """
+    conn = sqlite3.connect(
+        DB_PATH, timeout=TIMEOUT_CONEXION,
+        check_same_thread=False, isolation_level=None
+    )
+    for pragma in PRAGMAS_CONEXION:
+        conn.execute(pragma)
+    return conn
+
+def obtener_conexion_lectura():
+    """
+    Devuelve la conexión de lectura del hilo actual (se crea la primera vez).
+    No usar para escribir: las escrituras van por 'ejecutar_escritura'.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "clave", None) != (DB_PATH, _generacion):
+        conn = _abrir_conexion()
+        _local.conn = conn
+        _local.clave = (DB_PATH, _generacion)
+        with _lock_conexiones:
+            _conexiones_lectura.append(conn)
+    return conn
+
+
+_FIN = object()  # Señal de parada para el hilo escritor
+
+class EscritorDB:
+    """
+    Hilo único que serializa todas las escrituras de la aplicación.
+    Cada tarea es una función 'funcion(conn, *args)' que NO hace commit: el escritor
+    vacía la cola y ejecuta todas las tareas pendientes dentro de UNA transacción
+    (cada una en su SAVEPOINT, para que un error no tumbe a las demás).
+    """
+    def __init__(self, max_tareas=MAX_TAREAS_POR_TRANSACCION):
+        self.cola = queue.Queue()
+        self.max_tareas = max_tareas
+        self.hilo = None
+        self.tareas_ejecutadas = 0
+        self.transacciones = 0
+
+    def iniciar(self):
+        self.hilo = threading.Thread(target=self._bucle, name="EscritorDB", daemon=True)
+        self.hilo.start()
+
+    def enviar(self, funcion, *args, **kwargs):
+        """Encola una tarea de escritura. Devuelve un Future con su resultado."""
+        futuro = Future()
+        self.cola.put((futuro, funcion, args, kwargs))
+        return futuro
+
+    def detener(self, timeout=None):
+        """Procesa lo que quede en cola y para el hilo."""
+        if self.hilo and self.hilo.is_alive():
+            self.cola.put(_FIN)
+            self.hilo.join(timeout)
+
+    def _bucle(self):
+        conn = _abrir_conexion()
+        try:
+            terminar = False
+            while not terminar:
+                tarea = self.cola.get()
+                if tarea is _FIN:
+                    break
+                lote = [tarea]
+                # Group commit: todo lo que ya esté esperando entra en la misma transacción
+                while len(lote) < self.max_tareas:
+                    try:
+                        tarea = self.cola.get_nowait()
+                    except queue.Empty:
+                        break
+                    if tarea is _FIN:
+                        terminar = True
+                        break
+                    lote.append(tarea)
+                self._ejecutar_lote(conn, lote)
+        finally:
+            conn.close()
+
+    def _ejecutar_lote(self, conn, lote):
+        resultados = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for futuro, funcion, args, kwargs in lote:
+                if not futuro.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT tarea")
+                try:
+                    resultado = funcion(conn, *args, **kwargs)
+                    conn.execute("RELEASE tarea")
+                    resultados.append((futuro, resultado, None))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO tarea")
+                    conn.execute("RELEASE tarea")
+                    resultados.append((futuro, None, e))
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            # Falló la transacción entera (disco lleno, DB corrupta...)
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            print(f"Error crítico en el escritor de la DB: {e}")
+            resultados = [(futuro, None, e) for futuro, _, _, _ in lote if futuro.running()]
+
+        # Se resuelven DESPUÉS del commit: quien espera el Future ya puede leer lo escrito.
+        for futuro, resultado, error in resultados:
+            if error is None:
+                futuro.set_result(resultado)
+            else:
+                futuro.set_exception(error)
+        self.tareas_ejecutadas += len(resultados)
+        self.transacciones += 1
+
+
+def obtener_escritor():
+    """Devuelve el escritor global, arrancándolo la primera vez."""
+    global _escritor
+    with _lock_escritor:
+        if _escritor is None or not _escritor.hilo.is_alive():
+            _escritor = EscritorDB()
+            _escritor.iniciar()
+        return _escritor
+
+def ejecutar_escritura(funcion, *args, esperar=True, **kwargs):
+    """
+    Envía 'funcion(conn, *args, **kwargs)' al hilo escritor.
+    Con esperar=True bloquea hasta el commit y devuelve el resultado (o lanza el error);
+    con esperar=False devuelve el Future inmediatamente.
+    """
+    futuro = obtener_escritor().enviar(funcion, *args, **kwargs)
+    if esperar:
+        return futuro.result()
+    return futuro
+
+def _avisar_error_escritura(etiqueta):
+    """Callback para escrituras 'fire and forget': imprime el error si lo hubo."""
+    def _callback(futuro):
+        error = futuro.exception()
+        if error:
+            print(f"Error DB ({etiqueta}): {error}")
+    return _callback
+
+def cerrar_conexiones():
+    """Vuelca el Diario, vacía la cola del escritor y cierra todas las conexiones abiertas."""
+    global _escritor, _diario, _generacion
+    with _lock_diario:
+        diario, _diario = _diario, None
+    if diario is not None:
+        diario.detener() # Antes que el escritor: su último volcado aún tiene que entrar
+    with _lock_escritor:
+        if _escritor is not None:
+            _escritor.detener()
+            _escritor = None
+    with _lock_conexiones:
+        for conn in _conexiones_lectura:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        _conexiones_lectura.clear()
+        _generacion += 1
+
+atexit.register(cerrar_conexiones)
+
 # --- 1. FUNCIONES AUXILIARES (NO PERDER ESTAS) ---
 
 def conectar_db():
-    """Crea la conexión a SQLite."""
+    """Crea una conexión independiente a SQLite (ya con los PRAGMAS aplicados)."""
     try:
-        return sqlite3.connect(DB_PATH)
+        return _abrir_conexion()
     except sqlite3.Error as e:
         print(f"Error crítico SQLite: {e}")
         return None
@@ -25,170 +226,813 @@ def get_activo_por_ruta(ruta_abs):
     Devuelve la tupla completa (ID, Ruta, ...).
     El ID_Activo es el índice [0].
     """
-    conn = conectar_db()
-    if not conn: return None
     try:
-        cursor = conn.cursor()
+        cursor = obtener_conexion_lectura().cursor()
         cursor.execute("SELECT * FROM Activos WHERE Ruta_Absoluta = ?", (str(ruta_abs),))
         activo = cursor.fetchone()
         return activo
     except Exception as e:
         print(f"Error buscando activo: {e}")
         return None
-    finally:
-        conn.close()
 
-# --- 2. INICIALIZACIÓN DE TABLAS (ESTRUCTURA 2.0) ---
+# --- 2. INICIALIZACIÓN DE TABLAS Y MIGRACIONES (ESTRUCTURA 2.0) ---
+# El esquema evoluciona con migraciones numeradas. La versión aplicada se guarda en
+# la propia DB (PRAGMA user_version) y cada migración corre en su transacción.
+# REGLA: una migración publicada no se edita; los cambios van en una NUEVA al final.
+# (Las bases creadas antes de este sistema tienen versión 0: las migraciones 1-3
+# usan IF NOT EXISTS / _asegurar_columnas y son seguras sobre ellas.)
+
+# Columnas añadidas después de la estructura 2.0 (nombre, definición)
+COLUMNAS_ACTIVOS_NUEVAS = [
+    ("Mtime_ns", "INTEGER"),
+    ("Inodo", "INTEGER"),
+    ("Eliminado", "INTEGER DEFAULT 0"),
+    ("Hash_Parcial", "TEXT"),
+    ("Nivel_Hash", "TEXT"),
+]
+
+def _asegurar_columnas(cursor, tabla, columnas):
+    """Añade a 'tabla' las columnas que aún no tenga (ALTER TABLE ... ADD COLUMN)."""
+    existentes = {fila[1] for fila in cursor.execute(f"PRAGMA table_info({tabla})")}
+    for nombre, definicion in columnas:
+        if nombre not in existentes:
+            cursor.execute(f"ALTER TABLE {tabla} ADD COLUMN {nombre} {definicion}")
+
+def _migracion_estructura_base(cursor):
+    # TABLA 1: ACTIVOS (Inventario)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Activos (
+        ID_Activo INTEGER PRIMARY KEY AUTOINCREMENT,
+        Ruta_Absoluta TEXT UNIQUE NOT NULL,
+        Nombre_Archivo TEXT,
+        Extension TEXT,
+        Tipo_Activo TEXT,      -- 'Archivo', 'Programa', 'Email'
+        
+        -- Metadatos de Peso y Recursos
+        Peso_Bytes INTEGER,        -- Para filtrar archivos gigantes
+        Estimacion_Tokens INTEGER, -- Para que el LLM sepa si le cabe en memoria
+        
+        -- Inteligencia
+        Resumen_Ejecutivo TEXT,    -- Resumen breve para búsquedas rápidas
+        Etiquetas_Confirmadas TEXT,-- Tags aprobados por el usuario
+        
+        -- Control de Cambios (huella por niveles, ver utils.calcular_huellas)
+        Hash_Contenido TEXT,       -- SHA-256 completo (NULL hasta que haga falta)
+        Hash_Parcial TEXT,         -- SHA-256 de tamaño + principio/medio/final
+        Nivel_Hash TEXT,           -- 'Parcial' o 'Completo'
+        Fecha_Modificacion_DB DATETIME DEFAULT CURRENT_TIMESTAMP,
+        
+        -- Firma del sistema de archivos (re-escaneo incremental sin re-hashear)
+        Mtime_ns INTEGER,          -- st_mtime_ns del último escaneo
+        Inodo INTEGER,             -- st_ino (inodo en Linux, file-id en Windows): movimientos en el re-escaneo
+        Eliminado INTEGER DEFAULT 0, -- 1 = el archivo ya no existe (lápida)
+        
+        -- Estado del RAG
+        Estado_Procesamiento TEXT DEFAULT 'Pendiente' -- 'Pendiente', 'Procesando', 'Indexado', 'Sin_Texto', 'Error'
+    )
+    """)
+
+    # 2. Tabla Registros (Diario de a Bordo)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Registros (
+            ID_Registro INTEGER PRIMARY KEY AUTOINCREMENT,
+            Timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        
+            Tipo_Evento TEXT NOT NULL,  -- 'FOCO', 'MODIFICADO', 'CREADO', 'LLM_QUERY'
+            Contexto_Crudo TEXT,        -- Ej: 'AutoCAD - Plano.dwg'
+        
+            -- El Enlace (Linker)
+            ID_Activo_Asociado INTEGER, -- Puede ser NULL al principio
+            Confianza_Enlace TEXT,      -- 'ALTA', 'MEDIA', 'NULA'
+            Etiquetas TEXT,
+        
+            FOREIGN KEY (ID_Activo_Asociado) REFERENCES Activos(ID_Activo)
+        )
+    """)
+
+    # 3. TABLA PROGRAMAS (Nuevo: Contexto de Software)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Programas_Conocidos (
+            Nombre_Proceso TEXT PRIMARY KEY, -- Ej: 'acad.exe'
+            Nombre_Comercial TEXT,           -- Ej: 'AutoCAD 2024'
+            Descripcion_Contextual TEXT,     -- Ej: 'Software de diseño CAD...'
+            Categoria TEXT                   -- 'Diseño', 'Ofimática', 'Sistema'
+        )
+    """)
+
+def _migracion_columnas_activos(cursor):
+    # Bases de datos creadas con versiones anteriores: añadimos las columnas nuevas
+    _asegurar_columnas(cursor, "Activos", COLUMNAS_ACTIVOS_NUEVAS)
+
+def _migracion_puesto_control(cursor):
+    # 4. PUESTO DE CONTROL (decisiones por extensión y archivos a la espera de decisión)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Decisiones_Extension (
+            Extension TEXT PRIMARY KEY,      -- Ej: '.gcode'
+            Decision TEXT NOT NULL,          -- 'procesar_siempre' o 'ignorar_siempre'
+            Fecha_Decision DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Archivos_Pendientes (
+            Ruta_Absoluta TEXT PRIMARY KEY,
+            Extension TEXT NOT NULL,
+            Peso_Bytes INTEGER,
+            Mtime_ns INTEGER,
+            Fecha_Deteccion DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_pendientes_extension ON Archivos_Pendientes(Extension)")
+
+def _migracion_indices_consultas(cursor):
+    # Índices de las consultas que se lanzan en cada llamada al LLM o por cada evento
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_registros_timestamp ON Registros(Timestamp)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_registros_activo ON Registros(ID_Activo_Asociado)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_activos_hash ON Activos(Hash_Contenido)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_activos_estado ON Activos(Estado_Procesamiento)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_activos_huella ON Activos(Peso_Bytes, Hash_Parcial)")
+
+def _migracion_cache_respuestas(cursor):
+    # Respuestas del LLM memorizadas (ver gestor_ollama.CacheRespuestas). Tiempos en epoch (segundos).
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Cache_Respuestas_LLM (
+            Clave TEXT PRIMARY KEY,          -- SHA-256 de (modelo, opciones, SHA-256 del prompt final)
+            Modelo TEXT NOT NULL,
+            Tipo_Llamada TEXT,               -- 'ligero', 'pesado'...
+            Respuesta TEXT NOT NULL,
+            Fecha_Creacion REAL NOT NULL,
+            Ultimo_Acceso REAL NOT NULL,     -- Para expulsar las menos usadas (LRU)
+            Expira REAL                      -- NULL = no caduca
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_cache_llm_acceso ON Cache_Respuestas_LLM(Ultimo_Acceso)")
+
+def _migracion_fragmentos(cursor):
+    # Trozos de texto de los activos para el RAG; su vector vive en indice_vectorial.py
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Fragmentos (
+            ID_Fragmento INTEGER PRIMARY KEY AUTOINCREMENT,
+            ID_Activo INTEGER NOT NULL,
+            Orden INTEGER NOT NULL,          -- Posición del trozo dentro del archivo
+            Texto TEXT NOT NULL,
+            FOREIGN KEY (ID_Activo) REFERENCES Activos(ID_Activo)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_fragmentos_activo ON Fragmentos(ID_Activo)")
+
+def _migracion_busqueda_texto(cursor):
+    # Índice de texto completo (FTS5) sobre Activos. rowid = ID_Activo.
+    # El tokenizador parte por cualquier signo (/ \\ _ - . espacio), así que cada carpeta
+    # de la ruta son palabras buscables, e ignora tildes ("produccion" = "PRODUCCIÓN").
+    # 'Texto' (contenido extraído) no está en Activos: lo rellena el indexado RAG.
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS Activos_FTS USING fts5(
+            Nombre, Ruta, Resumen, Etiquetas, Texto,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+    """)
+    # Los triggers NO escriben en Activos_FTS directamente: FTS5 vuelca su índice en cada
+    # sentencia de trigger y un alta masiva iría varias veces más lenta. Apuntan el ID en
+    # una cola y 'sincronizar_fts' la aplica de golpe (tras cada lote y antes de cada búsqueda).
+    # Las altas ni siquiera necesitan trigger: ID_Activo es AUTOINCREMENT, así que las filas
+    # nuevas son justo las de ID mayor que el último rowid de Activos_FTS.
+    cursor.execute("CREATE TABLE IF NOT EXISTS Activos_FTS_Cola (ID_Activo INTEGER PRIMARY KEY)")
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_activos_fts_actualizar
+        AFTER UPDATE OF Nombre_Archivo, Ruta_Absoluta, Resumen_Ejecutivo, Etiquetas_Confirmadas ON Activos BEGIN
+            INSERT OR IGNORE INTO Activos_FTS_Cola VALUES (new.ID_Activo);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_activos_fts_borrar AFTER DELETE ON Activos BEGIN
+            INSERT OR IGNORE INTO Activos_FTS_Cola VALUES (old.ID_Activo);
+        END
+    """)
+    # Activos que ya existían (entran como altas)
+    _tarea_sincronizar_fts(cursor)
+
+def _migracion_textos_extraidos(cursor):
+    # Texto extraído de ofimática/CAD (ver extractores.py), por CONTENIDO: un archivo movido
+    # o copiado no se vuelve a extraer. Texto comprimido con zlib; NULL + Error si falló.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Textos_Extraidos (
+            Hash_Contenido TEXT PRIMARY KEY,
+            Version_Extractor INTEGER NOT NULL,
+            Texto BLOB,
+            Caracteres INTEGER,
+            Error TEXT,
+            Fecha_Extraccion TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def _migracion_metricas_recursos(cursor):
+    # Serie temporal de carga del equipo (ver monitores/metricas_recursos.py). Una fila por
+    # intervalo de 'Resolucion' segundos (1, 60 o 3600) que empieza en 'Instante' (epoch).
+    # Las velocidades de disco y red son medias en bytes/s; Proceso_Top, el del pico de CPU.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Metricas_Recursos (
+            Resolucion INTEGER NOT NULL,
+            Instante INTEGER NOT NULL,
+            Muestras INTEGER NOT NULL,
+            CPU_Media REAL,
+            CPU_Max REAL,
+            RAM_Media REAL,
+            RAM_Max REAL,
+            Disco_Lectura REAL,
+            Disco_Escritura REAL,
+            Red_Recibida REAL,
+            Red_Enviada REAL,
+            CPU_Proceso_Top REAL,
+            Proceso_Top TEXT,
+            PRIMARY KEY (Resolucion, Instante)
+        ) WITHOUT ROWID
+    """)
+
+def _migracion_sesiones_foco(cursor):
+    # Foco de ventana como sesiones (ver monitores/monitor_contexto.py) en vez de una fila de
+    # Registros por cada cambio de ventana. Inicio/Fin en UTC, mismo formato que Registros.Timestamp;
+    # Duracion_Segundos es el tiempo con el foco, sin contar interrupciones ni inactividad.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Sesiones_Foco (
+            ID_Sesion INTEGER PRIMARY KEY AUTOINCREMENT,
+            Inicio DATETIME NOT NULL,
+            Fin DATETIME NOT NULL,
+            Duracion_Segundos INTEGER NOT NULL,
+            Titulo TEXT NOT NULL,
+            Proceso TEXT,
+            Reanudaciones INTEGER DEFAULT 0, -- Veces que se volvió al mismo contexto dentro de la gracia
+            ID_Activo_Asociado INTEGER,
+            FOREIGN KEY (ID_Activo_Asociado) REFERENCES Activos(ID_Activo)
+        )
+    """)
+    # Historial reciente (ORDER BY Fin DESC) y versión del historial (MAX(Fin))
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sesiones_fin ON Sesiones_Foco(Fin)")
+
+def _migracion_enlazador(cursor):
+    # Enlazador título de ventana -> activo (ver enlazador_activos.py). Refresco incremental
+    # del índice en memoria: "activos cambiados desde" sin recorrer la tabla entera.
+    _asegurar_columnas(cursor, "Sesiones_Foco", [("Confianza_Enlace", "TEXT")]) # 'ALTA', 'MEDIA', 'NULA'
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_activos_fecha_modificacion ON Activos(Fecha_Modificacion_DB)")
+
+def _migracion_reintentos_extraccion(cursor):
+    # Fallos pasajeros de extracción (timeout, proceso caído, archivo bloqueado): se guardan
+    # con fecha de reintento y se vuelven a intentar hasta agotar los intentos. Los errores de
+    # formato y los fallos agotados llevan Reintentar_Desde = NULL (definitivos).
+    _asegurar_columnas(cursor, "Textos_Extraidos", [
+        ("Intentos", "INTEGER DEFAULT 0"),
+        ("Reintentar_Desde", "TEXT"), # UTC, mismo formato que CURRENT_TIMESTAMP
+    ])
+
+# (versión, descripción, función(cursor)). Solo se añaden al final.
+MIGRACIONES = [
+    (1, "Estructura 2.0 (Activos, Registros, Programas_Conocidos)", _migracion_estructura_base),
+    (2, "Firma del sistema de archivos, lápidas y huella por niveles en Activos", _migracion_columnas_activos),
+    (3, "Puesto de Control (Decisiones_Extension, Archivos_Pendientes)", _migracion_puesto_control),
+    (4, "Índices de las consultas calientes", _migracion_indices_consultas),
+    (5, "Caché de respuestas del LLM", _migracion_cache_respuestas),
+    (6, "Fragmentos de texto para el RAG", _migracion_fragmentos),
+    (7, "Búsqueda de texto completo (FTS5) sobre Activos", _migracion_busqueda_texto),
+    (8, "Caché de texto extraído por contenido", _migracion_textos_extraidos),
+    (9, "Serie temporal de métricas de recursos", _migracion_metricas_recursos),
+    (10, "Sesiones de foco de ventana", _migracion_sesiones_foco),
+    (11, "Enlace de títulos de ventana con activos", _migracion_enlazador),
+    (12, "Reintentos de los fallos pasajeros de extracción", _migracion_reintentos_extraccion),
+]
+
+def version_esquema(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def aplicar_migraciones(conn):
+    """
+    Aplica en orden las migraciones que falten. Cada una va en su propia transacción
+    junto con el nuevo user_version: si falla, la DB se queda en la versión anterior.
+    Devuelve la versión final.
+    """
+    version = version_esquema(conn)
+    ultima = MIGRACIONES[-1][0]
+    if version > ultima:
+        print(f"ADVERTENCIA: La DB está en la versión {version}, más nueva que este código ({ultima}).")
+        return version
+    for numero, descripcion, migracion in MIGRACIONES:
+        if numero <= version:
+            continue
+        print(f"Migración {numero}: {descripcion}...")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            migracion(conn.cursor())
+            conn.execute(f"PRAGMA user_version = {int(numero)}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        version = numero
+    return version
 
 def inicializar_base_de_datos():
     """
-    Inicializa la conexión y crea las tablas Activos y Registros.
+    Inicializa la conexión y deja el esquema en la última versión (ver MIGRACIONES).
     """
     conn = None
     print(f"Inicializando base de datos en: {DB_PATH}")
     
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # TABLA 1: ACTIVOS (Inventario)
-        print("Creando tabla 'Activos'...")
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS Activos (
-            ID_Activo INTEGER PRIMARY KEY AUTOINCREMENT,
-            Ruta_Absoluta TEXT UNIQUE NOT NULL,
-            Nombre_Archivo TEXT,
-            Extension TEXT,
-            Tipo_Activo TEXT,      -- 'Archivo', 'Programa', 'Email'
-            
-            -- Metadatos de Peso y Recursos
-            Peso_Bytes INTEGER,        -- Para filtrar archivos gigantes
-            Estimacion_Tokens INTEGER, -- Para que el LLM sepa si le cabe en memoria
-            
-            -- Inteligencia
-            Resumen_Ejecutivo TEXT,    -- Resumen breve para búsquedas rápidas
-            Etiquetas_Confirmadas TEXT,-- Tags aprobados por el usuario
-            
-            -- Control de Cambios
-            Hash_Contenido TEXT,
-            Fecha_Modificacion_DB DATETIME DEFAULT CURRENT_TIMESTAMP,
-            
-            -- Estado del RAG
-            Estado_Procesamiento TEXT DEFAULT 'Pendiente' -- 'Pendiente', 'Indexado', 'Error'
-        )
-        """)
-        
-        # 2. Tabla Registros (Diario de a Bordo)
-        print("Creando tabla 'Registros' (Diario de a Bordo)...")
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS Registros (
-                ID_Registro INTEGER PRIMARY KEY AUTOINCREMENT,
-                Timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            
-                Tipo_Evento TEXT NOT NULL,  -- 'FOCO', 'MODIFICADO', 'CREADO', 'LLM_QUERY'
-                Contexto_Crudo TEXT,        -- Ej: 'AutoCAD - Plano.dwg'
-            
-                -- El Enlace (Linker)
-                ID_Activo_Asociado INTEGER, -- Puede ser NULL al principio
-                Confianza_Enlace TEXT,      -- 'ALTA', 'MEDIA', 'NULA'
-                Etiquetas TEXT,
-            
-                FOREIGN KEY (ID_Activo_Asociado) REFERENCES Activos(ID_Activo)
-            )
-        """)
-
-            # 3. TABLA PROGRAMAS (Nuevo: Contexto de Software)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS Programas_Conocidos (
-                Nombre_Proceso TEXT PRIMARY KEY, -- Ej: 'acad.exe'
-                Nombre_Comercial TEXT,           -- Ej: 'AutoCAD 2024'
-                Descripcion_Contextual TEXT,     -- Ej: 'Software de diseño CAD...'
-                Categoria TEXT                   -- 'Diseño', 'Ofimática', 'Sistema'
-            )
-        """)
-
-        conn.commit()
-        print("Base de datos inicializada correctamente.")
+        conn = _abrir_conexion() # Deja la DB en modo WAL de forma persistente
+        version = aplicar_migraciones(conn)
+        print(f"Base de datos inicializada correctamente (esquema v{version}).")
     except sqlite3.Error as e:
         print(f"Error al inicializar la base de datos: {e}")
     finally:
         if conn:
             conn.close()
 
+# Consultas que se ejecutan en caliente: (nombre, SQL, parámetros de ejemplo)
+CONSULTAS_CALIENTES = [
+    ("registros_recientes",
+     "SELECT Timestamp, Tipo_Evento, Contexto_Crudo, ID_Activo_Asociado FROM Registros "
+     "ORDER BY Timestamp DESC, ID_Registro DESC LIMIT ?", (10,)),
+    ("sesiones_foco_recientes",
+     "SELECT Inicio, Fin, Duracion_Segundos, Titulo, Proceso, ID_Activo_Asociado FROM Sesiones_Foco "
+     "ORDER BY Fin DESC LIMIT ?", (10,)),
+    ("registros_de_activo",
+     "SELECT ID_Registro FROM Registros WHERE ID_Activo_Asociado = ?", (1,)),
+    ("activo_por_ruta",
+     "SELECT * FROM Activos WHERE Ruta_Absoluta = ?", ("C:/x.dwg",)),
+    ("activos_bajo_carpeta",
+     "SELECT Ruta_Absoluta, Peso_Bytes, Mtime_ns FROM Activos "
+     "WHERE Ruta_Absoluta >= ? AND Ruta_Absoluta < ? AND Eliminado = 0", ("C:/a/", "C:/a0")),
+    ("activos_por_hash",
+     "SELECT ID_Activo, Ruta_Absoluta FROM Activos WHERE Hash_Contenido = ?", ("abc",)),
+    ("activos_modificados_desde",
+     "SELECT ID_Activo, Ruta_Absoluta, Nombre_Archivo, Extension, Eliminado, Mtime_ns, Fecha_Modificacion_DB "
+     "FROM Activos WHERE Fecha_Modificacion_DB >= ?", ("2025-01-01 00:00:00",)),
+    ("activos_pendientes",
+     "SELECT ID_Activo FROM Activos WHERE Estado_Procesamiento = ? LIMIT ?", ("Pendiente", 100)),
+]
+
+def verificar_planes_consulta(conn=None, consultas=None):
+    """
+    Comprueba con EXPLAIN QUERY PLAN que las consultas calientes usan índices:
+    falla si alguna hace un 'SCAN' de tabla completa o necesita un B-tree temporal
+    para ordenar. Devuelve {nombre: [problemas]} (vacío = todo correcto).
+    """
+    propia = conn is None
+    conn = conn or _abrir_conexion()
+    problemas = {}
+    try:
+        for nombre, sql, parametros in consultas or CONSULTAS_CALIENTES:
+            plan = [fila[-1] for fila in conn.execute(f"EXPLAIN QUERY PLAN {sql}", parametros)]
+            malos = [
+                paso for paso in plan
+                if (paso.startswith("SCAN ") and " USING " not in paso) or "TEMP B-TREE" in paso
+            ]
+            estado = "OK " if not malos else "MAL"
+            print(f"[{estado}] {nombre}: {' | '.join(plan)}")
+            if malos:
+                problemas[nombre] = malos
+    finally:
+        if propia:
+            conn.close()
+    return problemas
+
 # --- 3. FUNCIONES DE INSERCIÓN (ACTUAL CON 2.0) ---
+# Todas pasan por el hilo escritor (ver sección 0).
+
+SQL_UPSERT_ACTIVO = """
+    INSERT OR REPLACE INTO Activos (
+        Ruta_Absoluta, Nombre_Archivo, Extension, Tipo_Activo, Peso_Bytes, 
+        Estimacion_Tokens, Hash_Contenido, Hash_Parcial, Nivel_Hash, Mtime_ns, Inodo, Eliminado,
+        Fecha_Modificacion_DB, Estado_Procesamiento
+    ) VALUES (:ruta, :nombre, :ext, :tipo, :peso, :tokens_est, :hash_val, :hash_parcial, :nivel_hash,
+        :mtime_ns, :inodo, 0, CURRENT_TIMESTAMP, 'Pendiente')
+        ON CONFLICT(Ruta_Absoluta) DO UPDATE SET
+        Hash_Contenido = excluded.Hash_Contenido,
+        Hash_Parcial = excluded.Hash_Parcial,
+        Nivel_Hash = excluded.Nivel_Hash,
+        Peso_Bytes = excluded.Peso_Bytes,
+        Estimacion_Tokens = excluded.Estimacion_Tokens,
+        Mtime_ns = excluded.Mtime_ns,
+        Inodo = excluded.Inodo,
+        Eliminado = 0,
+        Fecha_Modificacion_DB = CURRENT_TIMESTAMP,
+        Estado_Procesamiento = 'Pendiente'
+"""
+
+# Valores por defecto de un registro de activo (las claves son los parámetros de SQL_UPSERT_ACTIVO)
+ACTIVO_POR_DEFECTO = {
+    "ruta": None, "nombre": None, "ext": None, "tipo": "Archivo",
+    "peso": None, "tokens_est": 0, "hash_val": None,
+    "hash_parcial": None, "nivel_hash": None,
+    "mtime_ns": None, "inodo": None,
+}
 
-def insertar_activo_completo(ruta, nombre, ext, peso, tokens_est, hash_val):
+# Tamaño de las transacciones del volcado masivo: lo que llegue antes (filas o segundos)
+TAM_LOTE_ACTIVOS = 5000
+SEGUNDOS_LOTE_ACTIVOS = 2.0
+
+def _normalizar_activo(registro):
+    fila = {**ACTIVO_POR_DEFECTO, **registro}
+    fila["ruta"] = str(fila["ruta"])
+    if fila["nivel_hash"] is None:
+        fila["nivel_hash"] = "Completo" if fila["hash_val"] else "Parcial"
+    return fila
+
+def _tarea_upsert_activo(conn, fila):
+    conn.execute(SQL_UPSERT_ACTIVO, fila)
+    # Devolvemos el ID en la misma tarea: el monitor no necesita otra consulta.
+    return conn.execute("SELECT ID_Activo FROM Activos WHERE Ruta_Absoluta = ?", (fila["ruta"],)).fetchone()[0]
+
+def _tarea_upsert_lote(conn, filas):
+    conn.executemany(SQL_UPSERT_ACTIVO, filas)
+    _tarea_sincronizar_fts(conn) # Un lote = una pasada por el índice de texto (ver sección 8)
+    return len(filas)
+
+def insertar_activo_completo(ruta, nombre, ext, peso, tokens_est, hash_val, mtime_ns=None, inodo=None,
+                             hash_parcial=None, nivel_hash=None):
     """
-    Inserta o actualiza un activo con TODOS los datos nuevos (tokens, peso).
+    Inserta o actualiza un activo con TODOS los datos nuevos (tokens, peso, firma del disco).
     Reemplaza a la antigua 'insertar_o_actualizar_activo'.
+    Devuelve el ID_Activo (o None si hubo error).
     """
-    conn = conectar_db()
-    if not conn: return
     try:
-        cursor = conn.cursor()
-        # Usamos INSERT OR REPLACE para actualizar si ya existe la ruta. (Requiere que Ruta_Absoluta sea UNIQUE, que lo es)
-        cursor.execute("""
-            INSERT OR REPLACE INTO Activos (
-                Ruta_Absoluta, Nombre_Archivo, Extension, Peso_Bytes, 
-                Estimacion_Tokens, Hash_Contenido, Fecha_Modificacion_DB, Estado_Procesamiento
-            ) VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, "Pendiente")
-                ON CONFLICT(Ruta_Absoluta) DO UPDATE SET
-                Hash_Contenido = excluded.Hash_Contenido,
-                Peso_Bytes = excluded.Peso_Bytes,
-                Estimacion_Tokens = excluded.Estimacion_Tokens,
-                Fecha_Modificacion_DB = CURRENT_TIMESTAMP,
-                Estado_Procesamiento = 'Pendiente'
-        """, (str(ruta), nombre, ext, peso, tokens_est, hash_val))
-        conn.commit()
+        return ejecutar_escritura(_tarea_upsert_activo, _normalizar_activo({
+            "ruta": ruta, "nombre": nombre, "ext": ext, "peso": peso,
+            "tokens_est": tokens_est, "hash_val": hash_val,
+            "mtime_ns": mtime_ns, "inodo": inodo,
+            "hash_parcial": hash_parcial, "nivel_hash": nivel_hash,
+        }))
     except Exception as e:
         print(f"Error insertando activo completo: {e}")
-    finally:
-        conn.close()
+        return None
 
-def insertar_registro_accion(tipo, contexto, id_activo=None):
-    conn = conectar_db()
+def insertar_activos_lote(registros, tam_lote=TAM_LOTE_ACTIVOS, max_segundos=SEGUNDOS_LOTE_ACTIVOS):
+    """
+    Versión masiva de 'insertar_activo_completo' para los mapeadores.
+    'registros' es cualquier iterable (puede ser un generador que va recorriendo el disco)
+    de diccionarios con las claves de ACTIVO_POR_DEFECTO.
+    Se agrupan en transacciones de 'tam_lote' filas o 'max_segundos' (lo que llegue antes)
+    y se envían al escritor con executemany: un fsync por lote en vez de uno por archivo.
+    Mientras se prepara un lote, el anterior se está escribiendo (como mucho uno en vuelo).
+    Devuelve el número de activos escritos.
+    """
+    total = 0
+    en_vuelo = None
+    lote = []
+    inicio_lote = time.monotonic()
+
+    def _esperar_en_vuelo():
+        nonlocal total
+        if en_vuelo is None:
+            return
+        try:
+            total += en_vuelo.result()
+        except Exception as e:
+            print(f"Error insertando lote de activos: {e}")
+
+    for registro in registros:
+        if not lote:
+            inicio_lote = time.monotonic()
+        lote.append(_normalizar_activo(registro))
+        if len(lote) >= tam_lote or time.monotonic() - inicio_lote >= max_segundos:
+            _esperar_en_vuelo()
+            en_vuelo = ejecutar_escritura(_tarea_upsert_lote, lote, esperar=False)
+            lote = []
+
+    _esperar_en_vuelo()
+    en_vuelo = None
+    if lote:
+        en_vuelo = ejecutar_escritura(_tarea_upsert_lote, lote, esperar=False)
+        _esperar_en_vuelo()
+    return total
+
+def _rango_prefijo(carpeta):
+    """
+    Convierte una carpeta en el rango [desde, hasta) de rutas que cuelgan de ella.
+    Así la consulta usa el índice UNIQUE de Ruta_Absoluta (un LIKE no lo haría).
+    """
+    prefijo = str(carpeta)
+    if not prefijo.endswith(os.sep):
+        prefijo += os.sep
+    return prefijo, prefijo[:-1] + chr(ord(prefijo[-1]) + 1)
+
+def obtener_firmas_activos(carpeta):
+    """
+    Devuelve {ruta: (Peso_Bytes, Mtime_ns)} de los activos vivos bajo 'carpeta'.
+    Es la foto del último escaneo con la que el mapeador decide qué re-hashear.
+    """
+    desde, hasta = _rango_prefijo(carpeta)
     try:
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO Registros (Tipo_Evento, Contexto_Crudo, ID_Activo_Asociado)
-            VALUES (?, ?, ?)
-        """, (tipo, contexto, id_activo))
-        conn.commit()
+        cursor = obtener_conexion_lectura().execute("""
+            SELECT Ruta_Absoluta, Peso_Bytes, Mtime_ns FROM Activos
+            WHERE Ruta_Absoluta >= ? AND Ruta_Absoluta < ? AND Eliminado = 0
+        """, (desde, hasta))
+        return {ruta: (peso, mtime) for ruta, peso, mtime in cursor}
     except Exception as e:
-        print(f"Error DB (Registro): {e}")
-    finally:
-        conn.close()
+        print(f"Error leyendo firmas de activos: {e}")
+        return {}
+
+def obtener_inodos_activos(carpeta):
+    """
+    Devuelve {Inodo: (ruta, Peso_Bytes, Mtime_ns)} de los activos vivos bajo 'carpeta' con
+    inodo conocido. El mapeador lo usa para reconocer archivos movidos o renombrados.
+    """
+    desde, hasta = _rango_prefijo(carpeta)
+    try:
+        cursor = obtener_conexion_lectura().execute("""
+            SELECT Inodo, Ruta_Absoluta, Peso_Bytes, Mtime_ns FROM Activos
+            WHERE Ruta_Absoluta >= ? AND Ruta_Absoluta < ? AND Eliminado = 0 AND Inodo IS NOT NULL
+        """, (desde, hasta))
+        return {inodo: (ruta, peso, mtime) for inodo, ruta, peso, mtime in cursor}
+    except Exception as e:
+        print(f"Error leyendo inodos de activos: {e}")
+        return {}
+
+def _tarea_marcar_eliminados(conn, rutas):
+    cursor = conn.executemany("""
+        UPDATE Activos SET Eliminado = 1, Fecha_Modificacion_DB = CURRENT_TIMESTAMP
+        WHERE Ruta_Absoluta = ? AND Eliminado = 0
+    """, ((ruta,) for ruta in rutas))
+    return cursor.rowcount
+
+def marcar_activos_eliminados(rutas):
+    """
+    Deja una lápida (Eliminado = 1) en los activos cuyas rutas ya no existen.
+    No se borran las filas: los Registros que apuntan a ellas siguen siendo válidos.
+    Devuelve cuántos activos se han marcado.
+    """
+    rutas = [str(ruta) for ruta in rutas]
+    if not rutas:
+        return 0
+    try:
+        return ejecutar_escritura(_tarea_marcar_eliminados, rutas)
+    except Exception as e:
+        print(f"Error marcando activos eliminados: {e}")
+        return 0
+
+def _tarea_marcar_carpeta_eliminada(conn, desde, hasta):
+    cursor = conn.execute("""
+        UPDATE Activos SET Eliminado = 1, Fecha_Modificacion_DB = CURRENT_TIMESTAMP
+        WHERE Ruta_Absoluta >= ? AND Ruta_Absoluta < ? AND Eliminado = 0
+    """, (desde, hasta))
+    return cursor.rowcount
+
+def marcar_carpeta_eliminada(carpeta):
+    """Lápida para todos los activos que colgaban de una carpeta borrada. Devuelve cuántos."""
+    try:
+        return ejecutar_escritura(_tarea_marcar_carpeta_eliminada, *_rango_prefijo(carpeta))
+    except Exception as e:
+        print(f"Error marcando carpeta eliminada: {e}")
+        return 0
+
+def _tarea_mover_activo(conn, origen, destino, nombre, ext):
+    if conn.execute("SELECT 1 FROM Activos WHERE Ruta_Absoluta = ?", (origen,)).fetchone() is None:
+        return None
+    # Lo que hubiera en el destino (normalmente una lápida de un archivo anterior) se borra
+    # antes con un DELETE explícito: el borrado implícito de UPDATE OR REPLACE no dispara
+    # trg_activos_fts_borrar (recursive_triggers está desactivado) y su fila FTS quedaría huérfana.
+    conn.execute("DELETE FROM Activos WHERE Ruta_Absoluta = ? AND Ruta_Absoluta <> ?", (destino, origen))
+    conn.execute("""
+        UPDATE OR REPLACE Activos
+        SET Ruta_Absoluta = ?, Nombre_Archivo = ?, Extension = ?,
+            Eliminado = 0, Fecha_Modificacion_DB = CURRENT_TIMESTAMP
+        WHERE Ruta_Absoluta = ?
+    """, (destino, nombre, ext, origen))
+    if conn.execute("SELECT changes()").fetchone()[0] == 0:
+        return None
+    fila = conn.execute("SELECT ID_Activo FROM Activos WHERE Ruta_Absoluta = ?", (destino,)).fetchone()
+    return fila[0] if fila else None
+
+def mover_activo(origen, destino, nombre, ext):
+    """
+    Renombrado/movimiento de un archivo: solo cambia la ruta (el contenido es el mismo,
+    no se re-hashea). Devuelve el ID_Activo o None si el origen no estaba en el inventario.
+    """
+    try:
+        return ejecutar_escritura(_tarea_mover_activo, str(origen), str(destino), nombre, ext)
+    except Exception as e:
+        print(f"Error moviendo activo {origen}: {e}")
+        return None
+
+def _tarea_mover_carpeta(conn, origen, destino):
+    desde, hasta = _rango_prefijo(origen)
+    nuevo_prefijo, _ = _rango_prefijo(destino)
+    # Igual que en '_tarea_mover_activo': las filas que ocupan las rutas de destino se
+    # borran antes a mano para que el trigger de FTS apunte sus IDs
+    conn.execute("""
+        DELETE FROM Activos WHERE Ruta_Absoluta IN (
+            SELECT ? || substr(Ruta_Absoluta, ?) FROM Activos
+            WHERE Ruta_Absoluta >= ? AND Ruta_Absoluta < ?
+        )
+    """, (nuevo_prefijo, len(desde) + 1, desde, hasta))
+    cursor = conn.execute("""
+        UPDATE OR REPLACE Activos
+        SET Ruta_Absoluta = ? || substr(Ruta_Absoluta, ?),
+            Fecha_Modificacion_DB = CURRENT_TIMESTAMP
+        WHERE Ruta_Absoluta >= ? AND Ruta_Absoluta < ?
+    """, (nuevo_prefijo, len(desde) + 1, desde, hasta))
+    return cursor.rowcount
+
+def mover_carpeta_activos(origen, destino):
+    """
+    Renombrado/movimiento de una carpeta: reescribe el prefijo de todas las rutas
+    que cuelgan de ella en una sola sentencia (usa el índice de Ruta_Absoluta).
+    Devuelve cuántos activos se han movido.
+    """
+    try:
+        return ejecutar_escritura(_tarea_mover_carpeta, str(origen), str(destino))
+    except Exception as e:
+        print(f"Error moviendo carpeta {origen}: {e}")
+        return 0
+
+# Diario de a Bordo con escritura diferida (write-behind): los Registros (cambios de
+# foco, eventos de archivo, alertas) son las escrituras más frecuentes del sistema.
+# Se acumulan en memoria y se vuelcan en UNA transacción cada N filas o M milisegundos.
+TAM_LOTE_REGISTROS = 200
+MS_LOTE_REGISTROS = 500
+
+def _marca_tiempo_utc(instante=None):
+    """Mismo formato que CURRENT_TIMESTAMP de SQLite (UTC). 'instante' en epoch; None = ahora."""
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(instante))
+
+def _tarea_insertar_registros(conn, filas):
+    conn.executemany("""
+        INSERT INTO Registros (Timestamp, Tipo_Evento, Contexto_Crudo, ID_Activo_Asociado)
+        VALUES (?, ?, ?, ?)
+    """, filas)
+    return len(filas)
+
+class DiarioRegistros:
+    """
+    Buffer de Registros en memoria con un hilo que lo vuelca al escritor.
+    El Timestamp se toma al anotar (no al volcar), así el orden y la hora son los reales.
+    """
+    def __init__(self, max_filas=TAM_LOTE_REGISTROS, max_ms=MS_LOTE_REGISTROS):
+        self.max_filas = max_filas
+        self.intervalo = max_ms / 1000
+        self._filas = []
+        self._primera = None   # Instante de la fila más antigua sin volcar
+        self._cond = threading.Condition()
+        self._parar = False
+        self.hilo = None
+        self.filas_volcadas = 0
+        self.volcados = 0
+
+    def iniciar(self):
+        self._parar = False
+        self.hilo = threading.Thread(target=self._bucle, name="DiarioRegistros", daemon=True)
+        self.hilo.start()
+
+    def anotar(self, tipo, contexto, id_activo=None):
+        with self._cond:
+            if not self._filas:
+                self._primera = time.monotonic()
+                self._cond.notify() # Arranca el reloj del hilo
+            self._filas.append((_marca_tiempo_utc(), tipo, contexto, id_activo))
+            if len(self._filas) >= self.max_filas:
+                self._cond.notify()
+
+    def volcar(self):
+        """
+        Pasa lo acumulado al escritor (sin esperar al commit). Devuelve el Future o None.
+        El escritor es FIFO: una barrera posterior ('sincronizar_escrituras') ya lo incluye.
+        """
+        with self._cond:
+            filas, self._filas = self._filas, []
+            self._primera = None
+        if not filas:
+            return None
+        futuro = ejecutar_escritura(_tarea_insertar_registros, filas, esperar=False)
+        futuro.add_done_callback(_avisar_error_escritura("Registros"))
+        self.filas_volcadas += len(filas)
+        self.volcados += 1
+        return futuro
+
+    def _bucle(self):
+        while True:
+            with self._cond:
+                while not self._parar:
+                    if self._filas:
+                        espera = self._primera + self.intervalo - time.monotonic()
+                        if len(self._filas) >= self.max_filas or espera <= 0:
+                            break
+                    else:
+                        espera = None
+                    self._cond.wait(espera)
+                if self._parar:
+                    return
+            self.volcar()
+
+    def detener(self, timeout=5):
+        """Para el hilo y vuelca lo que quede."""
+        with self._cond:
+            self._parar = True
+            self._cond.notify_all()
+        if self.hilo:
+            self.hilo.join(timeout)
+        self.volcar()
+
+def obtener_diario():
+    """Devuelve el diario global de Registros, arrancándolo la primera vez."""
+    global _diario
+    with _lock_diario:
+        if _diario is None or not _diario.hilo.is_alive():
+            _diario = DiarioRegistros()
+            _diario.iniciar()
+        return _diario
+
+def insertar_registro_accion(tipo, contexto, id_activo=None):
+    """
+    Anota el registro en el Diario y vuelve enseguida: se escribirá en el próximo volcado
+    (como mucho MS_LOTE_REGISTROS después). Para leerlo ya, ver 'volcar_registros'.
+    """
+    obtener_diario().anotar(tipo, contexto, id_activo)
+
+def volcar_registros(esperar=True):
+    """
+    Vuelca YA los Registros acumulados. Con esperar=True bloquea hasta el commit
+    (consistencia "leo lo que acabo de escribir").
+    """
+    if _diario is not None:
+        _diario.volcar()
+    if esperar:
+        ejecutar_escritura(lambda conn: None)
+
+def sincronizar_escrituras():
+    """
+    Espera a que el escritor haya confirmado todo lo encolado hasta ahora
+    (incluidos los Registros aún en el Diario).
+    Útil antes de leer algo que acabamos de escribir en modo 'fire and forget'.
+    """
+    volcar_registros(esperar=True)
 
 # En src/gestor_db.py (Añadir al final)
 
 def obtener_registros_recientes(limite=10):
     """
-    Recupera los últimos 'limite' registros de acciones para el contexto del LLM.
+    Recupera los últimos 'limite' registros de acciones para el contexto del LLM:
+    Registros (eventos de archivo, alertas...) y Sesiones_Foco mezclados por hora.
+    Una sesión cuenta por su Fin (lo último que hizo el usuario sale lo último).
     """
-    conn = conectar_db()
-    if not conn: return "No hay historial disponible."
-    
     try:
-        cursor = conn.cursor()
+        volcar_registros() # Que salgan también los Registros aún en memoria
+        conn = obtener_conexion_lectura()
         # Se ordena por Timestamp (el más reciente primero)
-        cursor.execute("""
-            SELECT Timestamp, Tipo_Evento, Contexto_Crudo, ID_Activo_Asociado 
+        registros = conn.execute("""
+            SELECT Timestamp, ID_Registro, Tipo_Evento, Contexto_Crudo, ID_Activo_Asociado, Confianza_Enlace
             FROM Registros 
-            ORDER BY Timestamp DESC 
+            ORDER BY Timestamp DESC, ID_Registro DESC -- Los volcados por lotes comparten segundo
             LIMIT ?
-        """, (limite,))
-        registros = cursor.fetchall()
-        
+        """, (limite,)).fetchall()
+        sesiones = conn.execute("""
+            SELECT Fin, ID_Sesion, Inicio, Duracion_Segundos, Titulo, Proceso, ID_Activo_Asociado, Confianza_Enlace
+            FROM Sesiones_Foco
+            ORDER BY Fin DESC
+            LIMIT ?
+        """, (limite,)).fetchall()
+
         # Formatear la salida para que el LLM la lea fácilmente
-        salida_formateada = []
-        for reg in reversed(registros): # Los revertimos para que el LLM lea la historia en orden cronológico
-            salida_formateada.append(f"[{reg[0]}] Evento: {reg[1]}, Detalle: '{reg[2]}', Activo ID: {reg[3]}")
-            
-        return "\n".join(salida_formateada)
+        def _enlace(id_activo, confianza):
+            return f"{id_activo} ({confianza})" if id_activo is not None and confianza else f"{id_activo}"
+        lineas = [
+            (reg[0], 0, reg[1], f"[{reg[0]}] Evento: {reg[2]}, Detalle: '{reg[3]}', Activo ID: {_enlace(reg[4], reg[5])}")
+            for reg in registros
+        ]
+        lineas += [
+            (ses[0], 1, ses[1], f"[{ses[2]} -> {ses[0]}] Foco: '{ses[4]}' ({ses[5] or '?'}) "
+                                f"durante {ses[3] // 60} min {ses[3] % 60} s, Activo ID: {_enlace(ses[6], ses[7])}")
+            for ses in sesiones
+        ]
+        lineas = sorted(lineas)[-limite:] if limite else [] # En orden cronológico para el LLM
+        return "\n".join(linea[-1] for linea in lineas)
     except Exception as e:
         return f"Error al obtener registros recientes: {e}"
-    finally:
-        conn.close()
+
+def obtener_max_id_registro():
+    """
+    ID_Registro más alto (0 si no hay ninguno). Es la "versión" del Diario: si no ha
+    cambiado, el historial reciente tampoco (los Registros solo se añaden).
+    """
+    try:
+        volcar_registros()
+        fila = obtener_conexion_lectura().execute("SELECT MAX(ID_Registro) FROM Registros").fetchone()
+        return fila[0] or 0
+    except Exception as e:
+        print(f"Error leyendo el último registro: {e}")
+        return None
+
+def obtener_version_historial():
+    """
+    "Versión" del historial de 'obtener_registros_recientes': cambia si hay Registros nuevos
+    o si alguna sesión de foco se ha abierto, alargado o reanudado.
+    """
+    try:
+        volcar_registros()
+        conn = obtener_conexion_lectura()
+        registro = conn.execute("SELECT MAX(ID_Registro) FROM Registros").fetchone()[0]
+        sesion, fin = conn.execute("SELECT MAX(ID_Sesion), MAX(Fin) FROM Sesiones_Foco").fetchone()
+        return (registro or 0, sesion or 0, fin)
+    except Exception as e:
+        print(f"Error leyendo la versión del historial: {e}")
+        return None
 
 # En src/gestor_db.py (Añadir al final)
 
@@ -196,12 +1040,9 @@ def get_activo_por_id(activo_id):
     """
     Busca un activo por su ID. Útil para obtener la ficha completa de un archivo.
     """
-    conn = conectar_db()
-    if not conn: return None
-    
     try:
-        conn.row_factory = sqlite3.Row # Para poder acceder a las columnas por nombre
-        cursor = conn.cursor()
+        cursor = obtener_conexion_lectura().cursor()
+        cursor.row_factory = sqlite3.Row # Para poder acceder a las columnas por nombre
         # Seleccionamos todas las columnas, incluyendo el Resumen_Ejecutivo
         cursor.execute("SELECT * FROM Activos WHERE ID_Activo = ?", (activo_id,))
         activo = cursor.fetchone()
@@ -213,37 +1054,753 @@ def get_activo_por_id(activo_id):
     except Exception as e:
         print(f"Error al buscar activo por ID: {e}")
         return None
-    finally:
-        conn.close()
 
-# En src/gestor_db.py (Añadir al final)
+def obtener_version_activo(activo_id):
+    """
+    Lo mínimo para saber si un activo ha cambiado sin leer la fila entera:
+    (Hash_Contenido o Hash_Parcial, Fecha_Modificacion_DB). None si no existe.
+    """
+    try:
+        fila = obtener_conexion_lectura().execute("""
+            SELECT COALESCE(Hash_Contenido, Hash_Parcial), Fecha_Modificacion_DB
+            FROM Activos WHERE ID_Activo = ?
+        """, (activo_id,)).fetchone()
+        return tuple(fila) if fila else None
+    except Exception as e:
+        print(f"Error leyendo la versión del activo: {e}")
+        return None
 
-def get_activo_por_id(activo_id):
+# --- 4. HUELLAS POR NIVELES (ver huellas.py) ---
+
+def obtener_colisiones_huella():
     """
-    Busca un activo por su ID. Útil para obtener la ficha completa de un archivo.
+    Activos que aún solo tienen huella parcial y comparten (Peso_Bytes, Hash_Parcial)
+    con otro activo vivo: son los únicos a los que hay que calcular el hash completo.
+    Devuelve una lista de (ID_Activo, Ruta_Absoluta, Peso_Bytes, Mtime_ns).
     """
-    conn = conectar_db()
-    if not conn: return None
-    
     try:
-        conn.row_factory = sqlite3.Row # Para poder acceder a las columnas por nombre
-        cursor = conn.cursor()
-        # Seleccionamos todas las columnas, incluyendo el Resumen_Ejecutivo
-        cursor.execute("SELECT * FROM Activos WHERE ID_Activo = ?", (activo_id,))
-        activo = cursor.fetchone()
-        
-        if activo:
-            # Convertimos la fila a un diccionario para un fácil acceso en Python
-            return dict(activo)
+        return obtener_conexion_lectura().execute("""
+            SELECT a.ID_Activo, a.Ruta_Absoluta, a.Peso_Bytes, a.Mtime_ns
+            FROM Activos a
+            JOIN (
+                SELECT Peso_Bytes, Hash_Parcial FROM Activos
+                WHERE Eliminado = 0 AND Hash_Parcial IS NOT NULL
+                GROUP BY Peso_Bytes, Hash_Parcial HAVING COUNT(*) > 1
+            ) g ON a.Peso_Bytes = g.Peso_Bytes AND a.Hash_Parcial = g.Hash_Parcial
+            WHERE a.Eliminado = 0 AND a.Nivel_Hash = 'Parcial'
+        """).fetchall()
+    except Exception as e:
+        print(f"Error buscando colisiones de huella: {e}")
+        return []
+
+def _tarea_actualizar_hashes_completos(conn, filas):
+    cursor = conn.executemany("""
+        UPDATE Activos SET Hash_Contenido = ?, Nivel_Hash = 'Completo'
+        WHERE ID_Activo = ? AND Mtime_ns IS ?
+    """, filas)
+    return cursor.rowcount
+
+def actualizar_hashes_completos(filas):
+    """
+    Guarda hashes completos calculados a posteriori. 'filas' = [(hash, ID_Activo, Mtime_ns)].
+    El Mtime_ns evita pisar una fila si el archivo cambió mientras se hasheaba.
+    """
+    filas = list(filas)
+    if not filas:
+        return 0
+    try:
+        return ejecutar_escritura(_tarea_actualizar_hashes_completos, filas)
+    except Exception as e:
+        print(f"Error guardando hashes completos: {e}")
+        return 0
+
+def obtener_duplicados():
+    """
+    Grupos de activos vivos con el mismo contenido (mismo Hash_Contenido).
+    Devuelve {hash: [ruta, ...]}. Usar 'huellas.buscar_duplicados' para resolver antes
+    las colisiones de huella parcial.
+    """
+    duplicados = {}
+    try:
+        cursor = obtener_conexion_lectura().execute("""
+            SELECT Hash_Contenido, Ruta_Absoluta FROM Activos
+            WHERE Eliminado = 0 AND Hash_Contenido IN (
+                SELECT Hash_Contenido FROM Activos
+                WHERE Eliminado = 0 AND Hash_Contenido IS NOT NULL
+                GROUP BY Hash_Contenido HAVING COUNT(*) > 1
+            )
+            ORDER BY Hash_Contenido, Ruta_Absoluta
+        """)
+        for hash_val, ruta in cursor:
+            duplicados.setdefault(hash_val, []).append(ruta)
+    except Exception as e:
+        print(f"Error buscando duplicados: {e}")
+    return duplicados
+
+# --- 5. PUESTO DE CONTROL (DECISIONES PERSISTENTES) ---
+
+def cargar_decisiones_extension():
+    """Devuelve {extension: decision} con todas las decisiones guardadas."""
+    try:
+        return dict(obtener_conexion_lectura().execute(
+            "SELECT Extension, Decision FROM Decisiones_Extension"
+        ).fetchall())
+    except Exception as e:
+        print(f"Error cargando decisiones de extensión: {e}")
+        return {}
+
+def _tarea_guardar_decision(conn, extension, decision):
+    conn.execute("""
+        INSERT INTO Decisiones_Extension (Extension, Decision) VALUES (?, ?)
+        ON CONFLICT(Extension) DO UPDATE SET
+            Decision = excluded.Decision, Fecha_Decision = CURRENT_TIMESTAMP
+    """, (extension, decision))
+
+def guardar_decision_extension(extension, decision):
+    """Guarda (o cambia) la decisión 'procesar_siempre' / 'ignorar_siempre' de una extensión."""
+    ejecutar_escritura(_tarea_guardar_decision, extension, decision)
+
+def _tarea_registrar_pendientes(conn, filas):
+    conn.executemany("""
+        INSERT INTO Archivos_Pendientes (Ruta_Absoluta, Extension, Peso_Bytes, Mtime_ns)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(Ruta_Absoluta) DO UPDATE SET
+            Peso_Bytes = excluded.Peso_Bytes, Mtime_ns = excluded.Mtime_ns
+    """, filas)
+
+def registrar_archivos_pendientes(filas):
+    """
+    Apunta archivos de extensión desconocida a la espera de decisión.
+    'filas' = [(ruta, extension, peso, mtime_ns)]. No espera al commit.
+    """
+    filas = list(filas)
+    if filas:
+        futuro = ejecutar_escritura(_tarea_registrar_pendientes, filas, esperar=False)
+        futuro.add_done_callback(_avisar_error_escritura("Pendientes"))
+
+def resumen_archivos_pendientes(muestras=3):
+    """
+    Archivos pendientes agrupados por extensión, de más a menos frecuente.
+    Devuelve [(extension, num_archivos, bytes_totales, [rutas de muestra])].
+    """
+    try:
+        sincronizar_escrituras()
+        conn = obtener_conexion_lectura()
+        grupos = conn.execute("""
+            SELECT Extension, COUNT(*), COALESCE(SUM(Peso_Bytes), 0)
+            FROM Archivos_Pendientes GROUP BY Extension ORDER BY COUNT(*) DESC
+        """).fetchall()
+        return [
+            (ext, num, peso, [fila[0] for fila in conn.execute(
+                "SELECT Ruta_Absoluta FROM Archivos_Pendientes WHERE Extension = ? LIMIT ?", (ext, muestras)
+            )])
+            for ext, num, peso in grupos
+        ]
+    except Exception as e:
+        print(f"Error resumiendo archivos pendientes: {e}")
+        return []
+
+def obtener_archivos_pendientes(extension):
+    """Rutas pendientes de una extensión."""
+    try:
+        return [fila[0] for fila in obtener_conexion_lectura().execute(
+            "SELECT Ruta_Absoluta FROM Archivos_Pendientes WHERE Extension = ?", (extension,)
+        )]
+    except Exception as e:
+        print(f"Error leyendo archivos pendientes: {e}")
+        return []
+
+def borrar_archivos_pendientes(extension):
+    """Saca de la cola de revisión todos los archivos de una extensión ya decidida."""
+    ejecutar_escritura(
+        lambda conn: conn.execute("DELETE FROM Archivos_Pendientes WHERE Extension = ?", (extension,))
+    )
+
+# --- 6. CACHÉ DE RESPUESTAS DEL LLM (ver gestor_ollama.CacheRespuestas) ---
+
+def _tarea_tocar_respuesta(conn, clave, ahora):
+    conn.execute("UPDATE Cache_Respuestas_LLM SET Ultimo_Acceso = ? WHERE Clave = ?", (ahora, clave))
+
+def leer_respuesta_cache(clave):
+    """Devuelve la respuesta memorizada (si existe y no ha caducado) y la marca como usada."""
+    ahora = time.time()
+    try:
+        fila = obtener_conexion_lectura().execute("""
+            SELECT Respuesta FROM Cache_Respuestas_LLM
+            WHERE Clave = ? AND (Expira IS NULL OR Expira > ?)
+        """, (clave, ahora)).fetchone()
+    except Exception as e:
+        print(f"Error leyendo la caché de respuestas: {e}")
+        return None
+    if fila is None:
         return None
+    futuro = ejecutar_escritura(_tarea_tocar_respuesta, clave, ahora, esperar=False)
+    futuro.add_done_callback(_avisar_error_escritura("Caché LLM"))
+    return fila[0]
+
+def _tarea_guardar_respuesta(conn, clave, modelo, tipo, respuesta, ttl, max_entradas):
+    ahora = time.time()
+    conn.execute("""
+        INSERT OR REPLACE INTO Cache_Respuestas_LLM
+            (Clave, Modelo, Tipo_Llamada, Respuesta, Fecha_Creacion, Ultimo_Acceso, Expira)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (clave, modelo, tipo, respuesta, ahora, ahora, ahora + ttl if ttl else None))
+    # Limpieza: primero lo caducado y luego, si aún sobra, lo menos usado
+    conn.execute("DELETE FROM Cache_Respuestas_LLM WHERE Expira IS NOT NULL AND Expira <= ?", (ahora,))
+    conn.execute("""
+        DELETE FROM Cache_Respuestas_LLM WHERE Clave IN (
+            SELECT Clave FROM Cache_Respuestas_LLM ORDER BY Ultimo_Acceso
+            LIMIT MAX(0, (SELECT COUNT(*) FROM Cache_Respuestas_LLM) - ?)
+        )
+    """, (max_entradas,))
+
+def guardar_respuesta_cache(clave, modelo, tipo, respuesta, ttl, max_entradas):
+    """Memoriza una respuesta ('ttl' en segundos, None = sin caducidad). No espera al commit."""
+    futuro = ejecutar_escritura(
+        _tarea_guardar_respuesta, clave, modelo, tipo, respuesta, ttl, max_entradas, esperar=False
+    )
+    futuro.add_done_callback(_avisar_error_escritura("Caché LLM"))
+    return futuro
+
+def vaciar_cache_respuestas():
+    """Borra todas las respuestas memorizadas. Devuelve cuántas había."""
+    return ejecutar_escritura(lambda conn: conn.execute("DELETE FROM Cache_Respuestas_LLM").rowcount)
+
+# --- 7. RAG: ESTADO DE INDEXADO Y FRAGMENTOS (ver indice_vectorial.py) ---
+
+def obtener_activos_por_estado(estado="Pendiente", limite=100):
+    """Activos vivos en un Estado_Procesamiento dado (dicts con las columnas de Activos)."""
+    try:
+        cursor = obtener_conexion_lectura().cursor()
+        cursor.row_factory = sqlite3.Row
+        cursor.execute("""
+            SELECT * FROM Activos WHERE Estado_Procesamiento = ? AND Eliminado = 0
+            ORDER BY ID_Activo LIMIT ?
+        """, (estado, limite))
+        return [dict(fila) for fila in cursor.fetchall()]
     except Exception as e:
-        print(f"Error al buscar activo por ID: {e}")
+        print(f"Error leyendo activos en estado {estado}: {e}")
+        return []
+
+def actualizar_estado_activo(activo_id, estado):
+    ejecutar_escritura(
+        lambda conn: conn.execute(
+            "UPDATE Activos SET Estado_Procesamiento = ? WHERE ID_Activo = ?", (estado, activo_id)
+        )
+    )
+
+# Ciclo de vida del indexado en segundo plano (ver trabajador_indexado.py):
+#   Pendiente -> Procesando -> Indexado / Sin_Texto / Error
+# Cada paso es un UPDATE condicionado al estado anterior, así que nunca dos trabajadores
+# cogen el mismo activo y un activo que cambia en disco a mitad (el upsert lo devuelve
+# a 'Pendiente') no se marca como terminado con el contenido viejo.
+
+def _tarea_reclamar_pendientes(conn, limite):
+    cursor = conn.execute("""
+        UPDATE Activos SET Estado_Procesamiento = 'Procesando'
+        WHERE ID_Activo IN (
+            SELECT ID_Activo FROM Activos
+            WHERE Estado_Procesamiento = 'Pendiente' AND Eliminado = 0
+            ORDER BY ID_Activo LIMIT ?
+        )
+        RETURNING *
+    """, (limite,))
+    columnas = [descripcion[0] for descripcion in cursor.description]
+    activos = [dict(zip(columnas, fila)) for fila in cursor.fetchall()]
+    return sorted(activos, key=lambda activo: activo["ID_Activo"])
+
+def reclamar_activos_pendientes(limite=20):
+    """
+    Pasa hasta 'limite' activos de 'Pendiente' a 'Procesando' en una sola sentencia
+    y los devuelve (dicts con las columnas de Activos, por ID).
+    """
+    try:
+        return ejecutar_escritura(_tarea_reclamar_pendientes, limite)
+    except Exception as e:
+        print(f"Error reclamando activos pendientes: {e}")
+        return []
+
+def terminar_activo(activo_id, estado):
+    """
+    Cierra el procesado de un activo reclamado ('Procesando' -> 'estado').
+    Devuelve False si entretanto cambió (volvió a 'Pendiente' o se borró): se deja como está.
+    """
+    return ejecutar_escritura(
+        lambda conn: conn.execute(
+            "UPDATE Activos SET Estado_Procesamiento = ? WHERE ID_Activo = ? AND Estado_Procesamiento = 'Procesando'",
+            (estado, activo_id)
+        ).rowcount
+    ) == 1
+
+def recuperar_activos_procesando():
+    """
+    Tras una caída, lo que quedó a medias ('Procesando') vuelve a 'Pendiente'.
+    Lo ya terminado no se toca. Llamar solo al arrancar el (único) trabajador.
+    """
+    return ejecutar_escritura(
+        lambda conn: conn.execute(
+            "UPDATE Activos SET Estado_Procesamiento = 'Pendiente' WHERE Estado_Procesamiento = 'Procesando'"
+        ).rowcount
+    )
+
+def contar_activos_por_estado():
+    """{Estado_Procesamiento: número de activos vivos}."""
+    try:
+        return dict(obtener_conexion_lectura().execute(
+            "SELECT Estado_Procesamiento, COUNT(*) FROM Activos WHERE Eliminado = 0 GROUP BY Estado_Procesamiento"
+        ).fetchall())
+    except Exception as e:
+        print(f"Error contando activos por estado: {e}")
+        return {}
+
+def _tarea_guardar_fragmentos(conn, activo_id, textos):
+    anteriores = [fila[0] for fila in conn.execute(
+        "SELECT ID_Fragmento FROM Fragmentos WHERE ID_Activo = ?", (activo_id,)
+    )]
+    conn.execute("DELETE FROM Fragmentos WHERE ID_Activo = ?", (activo_id,))
+    nuevos = [
+        conn.execute(
+            "INSERT INTO Fragmentos (ID_Activo, Orden, Texto) VALUES (?, ?, ?)", (activo_id, orden, texto)
+        ).lastrowid
+        for orden, texto in enumerate(textos)
+    ]
+    return anteriores, nuevos
+
+def guardar_fragmentos(activo_id, textos):
+    """
+    Sustituye los fragmentos de un activo. Devuelve (IDs borrados, IDs nuevos en orden).
+    """
+    return ejecutar_escritura(_tarea_guardar_fragmentos, activo_id, list(textos))
+
+def obtener_fragmentos(ids_fragmento):
+    """
+    Devuelve {ID_Fragmento: (ID_Activo, Orden, Texto)} de los IDs pedidos. Los de activos
+    borrados (lápida o fila ya sustituida) no se devuelven aunque aún sigan en el índice.
+    """
+    ids = [int(i) for i in ids_fragmento]
+    if not ids:
+        return {}
+    try:
+        marcas = ",".join("?" * len(ids))
+        cursor = obtener_conexion_lectura().execute(f"""
+            SELECT f.ID_Fragmento, f.ID_Activo, f.Orden, f.Texto
+            FROM Fragmentos f JOIN Activos a ON a.ID_Activo = f.ID_Activo AND a.Eliminado = 0
+            WHERE f.ID_Fragmento IN ({marcas})
+        """, ids)
+        return {fila[0]: fila[1:] for fila in cursor}
+    except Exception as e:
+        print(f"Error leyendo fragmentos: {e}")
+        return {}
+
+def obtener_activos_con_fragmentos_eliminados(limite=1000):
+    """IDs de activo con fragmentos pero con lápida o ya sin fila en Activos (a purgar del RAG)."""
+    try:
+        return [fila[0] for fila in obtener_conexion_lectura().execute("""
+            SELECT f.ID_Activo FROM (SELECT DISTINCT ID_Activo FROM Fragmentos) f
+            LEFT JOIN Activos a ON a.ID_Activo = f.ID_Activo
+            WHERE a.ID_Activo IS NULL OR a.Eliminado = 1
+            LIMIT ?
+        """, (limite,))]
+    except Exception as e:
+        print(f"Error buscando fragmentos de activos eliminados: {e}")
+        return []
+
+def borrar_fragmentos_activos(ids_activo):
+    """Borra los fragmentos de esos activos. Devuelve cuántos."""
+    filas = [(int(i),) for i in ids_activo]
+    if not filas:
+        return 0
+    return ejecutar_escritura(
+        lambda conn: conn.executemany("DELETE FROM Fragmentos WHERE ID_Activo = ?", filas).rowcount
+    )
+
+# --- 8. BÚSQUEDA DE TEXTO COMPLETO (FTS5, ver migración 7) ---
+
+# Peso de cada columna de Activos_FTS en el ranking BM25: Nombre, Ruta, Resumen, Etiquetas, Texto
+PESOS_BM25 = (10.0, 4.0, 3.0, 6.0, 1.0)
+MAX_CARACTERES_TEXTO_FTS = 200_000
+
+def _termino_fts(palabra):
+    """Palabra -> término FTS5 entre comillas y con prefijo ("unif" encuentra "Uniformidad")."""
+    return '"' + palabra.replace('"', '""') + '"*'
+
+def construir_consulta_fts(texto, unir="AND"):
+    """
+    Traduce lo que escribe el usuario a sintaxis FTS5 (sin riesgo de errores de sintaxis):
+      - cada palabra es un prefijo: "unif amare" -> "unif"* AND "amare"*
+      - una palabra con / o \\ es un trozo de ruta: sus partes deben ir SEGUIDAS en la
+        ruta ("amare/novo" -> Ruta : "amare novo"*)
+    Devuelve None si no queda ninguna palabra.
+    """
+    partes = []
+    for trozo in texto.split():
+        palabras = re.findall(r"\w+", trozo.lower())
+        if not palabras:
+            continue
+        if "/" in trozo or "\\" in trozo:
+            frase = " ".join(palabras).replace('"', '""')
+            partes.append(f'Ruta : "{frase}"*')
+        else:
+            partes.extend(_termino_fts(palabra) for palabra in palabras)
+    return f" {unir} ".join(partes) or None
+
+def buscar_activos(texto, limite=20, extension=None):
+    """
+    Busca activos vivos por nombre, carpetas de la ruta, resumen, etiquetas y texto.
+    Ordena por BM25. Si ningún activo tiene TODAS las palabras, repite con cualquiera
+    de ellas (útil para frases como "la hoja de uniformidad de Amare Novo").
+    Devuelve una lista de dicts {ID_Activo, Ruta_Absoluta, Nombre_Archivo, Puntuacion, Extracto}.
+    """
+    sincronizar_fts()
+    filtro_extension = "AND a.Extension = ?" if extension else ""
+    sql = f"""
+        SELECT a.ID_Activo, a.Ruta_Absoluta, a.Nombre_Archivo,
+               bm25(Activos_FTS, {", ".join(str(p) for p in PESOS_BM25)}) AS puntuacion,
+               snippet(Activos_FTS, -1, '[', ']', '…', 12)
+        FROM Activos_FTS JOIN Activos a ON a.ID_Activo = Activos_FTS.rowid
+        WHERE Activos_FTS MATCH ? AND a.Eliminado = 0 {filtro_extension}
+        ORDER BY puntuacion LIMIT ?
+    """
+    for unir in ("AND", "OR"):
+        consulta = construir_consulta_fts(texto, unir)
+        if consulta is None:
+            return []
+        parametros = [consulta] + ([extension.lower()] if extension else []) + [limite]
+        try:
+            filas = obtener_conexion_lectura().execute(sql, parametros).fetchall()
+        except Exception as e:
+            print(f"Error en la búsqueda de texto: {e}")
+            return []
+        if filas:
+            break
+    # bm25() devuelve valores negativos: más negativo = más relevante
+    return [
+        {"ID_Activo": id_activo, "Ruta_Absoluta": ruta, "Nombre_Archivo": nombre,
+         "Puntuacion": -puntuacion, "Extracto": extracto}
+        for id_activo, ruta, nombre, puntuacion, extracto in filas
+    ]
+
+def _ultimo_id_fts(conn):
+    fila = conn.execute("SELECT rowid FROM Activos_FTS ORDER BY rowid DESC LIMIT 1").fetchone()
+    return fila[0] if fila else 0
+
+def _tarea_sincronizar_fts(conn):
+    """
+    Pone Activos_FTS al día en unas pocas sentencias: aplica la cola de los triggers
+    (cambios y borrados) y añade las altas (ID_Activo por encima del último indexado).
+    Devuelve cuántas filas de la cola se han aplicado.
+    """
+    ultimo = _ultimo_id_fts(conn)
+    hay_altas = (conn.execute("SELECT MAX(ID_Activo) FROM Activos").fetchone()[0] or 0) > ultimo
+    hay_cola = conn.execute("SELECT 1 FROM Activos_FTS_Cola LIMIT 1").fetchone() is not None
+    if hay_cola:
+        # Borrados de Activos
+        conn.execute("""
+            DELETE FROM Activos_FTS WHERE rowid IN (
+                SELECT c.ID_Activo FROM Activos_FTS_Cola c
+                WHERE NOT EXISTS (SELECT 1 FROM Activos a WHERE a.ID_Activo = c.ID_Activo)
+            )
+        """)
+        # Cambios en activos ya indexados (se conserva su columna Texto)
+        conn.execute("""
+            UPDATE Activos_FTS SET (Nombre, Ruta, Resumen, Etiquetas) = (
+                SELECT Nombre_Archivo, Ruta_Absoluta, Resumen_Ejecutivo, Etiquetas_Confirmadas
+                FROM Activos WHERE ID_Activo = Activos_FTS.rowid
+            )
+            WHERE rowid IN (
+                SELECT c.ID_Activo FROM Activos_FTS_Cola c
+                WHERE EXISTS (SELECT 1 FROM Activos a WHERE a.ID_Activo = c.ID_Activo)
+            )
+        """)
+    if hay_altas:
+        conn.execute("""
+            INSERT INTO Activos_FTS (rowid, Nombre, Ruta, Resumen, Etiquetas)
+            SELECT ID_Activo, Nombre_Archivo, Ruta_Absoluta, Resumen_Ejecutivo, Etiquetas_Confirmadas
+            FROM Activos WHERE ID_Activo > ?
+        """, (ultimo,))
+    return conn.execute("DELETE FROM Activos_FTS_Cola").rowcount if hay_cola else 0
+
+def sincronizar_fts():
+    """
+    Deja Activos_FTS al día con todo lo escrito hasta ahora. Devuelve cuántos activos ha aplicado.
+    Va por el escritor (orden FIFO): incluye cualquier alta aún sin confirmar.
+    """
+    try:
+        return ejecutar_escritura(_tarea_sincronizar_fts)
+    except Exception as e:
+        print(f"Error sincronizando el índice de texto: {e}")
+        return 0
+
+def _tarea_actualizar_texto_fts(conn, activo_id, texto):
+    _tarea_sincronizar_fts(conn) # Que la fila del activo exista ya en Activos_FTS
+    conn.execute("UPDATE Activos_FTS SET Texto = ? WHERE rowid = ?", (texto, activo_id))
+
+def actualizar_texto_fts(activo_id, texto):
+    """Guarda en el índice de texto completo el contenido extraído de un activo (recortado)."""
+    futuro = ejecutar_escritura(
+        _tarea_actualizar_texto_fts, activo_id, (texto or "")[:MAX_CARACTERES_TEXTO_FTS], esperar=False
+    )
+    futuro.add_done_callback(_avisar_error_escritura("Texto FTS"))
+    return futuro
+
+# --- 9. RESÚMENES EJECUTIVOS (ver resumidor.py) ---
+
+def obtener_activos_sin_resumen(limite=500, desde_id=0, estados=("Indexado",)):
+    """
+    Activos vivos sin Resumen_Ejecutivo cuyo texto ya se ha podido leer (por defecto los 'Indexado'),
+    con ID mayor que 'desde_id' (para recorrerlos por páginas). Dicts con las columnas de Activos.
+    """
+    try:
+        marcas = ",".join("?" * len(estados))
+        cursor = obtener_conexion_lectura().cursor()
+        cursor.row_factory = sqlite3.Row
+        cursor.execute(f"""
+            SELECT * FROM Activos
+            WHERE Estado_Procesamiento IN ({marcas}) AND Resumen_Ejecutivo IS NULL
+              AND Eliminado = 0 AND ID_Activo > ?
+            ORDER BY ID_Activo LIMIT ?
+        """, (*estados, desde_id, limite))
+        return [dict(fila) for fila in cursor.fetchall()]
+    except Exception as e:
+        print(f"Error leyendo activos sin resumen: {e}")
+        return []
+
+def _tarea_guardar_resumenes(conn, filas):
+    # Solo si el archivo sigue siendo el que se resumió (mismo Mtime_ns). Fecha_Modificacion_DB
+    # cambia para que el contexto del LLM (CacheContexto.foco) vea el resumen nuevo.
+    return conn.executemany("""
+        UPDATE Activos SET Resumen_Ejecutivo = ?, Fecha_Modificacion_DB = CURRENT_TIMESTAMP
+        WHERE ID_Activo = ? AND Mtime_ns IS ?
+    """, filas).rowcount
+
+def guardar_resumenes(filas):
+    """
+    Guarda resúmenes en una sola transacción. 'filas' = [(resumen, id_activo, mtime_ns)].
+    Devuelve cuántos se han guardado (los de archivos que cambiaron entretanto se descartan).
+    """
+    filas = list(filas)
+    if not filas:
+        return 0
+    return ejecutar_escritura(_tarea_guardar_resumenes, filas)
+
+# --- 10. CACHÉ DE TEXTO EXTRAÍDO (ver extractores.py) ---
+
+def leer_textos_extraidos(hashes, version_minima=0):
+    """
+    {Hash_Contenido: (texto o None, error o None)} de los hashes pedidos que ya se
+    extrajeron con la versión de extractores 'version_minima' o posterior. Los fallos
+    pasajeros cuya fecha de reintento ya ha llegado no se devuelven (toca reintentarlos).
+    """
+    hashes = list(hashes)
+    resultado = {}
+    ahora = _marca_tiempo_utc()
+    try:
+        conn = obtener_conexion_lectura()
+        for i in range(0, len(hashes), 500): # Límite de parámetros de SQLite
+            trozo = hashes[i:i + 500]
+            marcas = ",".join("?" * len(trozo))
+            for hash_val, texto, error in conn.execute(f"""
+                SELECT Hash_Contenido, Texto, Error FROM Textos_Extraidos
+                WHERE Hash_Contenido IN ({marcas}) AND Version_Extractor >= ?
+                  AND (Reintentar_Desde IS NULL OR Reintentar_Desde > ?)
+            """, (*trozo, version_minima, ahora)):
+                resultado[hash_val] = (zlib.decompress(texto).decode("utf-8") if texto is not None else None, error)
+    except Exception as e:
+        print(f"Error leyendo la caché de texto extraído: {e}")
+    return resultado
+
+def guardar_textos_extraidos(filas, version):
+    """
+    Guarda resultados de extracción en una transacción. 'filas' = [(hash, texto o None, error o None)].
+    """
+    filas = [
+        (hash_val, version, zlib.compress(texto.encode("utf-8")) if texto is not None else None,
+         len(texto) if texto is not None else None, error)
+        for hash_val, texto, error in filas
+    ]
+    if not filas:
+        return 0
+    return ejecutar_escritura(lambda conn: conn.executemany("""
+        INSERT OR REPLACE INTO Textos_Extraidos (Hash_Contenido, Version_Extractor, Texto, Caracteres, Error)
+        VALUES (?, ?, ?, ?, ?)
+    """, filas).rowcount)
+
+def guardar_fallos_extraccion(filas, version, espera, max_intentos):
+    """
+    Guarda fallos pasajeros de extracción (timeout, proceso caído, archivo bloqueado).
+    'filas' = [(hash, error)]. Se reintentan pasados 'espera' segundos; al fallar
+    'max_intentos' veces seguidas el error queda como definitivo.
+    """
+    reintentar = _marca_tiempo_utc(time.time() + espera) if max_intentos > 1 else None
+    filas = [(hash_val, version, error, reintentar) for hash_val, error in filas]
+    if not filas:
+        return 0
+    return ejecutar_escritura(lambda conn: conn.executemany("""
+        INSERT INTO Textos_Extraidos (Hash_Contenido, Version_Extractor, Error, Intentos, Reintentar_Desde)
+        VALUES (?, ?, ?, 1, ?)
+        ON CONFLICT(Hash_Contenido) DO UPDATE SET
+            Version_Extractor = excluded.Version_Extractor,
+            Texto = NULL,
+            Caracteres = NULL,
+            Error = excluded.Error,
+            Fecha_Extraccion = CURRENT_TIMESTAMP,
+            Intentos = CASE WHEN Textos_Extraidos.Reintentar_Desde IS NULL THEN 1
+                            ELSE Textos_Extraidos.Intentos + 1 END,
+            Reintentar_Desde = CASE WHEN Textos_Extraidos.Reintentar_Desde IS NOT NULL
+                                     AND Textos_Extraidos.Intentos + 1 >= ? THEN NULL
+                                    ELSE excluded.Reintentar_Desde END
+    """, [fila + (max_intentos,) for fila in filas]).rowcount)
+
+def actualizar_tokens_activos(filas):
+    """Sustituye la estimación por tamaño con el conteo del texto real. 'filas' = [(tokens, id_activo)]."""
+    filas = list(filas)
+    if not filas:
         return None
-    finally:
-        conn.close()
+    futuro = ejecutar_escritura(
+        lambda conn: conn.executemany("UPDATE Activos SET Estimacion_Tokens = ? WHERE ID_Activo = ?", filas),
+        esperar=False
+    )
+    futuro.add_done_callback(_avisar_error_escritura("Tokens"))
+    return futuro
+
+# --- 11. MÉTRICAS DE RECURSOS (ver monitores/metricas_recursos.py) ---
+
+# Columnas tras (Resolucion, Instante), en el orden de las filas que se guardan y se leen
+COLUMNAS_METRICAS = (
+    "Muestras", "CPU_Media", "CPU_Max", "RAM_Media", "RAM_Max", "Disco_Lectura", "Disco_Escritura",
+    "Red_Recibida", "Red_Enviada", "CPU_Proceso_Top", "Proceso_Top",
+)
+
+def guardar_metricas(resolucion, filas):
+    """
+    Guarda filas de la serie sin esperar al commit. 'filas' = [(instante, *COLUMNAS_METRICAS)].
+    Una fila que ya exista (mismo intervalo) se sustituye.
+    """
+    filas = [(resolucion, *fila) for fila in filas]
+    if not filas:
+        return None
+    marcas = ",".join("?" * (len(COLUMNAS_METRICAS) + 2))
+    futuro = ejecutar_escritura(
+        lambda conn: conn.executemany(f"""
+            INSERT OR REPLACE INTO Metricas_Recursos (Resolucion, Instante, {", ".join(COLUMNAS_METRICAS)})
+            VALUES ({marcas})
+        """, filas),
+        esperar=False
+    )
+    futuro.add_done_callback(_avisar_error_escritura("Métricas"))
+    return futuro
+
+def leer_metricas(resolucion, desde, hasta=None):
+    """[(instante, *COLUMNAS_METRICAS)] de 'resolucion' con desde <= Instante < hasta, por orden."""
+    try:
+        return obtener_conexion_lectura().execute(f"""
+            SELECT Instante, {", ".join(COLUMNAS_METRICAS)} FROM Metricas_Recursos
+            WHERE Resolucion = ? AND Instante >= ? AND Instante < ?
+            ORDER BY Instante
+        """, (resolucion, desde, hasta if hasta is not None else 2**62)).fetchall()
+    except Exception as e:
+        print(f"Error leyendo métricas: {e}")
+        return []
+
+def purgar_metricas(retencion, ahora):
+    """Borra lo que ha salido de la retención. 'retencion' = {resolucion: segundos que se conservan}."""
+    def _tarea(conn):
+        return sum(
+            conn.execute("DELETE FROM Metricas_Recursos WHERE Resolucion = ? AND Instante < ?",
+                         (resolucion, ahora - segundos)).rowcount
+            for resolucion, segundos in retencion.items()
+        )
+    futuro = ejecutar_escritura(_tarea, esperar=False)
+    futuro.add_done_callback(_avisar_error_escritura("Métricas"))
+    return futuro
+
+# --- 12. SESIONES DE FOCO (ver monitores/monitor_contexto.py) ---
+
+def _tarea_guardar_sesion_foco(conn, sesion_id, inicio, fin, duracion, titulo, proceso, reanudaciones,
+                               id_activo, confianza):
+    if sesion_id is None:
+        return conn.execute("""
+            INSERT INTO Sesiones_Foco (Inicio, Fin, Duracion_Segundos, Titulo, Proceso, Reanudaciones,
+                                       ID_Activo_Asociado, Confianza_Enlace)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (inicio, fin, duracion, titulo, proceso, reanudaciones, id_activo, confianza)).lastrowid
+    conn.execute("""
+        UPDATE Sesiones_Foco SET Fin = ?, Duracion_Segundos = ?, Reanudaciones = ? WHERE ID_Sesion = ?
+    """, (fin, duracion, reanudaciones, sesion_id))
+    return sesion_id
+
+def guardar_sesion_foco(sesion_id, inicio, fin, duracion, titulo, proceso=None, reanudaciones=0,
+                        id_activo=None, confianza=None):
+    """
+    Crea (sesion_id=None) o alarga una sesión de foco. 'inicio'/'fin' en epoch, 'duracion'
+    en segundos. El enlace con el activo (id_activo, confianza) solo se escribe al crearla.
+    Devuelve el ID_Sesion (o None si falló).
+    """
+    try:
+        return ejecutar_escritura(
+            _tarea_guardar_sesion_foco, sesion_id, _marca_tiempo_utc(inicio), _marca_tiempo_utc(fin),
+            int(duracion), titulo, proceso, reanudaciones, id_activo, confianza
+        )
+    except Exception as e:
+        print(f"Error guardando la sesión de foco '{titulo}': {e}")
+        return sesion_id
+
+# --- 13. ENLACE TÍTULO DE VENTANA -> ACTIVO (ver enlazador_activos.py) ---
+
+def obtener_activos_modificados_desde(marca="", tam_bloque=5000):
+    """
+    Genera bloques de (ID_Activo, Ruta_Absoluta, Nombre_Archivo, Extension, Eliminado, Mtime_ns,
+    Fecha_Modificacion_DB) con Fecha_Modificacion_DB >= 'marca' ("" = todos), incluidas las lápidas.
+    """
+    cursor = obtener_conexion_lectura().execute("""
+        SELECT ID_Activo, Ruta_Absoluta, Nombre_Archivo, Extension, Eliminado, Mtime_ns, Fecha_Modificacion_DB
+        FROM Activos WHERE Fecha_Modificacion_DB >= ?
+    """, (marca,))
+    while True:
+        filas = cursor.fetchmany(tam_bloque)
+        if not filas:
+            return
+        yield filas
+
+# Tablas con títulos de ventana que enlazar: (clave, texto del título, proceso, filtro)
+_ENLAZABLES = {
+    "Registros": ("ID_Registro", "Contexto_Crudo", "NULL", "Tipo_Evento IN ('FOCO_VENTANA', 'FOCO')"),
+    "Sesiones_Foco": ("ID_Sesion", "Titulo", "Proceso", "1"),
+}
+
+def obtener_focos_sin_enlazar(tabla, desde_id=0, limite=2000):
+    """[(id, título, proceso)] de 'tabla' (Registros o Sesiones_Foco) aún sin Confianza_Enlace."""
+    clave, titulo, proceso, filtro = _ENLAZABLES[tabla]
+    try:
+        return obtener_conexion_lectura().execute(f"""
+            SELECT {clave}, {titulo}, {proceso} FROM {tabla}
+            WHERE {clave} > ? AND Confianza_Enlace IS NULL AND {filtro}
+            ORDER BY {clave} LIMIT ?
+        """, (desde_id, limite)).fetchall()
+    except Exception as e:
+        print(f"Error leyendo focos sin enlazar de {tabla}: {e}")
+        return []
+
+def guardar_enlaces(tabla, filas):
+    """Rellena el enlace en una transacción. 'filas' = [(id_activo o None, confianza, id de la fila)]."""
+    clave = _ENLAZABLES[tabla][0]
+    filas = list(filas)
+    if not filas:
+        return 0
+    return ejecutar_escritura(lambda conn: conn.executemany(f"""
+        UPDATE {tabla} SET ID_Activo_Asociado = ?, Confianza_Enlace = ? WHERE {clave} = ?
+    """, filas).rowcount)
 
 if __name__ == "__main__":
-    # Si ejecutamos este archivo directamente, inicializa la DB.
+    # Si ejecutamos este archivo directamente, inicializa (o migra) la DB.
+    # python -m src.gestor_db --planes  -> comprueba además los planes de las consultas calientes
+    # python -m src.gestor_db --buscar uniformidad amare/novo
+    import sys
     inicializar_base_de_datos()
+    if "--buscar" in sys.argv:
+        for activo in buscar_activos(" ".join(sys.argv[sys.argv.index("--buscar") + 1:])):
+            print(f"{activo['Puntuacion']:6.2f}  {activo['Ruta_Absoluta']}")
+    if "--planes" in sys.argv:
+        sys.exit(1 if verificar_planes_consulta() else 0)
 
 # ---------------------------------------------------------------------------------------------------------------------
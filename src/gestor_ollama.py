@@ -1,75 +1,439 @@
 # src/gestor_ollama.py
+import asyncio
+import hashlib
+import threading
+import time
 import requests
 import json
+from requests.adapters import HTTPAdapter
 from src import gestor_db
+from src import estimador_tokens
 from pathlib import Path
 
 # --- CONFIGURACIÓN DE MODELOS (Necesitarás tener Ollama corriendo) ---
-URL_OLLAMA = "http://localhost:11434/api/generate"
+URL_BASE_OLLAMA = "http://localhost:11434"
+URL_OLLAMA = f"{URL_BASE_OLLAMA}/api/generate"
 MODELO_LIGERO = "mistral:latest" # Ejemplo de 7B/8B
 MODELO_PESADO = "mixtral:latest" # Ejemplo de 24B/70B
+MODELO_EMBEDDINGS = "nomic-embed-text" # Vectores para el RAG (ver indice_vectorial.py)
+
+# --- CLIENTE HTTP ---
+KEEP_ALIVE = "30m"          # Cuánto tiempo mantiene Ollama el modelo cargado en RAM/VRAM tras la última llamada
+TIMEOUT_CONEXION_OLLAMA = 5 # Segundos para conectar con el servidor
+TIMEOUT_LECTURA_OLLAMA = 120 # Segundos máximos SIN recibir nada (ya no es el tiempo total de la respuesta)
+CONEXIONES_OLLAMA = 4       # Conexiones reutilizables en el pool (consultas concurrentes)
+MAX_ESPERA_RECURSOS_PESADO = 300 # Segundos que espera el LLM pesado a que el PC quede libre (luego va igual)
+
+# --- CACHÉ DE RESPUESTAS ---
+# Segundos que vale una respuesta memorizada según el tipo de llamada (None = no caduca).
+# El triage depende del historial reciente: caduca pronto. Un resumen solo cambia si
+# cambia el prompt (y el prompt incluye el contenido): puede durar mucho.
+TTL_RESPUESTAS = {
+    "ligero": 60 * 60,
+    "pesado": 30 * 24 * 60 * 60,
+}
+MAX_RESPUESTAS_CACHE = 5000  # Por encima se expulsan las menos usadas (LRU)
+
+# --- PRESUPUESTO DE CONTEXTO ---
+# Tokens máximos del contexto (sin contar la instrucción) por tipo de llamada. Cada token
+# de más es tiempo de 'prefill' antes de la primera palabra: en un 7B/24B local se nota.
+PRESUPUESTO_CONTEXTO = {
+    "ligero": 1536,
+    "pesado": 6144,
+}
+MODELO_POR_TIPO = {"ligero": MODELO_LIGERO, "pesado": MODELO_PESADO}
+
+
+class ErrorOllama(Exception):
+    """Error devuelto por el propio servidor de Ollama dentro de la respuesta."""
+
+
+class ClienteOllama:
+    """
+    Cliente de Ollama con una sesión HTTP persistente (pool de conexiones keep-alive)
+    y respuestas en streaming (NDJSON: una línea JSON por fragmento de texto).
+    Tras cada respuesta completa deja sus métricas en 'ultimas_metricas[modelo]'
+    (prompt_eval_count, eval_count, duraciones, tokens/s y tiempo al primer token)
+    y, si se pasa un dict 'metricas', también en él (llamadas concurrentes al mismo modelo).
+    """
+    def __init__(self, url_base=URL_BASE_OLLAMA, keep_alive=KEEP_ALIVE,
+                 timeout=(TIMEOUT_CONEXION_OLLAMA, TIMEOUT_LECTURA_OLLAMA), conexiones=CONEXIONES_OLLAMA):
+        self.url_base = url_base.rstrip("/")
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.sesion = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=conexiones)
+        self.sesion.mount("http://", adaptador)
+        self.sesion.mount("https://", adaptador)
+        self.ultimas_metricas = {}
+        self._lock = threading.Lock()
+
+    def _payload(self, prompt, modelo, opciones, stream):
+        payload = {"model": modelo, "prompt": prompt, "stream": stream, "keep_alive": self.keep_alive}
+        if opciones:
+            payload["options"] = opciones
+        return payload
+
+    def _guardar_metricas(self, modelo, datos, inicio, primer_token, destino=None):
+        metricas = {
+            clave: datos.get(clave)
+            for clave in ("prompt_eval_count", "eval_count", "prompt_eval_duration",
+                          "eval_duration", "load_duration", "total_duration")
+        }
+        if datos.get("eval_count") and datos.get("eval_duration"):
+            metricas["tokens_por_segundo"] = datos["eval_count"] / (datos["eval_duration"] / 1e9)
+        metricas["segundos_primer_token"] = (primer_token - inicio) if primer_token else None
+        metricas["segundos_total"] = time.monotonic() - inicio
+        with self._lock:
+            self.ultimas_metricas[modelo] = metricas
+        if destino is not None:
+            destino.update(metricas)
+
+    def generar_stream(self, prompt, modelo, opciones=None, cancelar=None, metricas=None):
+        """
+        Generador: va devolviendo los fragmentos de texto según llegan.
+        'cancelar' (threading.Event) corta la respuesta en el siguiente fragmento;
+        al cerrar la conexión Ollama deja de generar.
+        """
+        inicio = time.monotonic()
+        primer_token = None
+        payload = self._payload(prompt, modelo, opciones, stream=True)
+        with self.sesion.post(f"{self.url_base}/api/generate", json=payload,
+                              stream=True, timeout=self.timeout) as respuesta:
+            respuesta.raise_for_status()
+            for linea in respuesta.iter_lines():
+                if cancelar is not None and cancelar.is_set():
+                    return
+                if not linea:
+                    continue
+                datos = json.loads(linea)
+                if "error" in datos:
+                    raise ErrorOllama(datos["error"])
+                fragmento = datos.get("response")
+                if fragmento:
+                    if primer_token is None:
+                        primer_token = time.monotonic()
+                    yield fragmento
+                if datos.get("done"):
+                    self._guardar_metricas(modelo, datos, inicio, primer_token, metricas)
+                    # Lo que el modelo ha contado de verdad afina el estimador de tokens
+                    estimador_tokens.ESTIMADOR_TOKENS.calibrar(modelo, prompt, datos.get("prompt_eval_count"))
+                    return
+
+    def generar(self, prompt, modelo, opciones=None, cancelar=None, metricas=None):
+        """Respuesta completa (por debajo sigue siendo streaming: no hay timeout total)."""
+        return "".join(self.generar_stream(prompt, modelo, opciones, cancelar, metricas))
+
+    async def generar_async(self, prompt, modelo, opciones=None, cancelar=None):
+        """
+        Variante asyncio de 'generar_stream' (async for). Cada lectura bloqueante va a un
+        hilo con asyncio.to_thread; si la tarea se cancela, se corta también la respuesta HTTP.
+        """
+        cancelar = cancelar or threading.Event()
+        flujo = self.generar_stream(prompt, modelo, opciones, cancelar)
+        fin = object()
+        try:
+            while True:
+                fragmento = await asyncio.to_thread(next, flujo, fin)
+                if fragmento is fin:
+                    return
+                yield fragmento
+        finally:
+            cancelar.set()
+            try:
+                flujo.close()
+            except ValueError:
+                pass # Aún leyendo en su hilo: parará solo al ver 'cancelar'
+
+    def embeber(self, textos, modelo=MODELO_EMBEDDINGS):
+        """Vectores de una lista de textos en UNA petición (/api/embed). Devuelve una lista de listas."""
+        payload = {"model": modelo, "input": list(textos), "keep_alive": self.keep_alive}
+        respuesta = self.sesion.post(f"{self.url_base}/api/embed", json=payload, timeout=self.timeout)
+        respuesta.raise_for_status()
+        datos = respuesta.json()
+        if "error" in datos:
+            raise ErrorOllama(datos["error"])
+        return datos["embeddings"]
+
+    def precargar(self, modelo):
+        """Carga el modelo en memoria sin generar nada (petición vacía con keep_alive)."""
+        respuesta = self.sesion.post(f"{self.url_base}/api/generate",
+                                     json={"model": modelo, "keep_alive": self.keep_alive}, timeout=self.timeout)
+        respuesta.raise_for_status()
+
+    def metricas(self, modelo):
+        with self._lock:
+            return dict(self.ultimas_metricas.get(modelo, {}))
+
+    def cerrar(self):
+        self.sesion.close()
+
+
+_cliente = None
+_lock_cliente = threading.Lock()
+
+def obtener_cliente():
+    """Cliente compartido por todo el proceso (una sola sesión HTTP)."""
+    global _cliente
+    with _lock_cliente:
+        if _cliente is None:
+            _cliente = ClienteOllama()
+        return _cliente
 
 # --- RUTAS DE CONTEXTO ---
 RUTA_SISTEMA_SPECS = Path(__file__).parent.parent / "Boveda_MD" / "System_Specs.md"
 
-def obtener_contexto_llm(tipo_consulta, activo_id=None):
+class CacheContexto:
     """
-    Ensambla el contexto completo: Global + Específico.
+    Contexto del LLM por segmentos, cada uno con la "versión" de su fuente:
+      - ficha técnica -> (mtime_ns, tamaño) de System_Specs.md
+      - historial     -> ID_Registro más alto
+      - foco          -> (hash, Fecha_Modificacion_DB) del activo
+    Un segmento solo se reconstruye si su versión cambia. Los segmentos van de más
+    estático a más volátil y se reutilizan los MISMOS strings, así el prefijo del prompt
+    es idéntico byte a byte entre consultas y Ollama reaprovecha su caché de prompt (KV).
     """
-    contexto_global = ""
-    # 1. Leer la "Pre-memoria" (Ficha Técnica del PC)
-    if RUTA_SISTEMA_SPECS.exists():
-        contexto_global = RUTA_SISTEMA_SPECS.read_text(encoding="utf-8")
-    
-    # 2. Obtener Historial de Registros
-    # (Futura función que busca las últimas 20 acciones del usuario en la DB)
-    historial_reciente = gestor_db.obtener_registros_recientes(limite=10) # Aún por definir en gestor_db.py
-    
-    # 3. Obtener Datos del Activo Específico (si aplica)
-    contexto_activo = ""
-    if activo_id:
-        activo = gestor_db.get_activo_por_id(activo_id) # Aún por definir en gestor_db.py
-        if activo:
-            # Aquí iría el código RAG para buscar los chunks relevantes
-            contexto_activo = f"Activo en Foco: {activo['Nombre_Archivo']} | Resumen: {activo['Resumen_Ejecutivo']}"
-
-    return f"FICHA TÉCNICA:\n{contexto_global}\n\nHISTORIAL RECIENTE:\n{historial_reciente}\n\nFOCO ACTUAL:\n{contexto_activo}"
-
-def llm_query(prompt, modelo):
-    """Función genérica para hacer la llamada a Ollama."""
+    def __init__(self, ruta_specs=RUTA_SISTEMA_SPECS, limite_historial=10):
+        self.ruta_specs = Path(ruta_specs)
+        self.limite_historial = limite_historial
+        self._segmentos = {}   # nombre -> (versión, texto)
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.reconstrucciones = 0
+
+    def _segmento(self, nombre, version, construir):
+        with self._lock:
+            guardado = self._segmentos.get(nombre)
+            if guardado is not None and version is not None and guardado[0] == version:
+                self.aciertos += 1
+                return guardado[1]
+        texto = construir()
+        with self._lock:
+            self.reconstrucciones += 1
+            self._segmentos[nombre] = (version, texto)
+        return texto
+
+    def ficha_tecnica(self):
+        # 1. Leer la "Pre-memoria" (Ficha Técnica del PC)
+        try:
+            st = self.ruta_specs.stat()
+            version = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return ""
+        return self._segmento("specs", version, lambda: self.ruta_specs.read_text(encoding="utf-8"))
+
+    def historial(self):
+        # 2. Obtener Historial de Registros y sesiones de foco (solo si ha cambiado algo)
+        version = gestor_db.obtener_version_historial()
+        return self._segmento(
+            "historial", version, lambda: gestor_db.obtener_registros_recientes(limite=self.limite_historial)
+        )
+
+    def foco(self, activo_id):
+        # 3. Obtener Datos del Activo Específico (si aplica)
+        if not activo_id:
+            return ""
+        version = gestor_db.obtener_version_activo(activo_id)
+        if version is None:
+            return ""
+        return self._segmento(("activo", activo_id), version, lambda: self._construir_foco(activo_id))
+
+    @staticmethod
+    def _construir_foco(activo_id):
+        activo = gestor_db.get_activo_por_id(activo_id)
+        if not activo:
+            return ""
+        # Los trozos relevantes del archivo van aparte (ver 'fragmentos_relevantes')
+        return f"Activo en Foco: {activo['Nombre_Archivo']} | Resumen: {activo['Resumen_Ejecutivo']}"
+
+    @staticmethod
+    def fragmentos_relevantes(consulta, activo_id=None):
+        # 4. RAG: los fragmentos más parecidos a la consulta (del activo en foco si lo hay).
+        # Depende de la consulta, así que no se cachea y va al final del prompt.
+        try:
+            from src import indice_vectorial # Import tardío: indice_vectorial importa este módulo
+        except ImportError:
+            import indice_vectorial
+        try:
+            encontrados = indice_vectorial.buscar_fragmentos(consulta, id_activo=activo_id)
+        except Exception as e:
+            print(f"RAG no disponible: {e}")
+            return ""
+        return "\n---\n".join(f"[Activo {f['ID_Activo']} #{f['Orden']}] {f['Texto']}" for f in encontrados)
+
+    def ensamblar(self, activo_id=None, consulta=None, presupuesto=None, modelo=None):
+        """
+        Contexto en orden de más estático a más volátil. Con 'presupuesto' (tokens de 'modelo')
+        se rellena por prioridad: foco, fragmentos, historial (lo más reciente) y ficha técnica;
+        lo que no quepa se recorta siempre igual (ver estimador_tokens.empaquetar_por_prioridad).
+        """
+        Seccion = estimador_tokens.SeccionContexto
+        secciones = [
+            Seccion("FICHA TÉCNICA", self.ficha_tecnica(), 3, "inicio", "\n"),
+            Seccion("HISTORIAL RECIENTE", self.historial(), 2, "final", "\n"),
+            Seccion("FOCO ACTUAL", self.foco(activo_id), 0, "inicio", "\n"),
+        ]
+        if consulta:
+            secciones.append(
+                Seccion("FRAGMENTOS RELEVANTES", self.fragmentos_relevantes(consulta, activo_id), 1, "inicio", "\n---\n")
+            )
+        if presupuesto is None:
+            return "\n\n".join(f"{s.titulo}:\n{s.texto}" for s in secciones)
+        contexto, _ = estimador_tokens.empaquetar_por_prioridad(secciones, presupuesto, modelo)
+        return contexto
+
+    def invalidar(self):
+        with self._lock:
+            self._segmentos.clear()
+
+
+CACHE_CONTEXTO = CacheContexto()
+
+class CacheRespuestas:
+    """
+    Memoriza respuestas completas del LLM en la DB (tabla Cache_Respuestas_LLM).
+    Clave = SHA-256 de (modelo, opciones, SHA-256 del prompt final): cualquier cambio
+    en el contexto o en las opciones da otra clave. Caducidad por tipo de llamada
+    (TTL_RESPUESTAS) y tope de entradas con expulsión LRU.
+    """
+    def __init__(self, ttl=TTL_RESPUESTAS, max_entradas=MAX_RESPUESTAS_CACHE):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.omitidos = 0
+
+    @staticmethod
+    def clave(prompt, modelo, opciones=None):
+        huella_prompt = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        material = json.dumps([modelo, opciones or {}, huella_prompt], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _contar(self, campo):
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + 1)
+
+    def leer(self, clave):
+        respuesta = gestor_db.leer_respuesta_cache(clave)
+        self._contar("fallos" if respuesta is None else "aciertos")
+        return respuesta
+
+    def guardar(self, clave, modelo, tipo, respuesta):
+        gestor_db.guardar_respuesta_cache(clave, modelo, tipo, respuesta, self.ttl.get(tipo), self.max_entradas)
+
+    def omitir(self):
+        """Llamada con usar_cache=False (se cuenta aparte)."""
+        self._contar("omitidos")
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "omitidos": self.omitidos,
+                "tasa_aciertos": self.aciertos / consultas if consultas else 0.0,
+            }
+
+
+CACHE_RESPUESTAS = CacheRespuestas()
+
+def obtener_contexto_llm(tipo_consulta, activo_id=None, consulta=None):
+    """
+    Ensambla el contexto completo: Global + Específico (ver CacheContexto), dentro del
+    presupuesto de tokens del tipo de consulta (PRESUPUESTO_CONTEXTO).
+    Con 'consulta' añade los fragmentos del índice vectorial más parecidos a ella.
+    """
+    return CACHE_CONTEXTO.ensamblar(
+        activo_id, consulta, PRESUPUESTO_CONTEXTO.get(tipo_consulta), MODELO_POR_TIPO.get(tipo_consulta)
+    )
+
+def llm_query(prompt, modelo, opciones=None, tipo=None, usar_cache=True, antes_de_generar=None):
+    """
+    Función genérica para hacer la llamada a Ollama.
+    Con 'tipo' ('ligero', 'pesado'...) y usar_cache=True la respuesta se memoriza
+    (ver CacheRespuestas); usar_cache=False fuerza una generación nueva.
+    'antes_de_generar()' se llama solo si de verdad hay que generar (no en un acierto de caché).
+    """
+    clave = None
+    if tipo and usar_cache:
+        clave = CacheRespuestas.clave(prompt, modelo, opciones)
+        respuesta = CACHE_RESPUESTAS.leer(clave)
+        if respuesta is not None:
+            return respuesta
+    elif tipo:
+        CACHE_RESPUESTAS.omitir()
+    if antes_de_generar is not None:
+        antes_de_generar()
     try:
-        payload = {
-            "model": modelo,
-            "prompt": prompt,
-            "stream": False # Usamos modo síncrono por ahora
-        }
-        response = requests.post(URL_OLLAMA, json=payload, timeout=120)
-        response.raise_for_status()
-        
-        data = response.json()
-        return data['response']
-        
-    except requests.exceptions.RequestException as e:
-        return f"Error de conexión con Ollama ({modelo}): {e}"
-        
-def llm_ligero_query(prompt, activo_id=None):
-    """Consulta rápida para triage y comandos."""
+        respuesta = obtener_cliente().generar(prompt, modelo, opciones)
+    except (requests.exceptions.RequestException, ErrorOllama) as e:
+        return f"Error de conexión con Ollama ({modelo}): {e}" # Los errores no se memorizan
+    if clave:
+        CACHE_RESPUESTAS.guardar(clave, modelo, tipo, respuesta)
+    return respuesta
+
+def llm_query_stream(prompt, modelo, cancelar=None, opciones=None, tipo=None, usar_cache=True):
+    """
+    Como 'llm_query' pero devuelve los fragmentos según se generan.
+    Un acierto de caché sale de una vez; solo se memorizan respuestas no canceladas.
+    """
+    clave = None
+    if tipo and usar_cache:
+        clave = CacheRespuestas.clave(prompt, modelo, opciones)
+        respuesta = CACHE_RESPUESTAS.leer(clave)
+        if respuesta is not None:
+            yield respuesta
+            return
+    elif tipo:
+        CACHE_RESPUESTAS.omitir()
+    fragmentos = []
+    try:
+        for fragmento in obtener_cliente().generar_stream(prompt, modelo, opciones, cancelar):
+            fragmentos.append(fragmento)
+            yield fragmento
+    except (requests.exceptions.RequestException, ErrorOllama) as e:
+        yield f"Error de conexión con Ollama ({modelo}): {e}"
+        return
+    if clave and not (cancelar is not None and cancelar.is_set()):
+        CACHE_RESPUESTAS.guardar(clave, modelo, tipo, "".join(fragmentos))
+
+def _prompt_ligero(prompt, activo_id):
     contexto = obtener_contexto_llm("ligero", activo_id)
-    prompt_final = f"Contexto: {contexto}\n\nInstrucción: {prompt}"
-    return llm_query(prompt_final, MODELO_LIGERO)
+    return f"Contexto: {contexto}\n\nInstrucción: {prompt}"
+
+def llm_ligero_query(prompt, activo_id=None, usar_cache=True):
+    """Consulta rápida para triage y comandos."""
+    return llm_query(_prompt_ligero(prompt, activo_id), MODELO_LIGERO, tipo="ligero", usar_cache=usar_cache)
 
-def llm_pesado_query(prompt, activo_id):
+def llm_ligero_stream(prompt, activo_id=None, cancelar=None, usar_cache=True):
+    """Consulta rápida en streaming: el primer fragmento llega tras el 'prefill', no al final."""
+    return llm_query_stream(
+        _prompt_ligero(prompt, activo_id), MODELO_LIGERO, cancelar, tipo="ligero", usar_cache=usar_cache
+    )
+
+def _esperar_recursos_pesado():
+    """Si monitor_recursos dice que el PC está ocupado, espera (como mucho MAX_ESPERA_RECURSOS_PESADO)."""
+    from src.monitores import monitor_recursos # Import tardío: solo lo necesita el modelo pesado
+    motivo = monitor_recursos.sistema_ocupado()
+    if motivo:
+        print(f"LLM pesado en espera: sistema ocupado ({motivo})")
+        monitor_recursos.esperar_sistema_libre(MAX_ESPERA_RECURSOS_PESADO)
+
+def llm_pesado_query(prompt, activo_id, usar_cache=True):
     """
     Consulta pesada para RAG e indexación.
-    Aquí iría la lógica para consultar al monitor de recursos antes de llamar.
+    Antes de generar consulta al monitor de recursos: con el PC ocupado, espera.
     """
-    # Lógica de seguridad: Si monitor_recursos dice que el PC está ocupado, espera.
-    # Por ahora, solo llama.
-    
-    contexto = obtener_contexto_llm("pesado", activo_id)
+    contexto = obtener_contexto_llm("pesado", activo_id, consulta=prompt)
     prompt_final = f"Contexto Detallado para RAG: {contexto}\n\nInstrucción Rigurosa: {prompt}"
-    return llm_query(prompt_final, MODELO_PESADO)
+    return llm_query(
+        prompt_final, MODELO_PESADO, tipo="pesado", usar_cache=usar_cache, antes_de_generar=_esperar_recursos_pesado
+    )
     
 if __name__ == "__main__":
-    # Prueba simple:
-    print(llm_ligero_query("¿Cuál es el modelo de lenguaje que estás utilizando ahora?"))
\ No newline at end of file
+    # Prueba simple (en streaming):
+    for fragmento in llm_ligero_stream("¿Cuál es el modelo de lenguaje que estás utilizando ahora?"):
+        print(fragmento, end="", flush=True)
+    print(f"\n{obtener_cliente().metricas(MODELO_LIGERO)}")
\ No newline at end of file
@@ -0,0 +1,78 @@
+# src/huellas.py
+# Huella por niveles de los activos:
+#   1. Tamaño (gratis, viene del stat).
+#   2. Huella parcial: principio + medio + final (la calcula el escaneo, ver utils.calcular_huellas).
+#   3. SHA-256 completo: SOLO cuando hace falta -> colisión de (tamaño, huella parcial),
+#      búsqueda de duplicados o la etapa de indexado RAG.
+# Así el escaneo no lee gigas de .dwg/.blend/.rvt enteros salvo que sea imprescindible.
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from src import gestor_db
+    from src import utils
+    from src.config_scanner import HILOS_HASH
+except ImportError:
+    import gestor_db
+    import utils
+    from config_scanner import HILOS_HASH
+
+
+def _hash_completo_si_no_cambio(ruta, peso, mtime_ns):
+    """
+    Calcula el SHA-256 completo solo si el archivo sigue siendo el que vio el escaneo.
+    Devuelve el hash o None (archivo cambiado, borrado o ilegible).
+    """
+    try:
+        stat_archivo = os.stat(ruta)
+    except OSError:
+        return None
+    if (stat_archivo.st_size, stat_archivo.st_mtime_ns) != (peso, mtime_ns):
+        return None # Ha cambiado: el próximo escaneo le dará una huella nueva
+    return utils.calcular_hash_archivo(ruta)
+
+def asegurar_hash_completo(activo):
+    """
+    Devuelve el SHA-256 completo de un activo (dict de gestor_db.get_activo_por_id),
+    calculándolo y guardándolo si aún solo tenía huella parcial.
+    """
+    if activo.get("Nivel_Hash") == "Completo" and activo.get("Hash_Contenido"):
+        return activo["Hash_Contenido"]
+    hash_val = _hash_completo_si_no_cambio(activo["Ruta_Absoluta"], activo["Peso_Bytes"], activo["Mtime_ns"])
+    if hash_val:
+        gestor_db.actualizar_hashes_completos([(hash_val, activo["ID_Activo"], activo["Mtime_ns"])])
+    return hash_val
+
+def resolver_colisiones(hilos=HILOS_HASH):
+    """
+    Calcula el hash completo de los activos cuya huella parcial coincide con la de otro
+    (mismo tamaño y mismas muestras). Devuelve cuántos hashes completos se han guardado.
+    """
+    colisiones = gestor_db.obtener_colisiones_huella()
+    if not colisiones:
+        return 0
+    print(f"Resolviendo {len(colisiones)} colisiones de huella parcial con el hash completo...")
+    with ThreadPoolExecutor(max_workers=max(1, hilos)) as pool:
+        hashes = pool.map(lambda fila: _hash_completo_si_no_cambio(fila[1], fila[2], fila[3]), colisiones)
+        filas = [
+            (hash_val, id_activo, mtime_ns)
+            for (id_activo, _, _, mtime_ns), hash_val in zip(colisiones, hashes)
+            if hash_val
+        ]
+    return gestor_db.actualizar_hashes_completos(filas)
+
+def buscar_duplicados():
+    """
+    Consulta de duplicados: primero confirma las colisiones de huella parcial
+    con el hash completo y luego agrupa por contenido. Devuelve {hash: [rutas]}.
+    """
+    resolver_colisiones()
+    return gestor_db.obtener_duplicados()
+
+
+if __name__ == "__main__":
+    for hash_val, rutas in buscar_duplicados().items():
+        print(f"\n{hash_val[:12]}... ({len(rutas)} copias)")
+        for ruta in rutas:
+            print(f"  {ruta}")
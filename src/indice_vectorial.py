@@ -0,0 +1,536 @@
+# src/indice_vectorial.py
+# Índice vectorial local para el RAG: en vez de mandar archivos enteros al modelo
+# pesado, se trocean, se convierten en vectores y solo viajan los trozos relevantes.
+#
+#   Activos 'Pendiente' -> texto -> fragmentos (tabla Fragmentos) -> vectores (Ollama)
+#                                                          |
+#   consulta -> vector -> similitud coseno por bloques <- matriz en disco (numpy.memmap)
+#
+# La matriz vive en disco (memmap): el SO solo sube a RAM las páginas que se tocan.
+# Con cuantizar=True se guarda en int8 (4 veces menos memoria) con una escala por fila.
+#
+# Varios procesos comparten el índice (trabajador_indexado escribe, el asistente busca):
+# las escrituras van con un cerrojo exclusivo sobre indice.lock y las búsquedas con uno
+# compartido, y cada instancia relee meta.json cuando cambia (filas añadidas, compactación).
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import fcntl # POSIX
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt # Windows
+except ImportError:
+    msvcrt = None
+
+try:
+    from src import extractores
+    from src import gestor_db
+    from src import gestor_ollama
+except ImportError:
+    import extractores
+    import gestor_db
+    import gestor_ollama
+
+RUTA_INDICE_VECTORIAL = Path(__file__).parent.parent / "indice_vectorial"
+
+TAM_FRAGMENTO = 1500        # Caracteres por fragmento (~375 tokens)
+SOLAPE_FRAGMENTO = 200      # Caracteres repetidos entre fragmentos seguidos (no cortar ideas)
+TOP_K_FRAGMENTOS = 4        # Fragmentos que se añaden al contexto del LLM
+LOTE_EMBEDDINGS = 32        # Textos por petición de embeddings
+FILAS_POR_BLOQUE = 65536    # Filas de la matriz por multiplicación (acota la RAM de la búsqueda)
+CAPACIDAD_INICIAL = 4096    # Filas reservadas al crear el índice (luego se duplica)
+# Estados de Activos.Estado_Procesamiento que usa el indexado
+ESTADO_PENDIENTE = "Pendiente"
+ESTADO_PROCESANDO = "Procesando" # Reclamado por un trabajador (ver gestor_db.reclamar_activos_pendientes)
+ESTADO_INDEXADO = "Indexado"
+ESTADO_SIN_TEXTO = "Sin_Texto"   # Formato sin extractor (ver extractores.EXTRACTORES)
+ESTADO_ERROR = "Error"
+
+
+# --- TEXTO Y FRAGMENTOS ---
+
+def leer_texto_activo(activo):
+    """
+    Texto de un activo (dict de Activos) o None si su formato no tiene extractor.
+    Ver extractores.py (caché por contenido; lanza ErrorExtraccion si el archivo no se pudo leer).
+    """
+    return extractores.extraer_texto_activo(activo)
+
+def trocear_texto(texto, tam=TAM_FRAGMENTO, solape=SOLAPE_FRAGMENTO):
+    """
+    Parte el texto en fragmentos de unos 'tam' caracteres. Intenta cortar en un salto
+    de párrafo, luego de línea y luego de frase, nunca antes de la mitad del fragmento.
+    """
+    texto = texto.strip()
+    fragmentos = []
+    inicio = 0
+    while inicio < len(texto):
+        fin = min(inicio + tam, len(texto))
+        if fin < len(texto):
+            for separador in ("\n\n", "\n", ". "):
+                corte = texto.rfind(separador, inicio, fin)
+                if corte > inicio + tam // 2:
+                    fin = corte + len(separador)
+                    break
+        fragmento = texto[inicio:fin].strip()
+        if fragmento:
+            fragmentos.append(fragmento)
+        if fin >= len(texto):
+            break
+        inicio = max(fin - solape, inicio + 1)
+    return fragmentos
+
+
+# --- EMBEDDERS ---
+
+class EmbedderOllama:
+    """Vectores del modelo de embeddings de Ollama (una petición por lote)."""
+    def __init__(self, modelo=gestor_ollama.MODELO_EMBEDDINGS, cliente=None):
+        self.modelo = modelo
+        self.cliente = cliente
+
+    def embeber(self, textos):
+        cliente = self.cliente or gestor_ollama.obtener_cliente()
+        return np.asarray(cliente.embeber(textos, self.modelo), dtype=np.float32)
+
+
+class EmbedderDeterminista:
+    """
+    Sustituto local sin red ni modelo (pruebas, máquinas sin Ollama): "hashing trick"
+    de palabras. Mismo texto -> mismo vector; textos con palabras en común -> vectores cercanos.
+    """
+    def __init__(self, dimension=256):
+        self.dimension = dimension
+        self.modelo = f"determinista-{dimension}"
+
+    def embeber(self, textos):
+        matriz = np.zeros((len(textos), self.dimension), dtype=np.float32)
+        for fila, texto in enumerate(textos):
+            for palabra in re.findall(r"\w+", texto.lower()):
+                h = int.from_bytes(hashlib.blake2b(palabra.encode("utf-8"), digest_size=8).digest(), "little")
+                matriz[fila, h % self.dimension] += 1.0 if (h >> 63) else -1.0
+        return matriz
+
+
+@contextmanager
+def _cerrojo_archivo(ruta, compartido=False):
+    """
+    Cerrojo entre procesos sobre 'ruta' (flock en POSIX; en Windows msvcrt.locking, que
+    no tiene modo compartido: ahí las búsquedas también son exclusivas).
+    """
+    with open(ruta, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH if compartido else fcntl.LOCK_EX)
+        elif msvcrt is not None:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.05)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _normalizar(vectores):
+    vectores = np.atleast_2d(np.asarray(vectores, dtype=np.float32))
+    normas = np.linalg.norm(vectores, axis=1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return vectores / normas
+
+
+# --- ÍNDICE EN DISCO ---
+
+class IndiceVectorial:
+    """
+    Matriz de vectores normalizados (numpy.memmap) + mapa fila -> (ID_Fragmento, ID_Activo).
+    Como los vectores están normalizados, la similitud coseno es un producto escalar.
+    Las filas borradas quedan marcadas con ID_Activo = -1 y se compactan cuando son muchas.
+
+    Archivos en 'directorio': meta.json, vectores.bin, mapa.bin (y escalas.bin si es int8),
+    e indice.lock (cerrojo entre procesos).
+    """
+    def __init__(self, directorio=RUTA_INDICE_VECTORIAL, cuantizar=False):
+        self.directorio = Path(directorio)
+        self._lock = threading.RLock()
+        self._dentro = 0        # Profundidad de '_bloqueo' (el cerrojo del archivo no es reentrante)
+        self._firma_meta = None # (mtime, tamaño, inodo) del meta.json leído
+        self.meta = {"dimension": None, "capacidad": 0, "filas": 0, "huecos": 0,
+                     "cuantizado": cuantizar, "modelo": None}
+        self._vectores = self._mapa = self._escalas = None
+        self.recargar()
+
+    # --- ARCHIVOS ---
+
+    @property
+    def filas(self):
+        return self.meta["filas"]
+
+    @property
+    def vivas(self):
+        return self.meta["filas"] - self.meta["huecos"]
+
+    def _tipo_vectores(self):
+        return np.int8 if self.meta["cuantizado"] else np.float32
+
+    def _abrir(self):
+        capacidad, dimension = self.meta["capacidad"], self.meta["dimension"]
+        self._vectores = np.memmap(self.directorio / "vectores.bin", dtype=self._tipo_vectores(),
+                                   mode="r+", shape=(capacidad, dimension))
+        self._mapa = np.memmap(self.directorio / "mapa.bin", dtype=np.int64, mode="r+", shape=(capacidad, 2))
+        self._escalas = None
+        if self.meta["cuantizado"]:
+            self._escalas = np.memmap(self.directorio / "escalas.bin", dtype=np.float32,
+                                      mode="r+", shape=(capacidad,))
+
+    def _cerrar(self):
+        for matriz in (self._vectores, self._mapa, self._escalas):
+            if matriz is not None:
+                matriz.flush()
+        # Sin referencias vivas al memmap (en Windows no se puede redimensionar un archivo mapeado)
+        self._vectores = self._mapa = self._escalas = None
+
+    def _reservar(self, capacidad):
+        """Crea o agranda los archivos hasta 'capacidad' filas (lo nuevo queda a cero)."""
+        self._cerrar()
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        dimension = self.meta["dimension"]
+        archivos = [("vectores.bin", np.dtype(self._tipo_vectores()).itemsize * dimension),
+                    ("mapa.bin", 16)]
+        if self.meta["cuantizado"]:
+            archivos.append(("escalas.bin", 4))
+        for nombre, bytes_por_fila in archivos:
+            with open(self.directorio / nombre, "ab") as f:
+                f.truncate(capacidad * bytes_por_fila)
+        self.meta["capacidad"] = capacidad
+        self._abrir()
+
+    def _guardar_meta(self):
+        for matriz in (self._vectores, self._mapa, self._escalas):
+            if matriz is not None:
+                matriz.flush()
+        temporal = self.directorio / "meta.json.tmp"
+        temporal.write_text(json.dumps(self.meta), encoding="utf-8")
+        os.replace(temporal, self.directorio / "meta.json")
+        self._firma_meta = self._firma()
+
+    def _firma(self):
+        try:
+            st = os.stat(self.directorio / "meta.json")
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def recargar(self, forzar=False):
+        """
+        Relee meta.json si otro proceso lo ha cambiado (o siempre, con 'forzar') y reabre
+        las matrices. Devuelve True si había cambios.
+        """
+        with self._lock:
+            firma = self._firma()
+            if firma is None or (firma == self._firma_meta and not forzar):
+                return False
+            meta = json.loads((self.directorio / "meta.json").read_text(encoding="utf-8"))
+            self._firma_meta = firma
+            if meta.items() <= self.meta.items() and self._vectores is not None:
+                return False
+            self._cerrar()
+            self.meta.update(meta)
+            self._abrir()
+            return True
+
+    @contextmanager
+    def _bloqueo(self, compartido=False):
+        """
+        Hilos (self._lock) y procesos (indice.lock). Al entrar se relee meta.json: las
+        escrituras siempre parten de lo último que dejó cualquier proceso.
+        """
+        with self._lock:
+            if self._dentro:
+                self._dentro += 1
+                try:
+                    yield
+                finally:
+                    self._dentro -= 1
+                return
+            self.directorio.mkdir(parents=True, exist_ok=True)
+            with _cerrojo_archivo(self.directorio / "indice.lock", compartido):
+                self._dentro = 1
+                try:
+                    self.recargar(forzar=not compartido)
+                    yield
+                finally:
+                    self._dentro = 0
+
+    def comprobar_modelo(self, modelo):
+        """Un índice solo admite vectores de UN modelo (dimensiones y espacio distintos)."""
+        if self.meta["modelo"] not in (None, modelo):
+            raise ValueError(
+                f"El índice vectorial se creó con '{self.meta['modelo']}' y se está usando '{modelo}'. "
+                f"Borra {self.directorio} para reconstruirlo."
+            )
+
+    # --- ESCRITURA ---
+
+    def anadir(self, ids_fragmento, ids_activo, vectores, modelo=None):
+        """Añade filas (los vectores se normalizan y, si toca, se cuantizan a int8)."""
+        vectores = _normalizar(vectores)
+        n = len(vectores)
+        if n == 0:
+            return
+        with self._bloqueo():
+            if modelo:
+                self.comprobar_modelo(modelo)
+                self.meta["modelo"] = modelo
+            if self.meta["dimension"] is None:
+                self.meta["dimension"] = vectores.shape[1]
+                self._reservar(CAPACIDAD_INICIAL)
+            elif vectores.shape[1] != self.meta["dimension"]:
+                raise ValueError(f"Dimensión {vectores.shape[1]} != {self.meta['dimension']} del índice.")
+            inicio = self.meta["filas"]
+            if inicio + n > self.meta["capacidad"]:
+                self._reservar(max(self.meta["capacidad"] * 2, inicio + n))
+
+            fin = inicio + n
+            if self.meta["cuantizado"]:
+                escalas = np.abs(vectores).max(axis=1) / 127
+                escalas[escalas == 0] = 1.0
+                self._vectores[inicio:fin] = np.round(vectores / escalas[:, None]).astype(np.int8)
+                self._escalas[inicio:fin] = escalas
+            else:
+                self._vectores[inicio:fin] = vectores
+            self._mapa[inicio:fin, 0] = ids_fragmento
+            self._mapa[inicio:fin, 1] = ids_activo
+            self.meta["filas"] = fin
+            self._guardar_meta()
+
+    def eliminar_activo(self, id_activo):
+        """Marca como borradas las filas de un activo. Devuelve cuántas."""
+        return self.eliminar_activos([id_activo])
+
+    def eliminar_activos(self, ids_activo):
+        """Marca como borradas las filas de varios activos (una pasada por el mapa). Devuelve cuántas."""
+        with self._bloqueo():
+            if not self.meta["filas"] or not len(ids_activo):
+                return 0
+            filas = np.flatnonzero(np.isin(self._mapa[:self.meta["filas"], 1], np.asarray(ids_activo, dtype=np.int64)))
+            if len(filas):
+                self._mapa[filas] = -1
+                self._vectores[filas] = 0
+                self.meta["huecos"] += len(filas)
+                if self.meta["huecos"] > self.meta["filas"] // 2:
+                    self.compactar()
+                else:
+                    self._guardar_meta()
+            return len(filas)
+
+    def compactar(self):
+        """Sube las filas vivas para tapar los huecos (el orden relativo se mantiene)."""
+        with self._bloqueo():
+            total = self.meta["filas"]
+            vivas = np.flatnonzero(self._mapa[:total, 1] >= 0)
+            n = len(vivas)
+            self._vectores[:n] = self._vectores[vivas]
+            self._mapa[:n] = self._mapa[vivas]
+            if self._escalas is not None:
+                self._escalas[:n] = self._escalas[vivas]
+            self._mapa[n:total] = -1
+            self._vectores[n:total] = 0
+            self.meta["filas"], self.meta["huecos"] = n, 0
+            self._guardar_meta()
+
+    # --- BÚSQUEDA ---
+
+    def buscar(self, consultas, k=TOP_K_FRAGMENTOS, id_activo=None):
+        """
+        Top-k por similitud coseno. 'consultas' es un vector (d,) o un lote (m, d).
+        Devuelve, por consulta, [(ID_Fragmento, similitud), ...] de mayor a menor
+        (una sola lista si se pasó un único vector). 'id_activo' limita a un activo.
+        """
+        unica = np.ndim(consultas) == 1
+        consultas = _normalizar(consultas)
+        m = len(consultas)
+        mejores_puntos = np.full((m, 0), -np.inf, dtype=np.float32)
+        mejores_ids = np.zeros((m, 0), dtype=np.int64)
+
+        with self._bloqueo(compartido=True):
+            total = self.meta["filas"]
+            for inicio in range(0, total, FILAS_POR_BLOQUE):
+                fin = min(inicio + FILAS_POR_BLOQUE, total)
+                bloque = np.asarray(self._vectores[inicio:fin], dtype=np.float32)
+                puntos = consultas @ bloque.T                          # (m, filas del bloque)
+                if self._escalas is not None:
+                    puntos *= self._escalas[inicio:fin]
+                mapa = np.asarray(self._mapa[inicio:fin])
+                validas = mapa[:, 1] >= 0 if id_activo is None else mapa[:, 1] == id_activo
+                puntos[:, ~validas] = -np.inf
+
+                # Candidatos del bloque + los mejores hasta ahora -> nos quedamos con k
+                puntos = np.concatenate([mejores_puntos, puntos], axis=1)
+                ids = np.concatenate([mejores_ids, np.broadcast_to(mapa[:, 0], (m, fin - inicio))], axis=1)
+                if puntos.shape[1] > k:
+                    elegidos = np.argpartition(-puntos, k - 1, axis=1)[:, :k]
+                    puntos = np.take_along_axis(puntos, elegidos, axis=1)
+                    ids = np.take_along_axis(ids, elegidos, axis=1)
+                mejores_puntos, mejores_ids = puntos, ids
+
+        resultados = []
+        for puntos, ids in zip(mejores_puntos, mejores_ids):
+            orden = np.argsort(-puntos)
+            resultados.append([(int(ids[i]), float(puntos[i])) for i in orden if np.isfinite(puntos[i])])
+        return resultados[0] if unica else resultados
+
+
+# --- INSTANCIAS COMPARTIDAS ---
+
+_indice = None
+_embedder = None
+_lock_instancias = threading.Lock()
+
+def obtener_indice():
+    global _indice
+    with _lock_instancias:
+        if _indice is None:
+            _indice = IndiceVectorial()
+        return _indice
+
+def obtener_embedder():
+    global _embedder
+    with _lock_instancias:
+        if _embedder is None:
+            _embedder = EmbedderOllama()
+        return _embedder
+
+def _embeber_por_lotes(embedder, textos):
+    return np.concatenate([
+        embedder.embeber(textos[i:i + LOTE_EMBEDDINGS]) for i in range(0, len(textos), LOTE_EMBEDDINGS)
+    ])
+
+
+# --- INDEXADO Y CONSULTA ---
+
+def indexar_activo(activo, indice=None, embedder=None):
+    """
+    (Re)indexa un activo: fragmentos en la DB y vectores en el índice.
+    Devuelve el número de fragmentos, o None si su formato no se lee como texto.
+    """
+    indice = indice or obtener_indice()
+    embedder = embedder or obtener_embedder()
+    indice.comprobar_modelo(embedder.modelo)
+    texto = leer_texto_activo(activo)
+    if texto is None:
+        return None
+    fragmentos = trocear_texto(texto)
+    # Primero los vectores: si el embedder falla, la DB y el índice siguen como estaban
+    vectores = _embeber_por_lotes(embedder, fragmentos) if fragmentos else None
+    _, ids_nuevos = gestor_db.guardar_fragmentos(activo["ID_Activo"], fragmentos)
+    gestor_db.actualizar_texto_fts(activo["ID_Activo"], texto)
+    indice.eliminar_activo(activo["ID_Activo"])
+    if fragmentos:
+        indice.anadir(ids_nuevos, [activo["ID_Activo"]] * len(ids_nuevos), vectores, modelo=embedder.modelo)
+    return len(fragmentos)
+
+def indexar_y_clasificar(activo, indice=None, embedder=None):
+    """
+    Indexa un activo y devuelve su nuevo Estado_Procesamiento.
+    Solo lanza ValueError (índice de otro modelo: no tiene sentido seguir con ningún activo).
+    """
+    try:
+        n = indexar_activo(activo, indice, embedder)
+        return ESTADO_SIN_TEXTO if n is None else ESTADO_INDEXADO
+    except ValueError:
+        raise
+    except Exception as e:
+        print(f"Error indexando {activo['Ruta_Absoluta']}: {e}")
+        return ESTADO_ERROR
+
+def indexar_pendientes(limite=100, indice=None, embedder=None, tam_lote=20):
+    """
+    Indexa hasta 'limite' activos en estado 'Pendiente' (reclamándolos por lotes, ver
+    gestor_db.reclamar_activos_pendientes). Devuelve {estado: cuántos}.
+    Para el indexado continuo y respetuoso con el PC, ver trabajador_indexado.py.
+    """
+    resumen = {}
+    while limite > 0:
+        lote = gestor_db.reclamar_activos_pendientes(min(tam_lote, limite))
+        if not lote:
+            break
+        limite -= len(lote)
+        extractores.extraer_lote(lote) # En paralelo; 'indexar_activo' lo encuentra luego en la caché
+        for i, activo in enumerate(lote):
+            try:
+                estado = indexar_y_clasificar(activo, indice, embedder)
+            except ValueError:
+                for pendiente in lote[i:]:
+                    gestor_db.terminar_activo(pendiente["ID_Activo"], ESTADO_PENDIENTE)
+                raise
+            gestor_db.terminar_activo(activo["ID_Activo"], estado)
+            resumen[estado] = resumen.get(estado, 0) + 1
+    return resumen
+
+def purgar_eliminados(indice=None, limite=1000):
+    """
+    Quita del índice y de Fragmentos lo de los activos con lápida (Eliminado = 1) o que ya
+    no están en Activos (sustituidos en un movimiento). Devuelve cuántos activos se han purgado.
+    """
+    indice = indice or obtener_indice()
+    purgados = 0
+    while True:
+        ids = gestor_db.obtener_activos_con_fragmentos_eliminados(limite)
+        if not ids:
+            return purgados
+        # Primero los vectores: si algo falla, los fragmentos siguen ahí y se reintenta
+        indice.eliminar_activos(ids)
+        gestor_db.borrar_fragmentos_activos(ids)
+        purgados += len(ids)
+        if len(ids) < limite:
+            return purgados
+
+def buscar_fragmentos(consulta, k=TOP_K_FRAGMENTOS, id_activo=None, indice=None, embedder=None):
+    """
+    Los 'k' fragmentos más parecidos a 'consulta' (texto). Devuelve una lista de dicts
+    {ID_Fragmento, ID_Activo, Orden, Texto, Similitud}, de más a menos parecido.
+    """
+    indice = indice or obtener_indice()
+    indice.recargar() # El trabajador de indexado (otro proceso) puede haber añadido filas
+    if not indice.vivas:
+        return []
+    embedder = embedder or obtener_embedder()
+    indice.comprobar_modelo(embedder.modelo)
+    vector = embedder.embeber([consulta])[0]
+    encontrados = indice.buscar(vector, k, id_activo)
+    textos = gestor_db.obtener_fragmentos(id_fragmento for id_fragmento, _ in encontrados)
+    return [
+        {"ID_Fragmento": id_fragmento, "ID_Activo": textos[id_fragmento][0], "Orden": textos[id_fragmento][1],
+         "Texto": textos[id_fragmento][2], "Similitud": similitud}
+        for id_fragmento, similitud in encontrados if id_fragmento in textos
+    ]
+
+
+if __name__ == "__main__":
+    # python -m src.indice_vectorial            -> indexa los activos pendientes (Ollama)
+    # python -m src.indice_vectorial "consulta" -> muestra los fragmentos más parecidos
+    import sys
+    if len(sys.argv) > 1:
+        for f in buscar_fragmentos(" ".join(sys.argv[1:])):
+            print(f"\n[{f['Similitud']:.3f}] Activo {f['ID_Activo']} #{f['Orden']}\n{f['Texto'][:300]}")
+    else:
+        print(indexar_pendientes(limite=10_000))
@@ -41,17 +41,10 @@ EXTENSIONES_IGNORADAS = {
 # --- FIN DE LA CONFIGURACIÓN ---
 
 
-def mapear_carpetas_raiz():
+def recorrer_activos(contadores):
     """
-    Función principal que recorre las carpetas raíz y procesa cada archivo.
+    Generador que recorre las carpetas raíz y devuelve el registro de cada archivo.
     """
-    print("Iniciando mapeo inicial de activos...")
-    archivos_procesados = 0
-    archivos_ignorados = 0
-
-    # Primero, nos aseguramos de que la DB existe
-    gestor_db.inicializar_base_de_datos()
-
     for ruta_raiz in CARPETAS_RAIZ_A_ESCANEAR:
         # Verificamos que la carpeta raíz exista
         if not ruta_raiz.exists():
@@ -82,7 +75,7 @@ def mapear_carpetas_raiz():
                 extension = ruta_absoluta_path.suffix.lower()
                 
                 if extension in EXTENSIONES_IGNORADAS:
-                    archivos_ignorados += 1
+                    contadores["ignorados"] += 1
                     continue
                 
                 # 4. OBTENCIÓN DE DATOS
@@ -91,25 +84,42 @@ def mapear_carpetas_raiz():
                 
                 if hash_archivo is None:
                     # (utils.py ya habrá impreso el error, ej. 'Permiso denegado')
-                    archivos_ignorados += 1
+                    contadores["ignorados"] += 1
                     continue
 
-                # 5. INSERCIÓN EN LA BASE DE DATOS
-                # ¡Aquí usamos la función que creamos antes!
-                gestor_db.insertar_o_actualizar_activo(
-                    ruta_abs_str = ruta_absoluta_str,
-                    tipo_activo = "Archivo", # Podríamos hacerlo más inteligente luego
-                    extension = extension,
-                    hash_contenido = hash_archivo
-                )
-                archivos_procesados += 1
+                # 5. REGISTRO PARA LA BASE DE DATOS (se vuelca por lotes)
+                peso = os.path.getsize(ruta_absoluta_str)
+                contadores["procesados"] += 1
+                yield {
+                    "ruta": ruta_absoluta_str,
+                    "nombre": filename,
+                    "ext": extension,
+                    "tipo": "Archivo", # Podríamos hacerlo más inteligente luego
+                    "peso": peso,
+                    "tokens_est": utils.estimar_tokens(ruta_absoluta_str, peso),
+                    "hash_val": hash_archivo,
+                }
                 
-                if archivos_procesados % 100 == 0:
-                    print(f"Procesados {archivos_procesados} archivos...")
+                if contadores["procesados"] % 100 == 0:
+                    print(f"Procesados {contadores['procesados']} archivos...")
+
+
+def mapear_carpetas_raiz():
+    """
+    Función principal que recorre las carpetas raíz y procesa cada archivo.
+    """
+    print("Iniciando mapeo inicial de activos...")
+    contadores = {"procesados": 0, "ignorados": 0}
+
+    # Primero, nos aseguramos de que la DB existe
+    gestor_db.inicializar_base_de_datos()
+
+    # ¡Aquí usamos el volcado por lotes de gestor_db!
+    gestor_db.insertar_activos_lote(recorrer_activos(contadores))
 
     print("--- Mapeo Completado ---")
-    print(f"Total de activos procesados/actualizados: {archivos_procesados}")
-    print(f"Total de archivos ignorados (Seguridad/Ruido): {archivos_ignorados}")
+    print(f"Total de activos procesados/actualizados: {contadores['procesados']}")
+    print(f"Total de archivos ignorados (Seguridad/Ruido): {contadores['ignorados']}")
 
 
 # Esto permite que ejecutemos este script directamente desde la terminal
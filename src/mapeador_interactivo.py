@@ -1,169 +1,310 @@
 # src/mapeador_interactivo.py
-# Versión 2 del mapeador. Este script es INTERACTIVO.
-# Te preguntará qué hacer con archivos desconocidos.
+# Versión 2 del mapeador. Este script es INTERACTIVO, pero no bloquea el escaneo:
+# los archivos de extensión desconocida quedan en espera y se deciden después
+# con 'python -m src.mapeador_interactivo --revisar'.
 
-from pathlib import Path
-import os
+import sys
 import time
 
 # Importamos nuestras propias herramientas
 try:
     from src import gestor_db
     from src import utils
+    from src import huellas
+    from src.pipeline_escaneo import PipelineEscaneo
 except ImportError:
     # Esto es por si lo ejecutamos de forma diferente
     import gestor_db
     import utils
+    import huellas
+    from pipeline_escaneo import PipelineEscaneo
 
 # --- 1. LISTAS DE SEGURIDAD Y ÁMBITO ---
 
-# (Pega aquí las listas CARPETAS_IGNORADAS, EXTENSIONES_IGNORADAS
-# y EXTENSIONES_PERMITIDAS que definimos arriba)
+# Las listas viven en config_scanner.py; filtro_rutas.py las compila una sola vez
+# (el vigilante en tiempo real usa el mismo motor).
 
-from src.config_scanner import CARPETAS_RAIZ_A_ESCANEAR, CARPETAS_IGNORADAS, EXTENSIONES_IGNORADAS, EXTENSIONES_PERMITIDAS
+from src.config_scanner import CARPETAS_RAIZ_A_ESCANEAR, MODO_RECORRIDO
+from src.filtro_rutas import FILTRO_ESCANEO, IGNORADO, SIN_EXTENSION, DESCONOCIDO, extension_de
 
 # --- 3. LÓGICA DEL "PUESTO DE CONTROL" ---
 # Este diccionario guardará tus decisiones para no preguntarte 1000 veces por la misma extensión (ej. .pdf)
+# Se carga de la tabla Decisiones_Extension al arrancar: las decisiones sobreviven entre ejecuciones.
 
 DECISIONES_CACHE = {}
 
+def cargar_decisiones():
+    """Rellena DECISIONES_CACHE con las decisiones guardadas en la DB."""
+    DECISIONES_CACHE.clear()
+    DECISIONES_CACHE.update(gestor_db.cargar_decisiones_extension())
+
 def manejar_decision_archivo(ruta_path, extension):
     """
-    El "Puesto de Control" interactivo.
-    Se activa cuando una extensión no es conocida.
+    El "Puesto de Control" (NO bloqueante).
+    Se activa cuando una extensión no es conocida. Si ya hay decisión guardada la
+    devuelve ('procesar_siempre' o 'ignorar_siempre'); si no, devuelve 'pendiente'
+    y el escaneo sigue: el archivo queda en la cola de revisión (ver revisar_decisiones_pendientes).
     """
-    # Primero, revisamos si ya hemos tomado una decisión para esta extensión
-    if extension in DECISIONES_CACHE:
-        return DECISIONES_CACHE[extension] # 'procesar_siempre' o 'ignorar_siempre'
+    return DECISIONES_CACHE.get(extension, 'pendiente')
 
+def preguntar_decision_extension(extension, num_archivos, peso_total, muestras):
+    """
+    Pregunta al usuario qué hacer con TODOS los archivos pendientes de una extensión.
+    Devuelve 'procesar_siempre', 'ignorar_siempre', 'mas_tarde' o 'salir'.
+    """
     print("\n" + "="*50)
     print("🚦 PUESTO DE CONTROL 🚦")
-    print(f"He encontrado un archivo con una extensión desconocida:")
-    print(f"  Archivo: {ruta_path}")
-    print(f"  Extensión: {extension}")
+    print(f"Extensión desconocida: {extension}")
+    print(f"  Archivos en espera: {num_archivos} ({peso_total / (1024**2):.1f} MB)")
+    print("  Ejemplos:")
+    for ruta in muestras:
+        print(f"    {ruta}")
     print("\n¿Qué quieres hacer?")
     print("---")
-    print("[1] Indexar (Solo este archivo)")
-    print("    (Se añadirá a la DB memoria.db para que el asistente lo conozca)")
-    print("[2] Ignorar (Solo este archivo)")
-    print("    (No se tocará. El asistente nunca sabrá que existe)")
+    print("[1] Indexar SIEMPRE (Todos los archivos '*.{ext}')".format(ext=extension[1:]))
+    print("    (Se indexan ya los archivos en espera y los futuros escaneos la tratarán como 'Whitelist')")
+    print("[2] Ignorar SIEMPRE (Todos los archivos '*.{ext}')".format(ext=extension[1:]))
+    print("    (Se descartan los archivos en espera y la extensión pasa a la 'Blacklist')")
     print("---")
-    print("[3] Indexar SIEMPRE (Todos los archivos '*.{ext}')".format(ext=extension[1:]))
-    print("    (Añade esta extensión a la 'Whitelist' para el resto del escaneo)")
-    print("[4] Ignorar SIEMPRE (Todos los archivos '*.{ext}')".format(ext=extension[1:]))
-    print("    (Añade esta extensión a la 'Blacklist' para el resto del escaneo)")
+    print("[3] Decidir más tarde")
+    print("[4] Salir de la revisión")
     
     while True:
         choice = input(f"Tu decisión para '{extension}' (1-4): ")
         
         if choice == '1':
-            return 'procesar_una_vez'
+            return 'procesar_siempre'
         elif choice == '2':
-            return 'ignorar_una_vez'
+            return 'ignorar_siempre'
         elif choice == '3':
-            # Guardamos la decisión en caché y procesamos esta vez
-            DECISIONES_CACHE[extension] = 'procesar_siempre'
-            print(f"✅ OK. Todos los archivos '{extension}' se procesarán.")
-            return 'procesar_siempre'
+            return 'mas_tarde'
         elif choice == '4':
-            # Guardamos la decisión en caché e ignoramos esta vez
-            DECISIONES_CACHE[extension] = 'ignorar_siempre'
-            print(f"❌ OK. Todos los archivos '{extension}' se ignorarán.")
-            return 'ignorar_siempre'
+            return 'salir'
         else:
             print("Opción no válida. Por favor, introduce un número del 1 al 4.")
 
-def procesar_archivo_en_db(ruta_path, ruta_str, extension):
+def preparar_registro_activo(entrada, extension):
     """
-    Función de ayuda para hashear e insertar/actualizar el activo.
+    Función de ayuda para preparar el registro de un activo para la DB a partir de
+    su utils.EntradaArchivo (tamaño, mtime e inodo ya vienen del listado de la carpeta;
+    en Windows el inodo no viene y se pide aquí: solo llegan los archivos nuevos o cambiados).
+    No hashea ni escribe nada: la huella la rellena el pool de hilos de
+    PipelineEscaneo y el sumidero lo vuelca por lotes.
     """
-    hash_archivo = utils.calcular_hash_archivo(ruta_path)
-    if hash_archivo:
-        gestor_db.insertar_o_actualizar_activo(
-            ruta_abs_str = ruta_str,
-            tipo_activo = "Archivo", # TODO: Inferir mejor el tipo
-            extension = extension,
-            hash_contenido = hash_archivo
-        )
-        return 1 # 1 archivo procesado
-    return 0 # 0 archivos procesados (error de hash)
+    return {
+        "ruta": entrada.ruta,
+        "nombre": entrada.nombre,
+        "ext": extension,
+        "tipo": "Archivo", # TODO: Inferir mejor el tipo
+        "peso": entrada.tamano,
+        "tokens_est": utils.estimar_tokens(entrada.ruta, entrada.tamano),
+        "hash_val": None,
+        "mtime_ns": entrada.mtime_ns,
+        "inodo": entrada.inodo or utils.inodo_archivo(entrada.ruta),
+    }
 
-def mapear_carpetas_raiz_interactivo():
+def _origen_movido(entrada, por_inodo, firmas_previas):
     """
-    Función principal que recorre las carpetas raíz
-    y usa el "Puesto de Control".
+    Ruta anterior de un archivo nuevo que en realidad es un activo movido o renombrado:
+    mismo inodo, tamaño y mtime, y en la ruta anterior ya no está ese archivo. None si no.
     """
-    print("Iniciando mapeo INTERACTIVO de activos...")
-    archivos_procesados = 0
-    archivos_ignorados = 0
+    inodo = entrada.inodo or utils.inodo_archivo(entrada.ruta)
+    anterior = por_inodo.get(inodo) if inodo else None
+    if anterior is None:
+        return None
+    origen, tamano, mtime_ns = anterior
+    if origen not in firmas_previas or (tamano, mtime_ns) != (entrada.tamano, entrada.mtime_ns):
+        return None
+    if utils.inodo_archivo(origen) == inodo:
+        return None # Sigue ahí: es un enlace duro, no un movimiento
+    return origen
 
-    gestor_db.inicializar_base_de_datos()
-
-    for ruta_raiz in CARPETAS_RAIZ_A_ESCANEAR:
+def recorrer_activos(contadores, raices=CARPETAS_RAIZ_A_ESCANEAR):
+    """
+    Generador que recorre las carpetas 'raices' (Path; por defecto las raíces), aplica los filtros y el "Puesto de Control"
+    y va devolviendo los registros (sin hash) de los archivos a indexar.
+    Es la etapa de recorrido de PipelineEscaneo.
+    Es INCREMENTAL: primero se hace stat y solo se hashean los archivos cuyo
+    (tamaño, mtime) ha cambiado desde el último escaneo. Una ruta nueva con el inodo,
+    tamaño y mtime de un activo que ya no está en su ruta es ese activo movido: se
+    cambia su ruta (conserva su ID, resumen e índice) sin re-hashear. Al terminar cada raíz,
+    los activos que estaban en la DB y ya no aparecen se marcan como eliminados.
+    Las extensiones desconocidas sin decisión NO paran el escaneo: se apuntan en
+    Archivos_Pendientes para revisarlas luego de una vez.
+    Actualiza 'contadores' ('procesados' / 'sin_cambios' / 'ignorados' / 'pendientes' / 'movidos' / 'eliminados').
+    """
+    for ruta_raiz in raices:
         if not ruta_raiz.exists():
             print(f"ADVERTENCIA: La carpeta raíz '{ruta_raiz}' no existe. Saltando.")
             continue
         
         print(f"--- Escaneando '{ruta_raiz}' ---")
+
+        # Foto del escaneo anterior y rutas vistas en este (para la diferencia de conjuntos)
+        firmas_previas = gestor_db.obtener_firmas_activos(ruta_raiz)
+        por_inodo = None # Se lee con la primera ruta nueva (casi nunca hace falta)
+        rutas_vistas = set()
+        errores_recorrido = []
+        pendientes = []
         
-        for dirpath, dirnames, filenames in os.walk(str(ruta_raiz), topdown=True):
-            
-            # 1. FILTRO DE CARPETAS (BLACKLIST)
-            # Comparamos los nombres de las carpetas en la ruta actual
-            partes_ruta = set(Path(dirpath).parts)
-            if not CARPETAS_IGNORADAS.isdisjoint(partes_ruta):
-                # print(f"Ignorando carpeta (Blacklist): {dirpath}")
-                dirnames[:] = [] # No entrar en subcarpetas
-                filenames[:] = [] # Ignorar archivos aquí
+        # 1. FILTRO DE CARPETAS (BLACKLIST): se podan antes de entrar en ellas
+        for entrada in utils.recorrer_directorio(
+            ruta_raiz, modo=MODO_RECORRIDO, carpeta_ignorada=FILTRO_ESCANEO.carpeta_ignorada,
+            errores=errores_recorrido
+        ):
+
+            # 2. FILTRO DE ARCHIVOS (BLACKLIST: sufijos, prefijos como '~$', nombres exactos)
+            estado, extension = FILTRO_ESCANEO.clasificar_archivo(entrada.nombre)
+            if estado == IGNORADO or estado == SIN_EXTENSION:
+                contadores["ignorados"] += 1
                 continue
 
-            for filename in filenames:
-                
-                ruta_absoluta_path = Path(dirpath) / filename
-                ruta_absoluta_str = str(ruta_absoluta_path)
-                extension = ruta_absoluta_path.suffix.lower()
+            # 3. FILTRO INCREMENTAL: si (tamaño, mtime) no ha cambiado, no se vuelve a leer
+            rutas_vistas.add(entrada.ruta)
+            if firmas_previas.get(entrada.ruta) == (entrada.tamano, entrada.mtime_ns):
+                contadores["sin_cambios"] += 1
+                continue
 
-                # Ignorar archivos sin extensión
-                if not extension:
-                    archivos_ignorados += 1
-                    continue
-                
-                # 2. FILTRO DE EXTENSIONES (BLACKLIST)
-                if extension in EXTENSIONES_IGNORADAS:
-                    archivos_ignorados += 1
+            # 3b. MOVIMIENTOS: ruta nueva con el inodo de un activo que ya no está donde estaba
+            if entrada.ruta not in firmas_previas and firmas_previas:
+                if por_inodo is None:
+                    por_inodo = gestor_db.obtener_inodos_activos(ruta_raiz)
+                origen = _origen_movido(entrada, por_inodo, firmas_previas)
+                if origen and gestor_db.mover_activo(origen, entrada.ruta, entrada.nombre, extension):
+                    del firmas_previas[origen]
+                    contadores["movidos"] += 1
                     continue
-                
-                # (Pequeño ajuste para ignorar temporales de Office)
-                if filename.startswith("~$"):
-                    archivos_ignorados += 1
+            
+            # 4. FILTRO DE EXTENSIONES (WHITELIST) -> procesar en silencio
+            # 5. PUESTO DE CONTROL (GREYLIST / DESCONOCIDOS)
+            # Si no es Blacklist ni Whitelist y no hay decisión, se apunta para revisar luego
+            if estado == DESCONOCIDO:
+                decision = manejar_decision_archivo(entrada.ruta, extension)
+                if decision == 'pendiente':
+                    pendientes.append((entrada.ruta, extension, entrada.tamano, entrada.mtime_ns))
+                    if len(pendientes) >= 1000:
+                        gestor_db.registrar_archivos_pendientes(pendientes)
+                        pendientes = []
+                    contadores["pendientes"] += 1
                     continue
-                
-                # 3. FILTRO DE EXTENSIONES (WHITELIST)
-                if extension in EXTENSIONES_PERMITIDAS:
-                    # Procesar en silencio
-                    archivos_procesados += procesar_archivo_en_db(ruta_absoluta_path, ruta_absoluta_str, extension)
+                if decision != 'procesar_siempre':
+                    contadores["ignorados"] += 1
                     continue
 
-                # 4. PUESTO DE CONTROL (GREYLIST / DESCONOCIDOS)
-                # Si llegamos aquí, no es Blacklist ni Whitelist
-                decision = manejar_decision_archivo(ruta_absoluta_path, extension)
-                
-                if decision in ('procesar_una_vez', 'procesar_siempre'):
-                    archivos_procesados += procesar_archivo_en_db(ruta_absoluta_path, ruta_absoluta_str, extension)
-                else:
-                    # (decisión es 'ignorar_una_vez' o 'ignorar_siempre')
-                    archivos_ignorados += 1
+            contadores["procesados"] += 1
+            yield preparar_registro_activo(entrada, extension)
+
+        gestor_db.registrar_archivos_pendientes(pendientes)
+
+        # 6. RECONCILIACIÓN: lo que estaba en la DB y no hemos visto, ha desaparecido.
+        # Si el recorrido falló en alguna carpeta (ej. unidad de red caída) no marcamos nada:
+        # preferimos una lápida de menos que dar por borrado medio proyecto.
+        if errores_recorrido:
+            print(f"ADVERTENCIA: {len(errores_recorrido)} carpetas no se pudieron leer en '{ruta_raiz}'. "
+                  "No se marcan archivos eliminados en esta raíz.")
+            continue
+        desaparecidos = firmas_previas.keys() - rutas_vistas
+        contadores["eliminados"] += gestor_db.marcar_activos_eliminados(desaparecidos)
+
+def mapear_carpetas_raiz_interactivo():
+    """
+    Función principal que recorre las carpetas raíz
+    y usa el "Puesto de Control".
+    """
+    print("Iniciando mapeo INTERACTIVO de activos...")
+    contadores = {"procesados": 0, "sin_cambios": 0, "ignorados": 0, "pendientes": 0, "movidos": 0, "eliminados": 0}
+
+    gestor_db.inicializar_base_de_datos()
+    cargar_decisiones()
+
+    # Recorrido -> pool de hash -> volcado por lotes (transacciones grandes, no una por archivo)
+    estadisticas = PipelineEscaneo(recorrer_activos(contadores)).ejecutar()
+    contadores["procesados"] = estadisticas["hasheados"]
+
+    # Hash completo solo donde la huella parcial no basta para distinguir archivos
+    huellas.resolver_colisiones()
 
     print("--- Mapeo Completado ---")
-    print(f"Total de activos procesados/actualizados: {archivos_procesados}")
-    print(f"Total de archivos ignorados (Seguridad/Ruido): {archivos_ignorados}")
+    print(f"Total de activos procesados/actualizados: {contadores['procesados']}")
+    print(f"Total de activos sin cambios (no re-hasheados): {contadores['sin_cambios']}")
+    print(f"Total de archivos ignorados (Seguridad/Ruido): {contadores['ignorados']}")
+    print(f"Total de activos movidos o renombrados (sin re-hashear): {contadores['movidos']}")
+    print(f"Total de activos marcados como eliminados: {contadores['eliminados']}")
+    if contadores["pendientes"]:
+        print(f"Archivos con extensión desconocida en espera: {contadores['pendientes']} "
+              "(revísalos con: python -m src.mapeador_interactivo --revisar)")
+
+def reescanear_carpetas(carpetas):
+    """
+    Escaneo incremental de solo 'carpetas' (Path, con sus subcarpetas) y sin preguntas.
+    Lo usa el vigilante de archivos para recuperar los eventos que no cupieron en su cola.
+    Devuelve los contadores del recorrido.
+    """
+    contadores = {"procesados": 0, "sin_cambios": 0, "ignorados": 0, "pendientes": 0, "movidos": 0, "eliminados": 0}
+    cargar_decisiones()
+    estadisticas = PipelineEscaneo(recorrer_activos(contadores, carpetas)).ejecutar()
+    contadores["procesados"] = estadisticas["hasheados"]
+    huellas.resolver_colisiones()
+    return contadores
+
+def _registros_pendientes(rutas):
+    """Fuente para PipelineEscaneo a partir de archivos apartados por el Puesto de Control."""
+    for ruta_str in rutas:
+        entrada = utils.entrada_archivo(ruta_str)
+        if entrada is None:
+            continue # Ya no existe
+        yield preparar_registro_activo(entrada, extension_de(entrada.nombre))
+
+def procesar_pendientes_extension(extension):
+    """Indexa de golpe todos los archivos en espera de una extensión aprobada."""
+    rutas = gestor_db.obtener_archivos_pendientes(extension)
+    if rutas:
+        print(f"Indexando {len(rutas)} archivos '{extension}' que estaban en espera...")
+        PipelineEscaneo(_registros_pendientes(rutas)).ejecutar()
+    gestor_db.borrar_archivos_pendientes(extension)
+    return len(rutas)
+
+def revisar_decisiones_pendientes():
+    """
+    Comando de revisión del Puesto de Control: recorre las extensiones en espera
+    (agrupadas, con número de archivos y ejemplos) y aplica cada decisión a todos
+    sus archivos de una vez.
+    """
+    gestor_db.inicializar_base_de_datos()
+    cargar_decisiones()
+    grupos = gestor_db.resumen_archivos_pendientes()
+    if not grupos:
+        print("No hay archivos esperando decisión.")
+        return
+
+    print(f"Hay {len(grupos)} extensiones desconocidas esperando decisión.")
+    for extension, num_archivos, peso_total, muestras in grupos:
+        decision = preguntar_decision_extension(extension, num_archivos, peso_total, muestras)
+        if decision == 'salir':
+            break
+        if decision == 'mas_tarde':
+            continue
+
+        gestor_db.guardar_decision_extension(extension, decision)
+        DECISIONES_CACHE[extension] = decision
+        if decision == 'procesar_siempre':
+            print(f"✅ OK. Todos los archivos '{extension}' se procesarán.")
+            procesar_pendientes_extension(extension)
+        else:
+            print(f"❌ OK. Todos los archivos '{extension}' se ignorarán.")
+            gestor_db.borrar_archivos_pendientes(extension)
+    huellas.resolver_colisiones()
 
 
 # --- EJECUCIÓN ---
 if __name__ == "__main__":
-    inicio = time.time()
-    mapear_carpetas_raiz_interactivo()
-    fin = time.time()
-    print(f"El mapeo tomó {fin - inicio:.2f} segundos.")
-    print("\nDecisiones tomadas en esta sesión:")
-    print(DECISIONES_CACHE)
\ No newline at end of file
+    if "--revisar" in sys.argv[1:]:
+        # python -m src.mapeador_interactivo --revisar
+        revisar_decisiones_pendientes()
+    else:
+        inicio = time.time()
+        mapear_carpetas_raiz_interactivo()
+        fin = time.time()
+        print(f"El mapeo tomó {fin - inicio:.2f} segundos.")
+        print("\nDecisiones guardadas:")
+        print(DECISIONES_CACHE)
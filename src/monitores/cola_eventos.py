@@ -0,0 +1,185 @@
+# src/monitores/cola_eventos.py
+# Cola de eventos con "antirrebote" para el vigilante de archivos.
+# Guardar un .dwg o un .xlsx grande dispara una ráfaga de eventos 'modified'.
+# En vez de hashear en cada uno (y bloquear el hilo de watchdog), los eventos se
+# agrupan por ruta y solo se procesan cuando el archivo lleva un rato QUIETO:
+# sin eventos nuevos y con el mismo (tamaño, mtime) durante VENTANA_CALMA_MS.
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+VENTANA_CALMA_MS = 1500        # Tiempo sin cambios antes de procesar un archivo
+HILOS_EVENTOS = 2              # Hilos que hashean/escriben fuera del hilo de watchdog
+MAX_EVENTOS_PENDIENTES = 10000 # Rutas distintas en espera; por encima se rechazan (quien
+                               # encola apunta lo perdido, ver monitor_archivos: reescaneo)
+
+
+class ColaEventosCoalescente:
+    """
+    Cola por ruta: varios eventos de la misma ruta dentro de la ventana de calma
+    se funden en uno. 'procesar(ruta, tipo)' se llama desde los hilos trabajadores.
+    """
+    def __init__(self, procesar, ventana_ms=VENTANA_CALMA_MS, hilos=HILOS_EVENTOS,
+                 max_pendientes=MAX_EVENTOS_PENDIENTES):
+        self.procesar = procesar
+        self.ventana = ventana_ms / 1000
+        self.num_hilos = max(1, hilos)
+        self.max_pendientes = max_pendientes
+
+        # ruta -> [tipo, instante del último evento, firma (tamaño, mtime) vista]
+        # Ordenado por último evento: los que llevan más tiempo quietos van primero.
+        self._pendientes = OrderedDict()
+        self._en_proceso = set()
+        self._cond = threading.Condition()
+        self._parar = False
+        self._hilos = []
+
+        # Contadores
+        self.recibidos = 0
+        self.coalescidos = 0
+        self.descartados = 0
+        self.procesados = 0
+        self.errores = 0
+
+    # --- ENTRADA (hilo de watchdog: no puede bloquearse) ---
+
+    def encolar(self, ruta, tipo):
+        """
+        Apunta un evento. Devuelve False si se descartó por estar la cola llena: el hilo de
+        watchdog no puede esperar, así que quien encola debe apuntarlo y recuperarlo luego.
+        Un CREADO seguido de MODIFICADO sigue siendo CREADO.
+        """
+        with self._cond:
+            self.recibidos += 1
+            ahora = time.monotonic()
+            pendiente = self._pendientes.get(ruta)
+            if pendiente is not None:
+                self.coalescidos += 1
+                pendiente[1] = ahora
+                self._pendientes.move_to_end(ruta)
+                return True
+            if len(self._pendientes) >= self.max_pendientes:
+                self.descartados += 1
+                return False
+            self._pendientes[ruta] = [tipo, ahora, None]
+            self._cond.notify()
+            return True
+
+    def cancelar(self, ruta):
+        """Olvida los eventos pendientes de una ruta (ej. porque se ha borrado). Devuelve su tipo o None."""
+        with self._cond:
+            pendiente = self._pendientes.pop(ruta, None)
+            return pendiente[0] if pendiente else None
+
+    def cancelar_carpeta(self, carpeta):
+        """Olvida los eventos pendientes de todo lo que cuelga de 'carpeta'. Devuelve cuántos."""
+        prefijo = os.path.join(carpeta, "")
+        with self._cond:
+            rutas = [ruta for ruta in self._pendientes if ruta.startswith(prefijo)]
+            for ruta in rutas:
+                del self._pendientes[ruta]
+            return len(rutas)
+
+    def mover_carpeta(self, origen, destino):
+        """
+        Una carpeta renombrada: los eventos pendientes de su interior pasan a la ruta nueva
+        (conservan su tipo y su reloj de calma). Devuelve cuántos se han movido.
+        """
+        prefijo = os.path.join(origen, "")
+        nuevo_prefijo = os.path.join(destino, "")
+        with self._cond:
+            rutas = [ruta for ruta in self._pendientes if ruta.startswith(prefijo)]
+            for ruta in rutas:
+                datos = self._pendientes.pop(ruta)
+                self._pendientes[nuevo_prefijo + ruta[len(prefijo):]] = datos
+            return len(rutas)
+
+    # --- TRABAJADORES ---
+
+    def _siguiente_listo(self):
+        """Con el lock cogido: devuelve (ruta, datos) del primer evento en calma, o el tiempo a esperar."""
+        ahora = time.monotonic()
+        for ruta, datos in self._pendientes.items():
+            espera = datos[1] + self.ventana - ahora
+            if espera > 0:
+                return None, espera # Los siguientes son aún más recientes
+            if ruta not in self._en_proceso:
+                del self._pendientes[ruta]
+                self._en_proceso.add(ruta)
+                return (ruta, datos), 0
+        return None, self.ventana
+
+    def _bucle(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._parar:
+                        return
+                    listo, espera = self._siguiente_listo()
+                    if listo:
+                        break
+                    self._cond.wait(espera)
+            ruta, (tipo, _, firma_anterior) = listo
+            try:
+                self._atender(ruta, tipo, firma_anterior)
+            finally:
+                with self._cond:
+                    self._en_proceso.discard(ruta)
+
+    def _atender(self, ruta, tipo, firma_anterior):
+        try:
+            st = os.stat(ruta)
+        except OSError:
+            return # Ya no existe: el borrado lo gestiona el vigilante
+        firma = (st.st_size, st.st_mtime_ns)
+        if firma != firma_anterior:
+            # Aún se está escribiendo (o es la primera comprobación): otra ventana de calma
+            with self._cond:
+                pendiente = self._pendientes.get(ruta)
+                if pendiente is None:
+                    self._pendientes[ruta] = [tipo, time.monotonic(), firma]
+                else:
+                    pendiente[2] = firma # Llegó otro evento mientras tanto: ya tiene su reloj
+                self._cond.notify()
+            return
+        try:
+            self.procesar(ruta, tipo)
+            with self._cond:
+                self.procesados += 1
+        except Exception as e:
+            with self._cond:
+                self.errores += 1
+            print(f"Error procesando evento {tipo} en {ruta}: {e}")
+
+    # --- CONTROL ---
+
+    def iniciar(self):
+        self._parar = False
+        self._hilos = [
+            threading.Thread(target=self._bucle, name=f"ColaEventos-{i}", daemon=True)
+            for i in range(self.num_hilos)
+        ]
+        for hilo in self._hilos:
+            hilo.start()
+
+    def detener(self, timeout=5):
+        """Para los trabajadores (los eventos aún no calmados se descartan)."""
+        with self._cond:
+            self._parar = True
+            self._cond.notify_all()
+        for hilo in self._hilos:
+            hilo.join(timeout)
+
+    def estadisticas(self):
+        with self._cond:
+            return {
+                "recibidos": self.recibidos,
+                "coalescidos": self.coalescidos,
+                "descartados": self.descartados,
+                "procesados": self.procesados,
+                "errores": self.errores,
+                "pendientes": len(self._pendientes),
+                "en_proceso": len(self._en_proceso),
+            }
@@ -0,0 +1,259 @@
+# src/monitores/metricas_recursos.py
+# Serie temporal continua de la carga del equipo (no solo las alertas de monitor_recursos).
+#
+#   psutil (cada segundo) --> anillo 1 s --cierra minuto--> anillo 1 min --cierra hora--> anillo 1 h
+#                                 |                            |                            |
+#                                 +--------- Metricas_Recursos (Resolucion = 1 / 60 / 3600) -+
+#
+# - Cada nivel vive primero en memoria, en un anillo de arrays NumPy de tamaño fijo: las
+#   consultas recientes ("¿cómo de cargado ha estado el PC los últimos 15 minutos?") no tocan
+#   la DB ni leen texto de Registros.
+# - Al cerrar cada minuto se guardan de una vez sus filas de 1 s y la fila agregada (escritura
+#   sin espera); al cerrar cada hora, su fila y la purga de lo que ha salido de RETENCION.
+# - Todas las resoluciones tienen las mismas columnas (gestor_db.COLUMNAS_METRICAS): una fila
+#   de 1 s es un agregado de una sola muestra. Así agregar un nivel sobre otro es siempre igual.
+
+import threading
+import time
+
+import numpy as np
+import psutil
+
+try:
+    from src import gestor_db
+except ImportError:
+    import gestor_db
+
+INTERVALO_METRICAS = 1 # Segundos entre muestras
+RESOLUCIONES = (1, 60, 3600)
+CAPACIDAD_MEMORIA = {1: 3600, 60: 24 * 60, 3600: 7 * 24} # Filas en memoria: 1 h, 1 día, 1 semana
+RETENCION = {1: 6 * 3600, 60: 30 * 86400, 3600: 2 * 365 * 86400} # Segundos que se conservan en la DB
+MAX_PUNTOS_VENTANA = 1500 # 'ventana' sin resolución elige la más fina que no pase de esto
+
+# Columnas numéricas de cada fila (el proceso top, texto, va aparte)
+CAMPOS = (
+    "muestras", "cpu_media", "cpu_max", "ram_media", "ram_max", "disco_lectura", "disco_escritura",
+    "red_recibida", "red_enviada", "cpu_proceso_top",
+)
+_I = {campo: i for i, campo in enumerate(CAMPOS)}
+_MEDIAS = [_I[c] for c in ("cpu_media", "ram_media", "disco_lectura", "disco_escritura", "red_recibida", "red_enviada")]
+_MAXIMOS = [_I[c] for c in ("cpu_max", "ram_max", "cpu_proceso_top")]
+
+
+class AnilloMetricas:
+    """Últimas 'capacidad' filas de una resolución, en arrays de tamaño fijo."""
+    def __init__(self, capacidad):
+        self.capacidad = capacidad
+        self.instantes = np.zeros(capacidad, dtype=np.int64)
+        self.valores = np.zeros((capacidad, len(CAMPOS)), dtype=np.float64)
+        self.procesos = np.empty(capacidad, dtype=object)
+        self.total = 0 # Filas añadidas desde el arranque
+
+    def agregar(self, instante, valores, proceso):
+        i = self.total % self.capacidad
+        self.instantes[i] = instante
+        self.valores[i] = valores
+        self.procesos[i] = proceso
+        self.total += 1
+
+    def ultimo_instante(self):
+        return int(self.instantes[(self.total - 1) % self.capacidad]) if self.total else None
+
+    def primer_instante(self):
+        if not self.total:
+            return None
+        return int(self.instantes[0 if self.total <= self.capacidad else self.total % self.capacidad])
+
+    def ventana(self, desde, hasta):
+        """(instantes, valores, procesos) con desde <= instante < hasta, de la más antigua a la más nueva."""
+        if self.total <= self.capacidad:
+            orden = slice(0, self.total)
+        else:
+            inicio = self.total % self.capacidad
+            orden = np.r_[inicio:self.capacidad, 0:inicio]
+        instantes = self.instantes[orden]
+        # Los instantes crecen: la ventana es un tramo contiguo
+        a, b = np.searchsorted(instantes, [desde, hasta])
+        return instantes[a:b], self.valores[orden][a:b], self.procesos[orden][a:b]
+
+
+def agregar_filas(valores, procesos):
+    """Una fila que resume varias: medias ponderadas por muestras, máximos y el proceso del pico."""
+    muestras = valores[:, _I["muestras"]]
+    fila = np.empty(len(CAMPOS))
+    fila[_I["muestras"]] = muestras.sum()
+    fila[_MEDIAS] = muestras @ valores[:, _MEDIAS] / max(fila[_I["muestras"]], 1)
+    fila[_MAXIMOS] = valores[:, _MAXIMOS].max(axis=0)
+    return fila, procesos[int(valores[:, _I["cpu_proceso_top"]].argmax())]
+
+def _filas_db(instantes, valores, procesos):
+    return [
+        (int(instante), int(fila[0]), *map(float, fila[1:]), proceso)
+        for instante, fila, proceso in zip(instantes, valores, procesos)
+    ]
+
+def _cpu_ocupada(tiempos):
+    """(ocupada, total) como psutil.cpu_percent: ni idle ni iowait cuentan como uso."""
+    total = sum(tiempos)
+    return total - tiempos.idle - getattr(tiempos, "iowait", 0.0), total
+
+class MedidorCPU:
+    """
+    % de CPU del sistema desde la lectura anterior de ESTE medidor. psutil.cpu_percent(interval=None)
+    guarda una sola referencia para todo el proceso: dos llamadores se recortarían la ventana.
+    La primera lectura mide desde que se crea el medidor.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._previa = _cpu_ocupada(psutil.cpu_times())
+
+    def porcentaje(self):
+        ocupada, total = _cpu_ocupada(psutil.cpu_times())
+        with self._lock:
+            (ocupada_previa, total_previo), self._previa = self._previa, (ocupada, total)
+        return 100.0 * (ocupada - ocupada_previa) / (total - total_previo) if total > total_previo else 0.0
+
+
+class SerieMetricas:
+    """
+    Muestras de 1 s con sus agregados de 1 min y 1 h, en memoria y en la DB.
+    'muestrear' la llama el bucle de monitor_recursos; 'ventana' y 'carga_reciente', cualquiera.
+    """
+    def __init__(self, guardar=True):
+        self.guardar = guardar
+        self.anillos = {resolucion: AnilloMetricas(CAPACIDAD_MEMORIA[resolucion]) for resolucion in RESOLUCIONES}
+        self._lock = threading.Lock()
+        self._previa = None # (monotonic, cpu ocupada, cpu total, disco, red) de la muestra anterior
+
+    # --- ESCRITURA ---
+
+    def muestrear(self, proceso_top="", cpu_proceso_top=0.0):
+        """
+        Lee CPU, RAM, disco y red (deltas desde la llamada anterior) y registra la muestra.
+        La primera llamada solo guarda la referencia. El proceso top lo pone quien llama
+        (ver monitor_recursos.MUESTREADOR_PROCESOS): medirlo cada segundo cuesta demasiado.
+        """
+        ahora = time.monotonic()
+        ocupada, total = _cpu_ocupada(psutil.cpu_times())
+        disco = psutil.disk_io_counters() # None si el sistema no lo da (algunos contenedores)
+        red = psutil.net_io_counters()
+        previa, self._previa = self._previa, (ahora, ocupada, total, disco, red)
+        if previa is None:
+            return None
+        segundos = ahora - previa[0]
+        if segundos <= 0:
+            return None
+        cpu = 100.0 * (ocupada - previa[1]) / (total - previa[2]) if total > previa[2] else 0.0
+        lectura = escritura = 0.0
+        if disco is not None and previa[3] is not None:
+            lectura = (disco.read_bytes - previa[3].read_bytes) / segundos
+            escritura = (disco.write_bytes - previa[3].write_bytes) / segundos
+        recibida = (red.bytes_recv - previa[4].bytes_recv) / segundos
+        enviada = (red.bytes_sent - previa[4].bytes_sent) / segundos
+        ram = psutil.virtual_memory().percent
+        return self.registrar(
+            int(time.time()), cpu, ram, max(lectura, 0.0), max(escritura, 0.0),
+            max(recibida, 0.0), max(enviada, 0.0), proceso_top or "", cpu_proceso_top or 0.0,
+        )
+
+    def registrar(self, instante, cpu, ram, disco_lectura, disco_escritura, red_recibida, red_enviada,
+                  proceso_top="", cpu_proceso_top=0.0):
+        """Añade una muestra de 1 s ('instante' en epoch) y cierra el minuto/hora que haya terminado."""
+        valores = (1, cpu, cpu, ram, ram, disco_lectura, disco_escritura, red_recibida, red_enviada, cpu_proceso_top)
+        with self._lock:
+            segundos = self.anillos[1]
+            ultimo = segundos.ultimo_instante()
+            if ultimo is not None and instante <= ultimo:
+                return False # Mismo segundo (o reloj hacia atrás): ya hay muestra
+            if ultimo is not None and instante // 60 != ultimo // 60:
+                self._cerrar(1, ultimo // 60 * 60, 60)
+            segundos.agregar(instante, valores, proceso_top)
+            return True
+
+    def _cerrar(self, origen, inicio, resolucion):
+        """Agrega el intervalo [inicio, inicio + resolucion) de 'origen' en 'resolucion' (con el lock)."""
+        instantes, valores, procesos = self.anillos[origen].ventana(inicio, inicio + resolucion)
+        if not len(instantes):
+            return
+        fila, proceso = agregar_filas(valores, procesos)
+        destino = self.anillos[resolucion]
+        anterior = destino.ultimo_instante()
+        destino.agregar(inicio, fila, proceso)
+        if self.guardar:
+            if origen == 1:
+                gestor_db.guardar_metricas(1, _filas_db(instantes, valores, procesos))
+            gestor_db.guardar_metricas(resolucion, _filas_db([inicio], [fila], [proceso]))
+        if resolucion == 60 and anterior is not None and inicio // 3600 != anterior // 3600:
+            self._cerrar(60, anterior // 3600 * 3600, 3600)
+            if self.guardar:
+                gestor_db.purgar_metricas(RETENCION, inicio)
+
+    def volcar(self):
+        """Guarda el minuto en curso (filas de 1 s aún sin cerrar). Para apagar sin perderlo."""
+        with self._lock:
+            ultimo = self.anillos[1].ultimo_instante()
+            if self.guardar and ultimo is not None:
+                gestor_db.guardar_metricas(1, _filas_db(*self.anillos[1].ventana(ultimo // 60 * 60, ultimo + 1)))
+
+    # --- CONSULTA ---
+
+    def _elegir_resolucion(self, segundos):
+        for resolucion in RESOLUCIONES:
+            if segundos / resolucion <= MAX_PUNTOS_VENTANA and segundos <= RETENCION[resolucion]:
+                return resolucion
+        return RESOLUCIONES[-1]
+
+    def ventana(self, segundos=900, resolucion=None, hasta=None):
+        """
+        Métricas de los últimos 'segundos' (hasta 'hasta', epoch; por defecto ahora) como
+        {"instante": array, <cada campo de CAMPOS>: array, "proceso_top": array}.
+        Sin 'resolucion' se elige la más fina con como mucho MAX_PUNTOS_VENTANA filas. Sale de
+        memoria si el anillo cubre la ventana; si no, de la DB (completada con lo aún no guardado).
+        Los minutos y horas solo aparecen una vez cerrados.
+        """
+        hasta = int(time.time()) + 1 if hasta is None else int(hasta)
+        desde = hasta - int(segundos)
+        resolucion = resolucion or self._elegir_resolucion(segundos)
+        with self._lock:
+            anillo = self.anillos[resolucion]
+            primero = anillo.primer_instante()
+            instantes, valores, procesos = anillo.ventana(desde, hasta)
+        if self.guardar and (primero is None or primero > desde):
+            filas = gestor_db.leer_metricas(resolucion, desde, primero if primero is not None else hasta)
+            if filas:
+                instantes = np.concatenate([np.array([f[0] for f in filas], dtype=np.int64), instantes])
+                valores = np.concatenate([np.array([f[1:-1] for f in filas], dtype=np.float64).reshape(-1, len(CAMPOS)), valores])
+                procesos = np.concatenate([np.array([f[-1] for f in filas], dtype=object), procesos])
+        resultado = {"instante": instantes, "proceso_top": procesos}
+        for campo, columna in zip(CAMPOS, valores.T):
+            resultado[campo] = columna
+        return resultado
+
+    def carga_reciente(self, minutos=15):
+        """
+        Resumen de la carga de los últimos 'minutos': medias, máximos y percentil 95 de CPU,
+        RAM, disco y red, y el proceso que más veces ha estado arriba. None si no hay datos.
+        """
+        datos = self.ventana(minutos * 60)
+        muestras = datos["muestras"]
+        if not len(muestras) or muestras.sum() == 0:
+            return None
+        peso = muestras / muestras.sum()
+        procesos, veces = np.unique(datos["proceso_top"][datos["proceso_top"] != ""].astype(str), return_counts=True)
+        return {
+            "muestras": int(muestras.sum()),
+            "cpu_media": float(peso @ datos["cpu_media"]),
+            "cpu_max": float(datos["cpu_max"].max()),
+            "cpu_p95": float(np.percentile(datos["cpu_media"], 95)),
+            "ram_media": float(peso @ datos["ram_media"]),
+            "ram_max": float(datos["ram_max"].max()),
+            "disco_bytes_s": float(peso @ (datos["disco_lectura"] + datos["disco_escritura"])),
+            "red_bytes_s": float(peso @ (datos["red_recibida"] + datos["red_enviada"])),
+            "proceso_top": str(procesos[veces.argmax()]) if len(procesos) else None,
+        }
+
+
+SERIE_METRICAS = SerieMetricas()
+
+def carga_reciente(minutos=15):
+    return SERIE_METRICAS.carga_reciente(minutos)
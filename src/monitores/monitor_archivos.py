@@ -2,109 +2,388 @@
 # ATENCIÓN: NO EJECUTAR ESTE SCRIPT HASTA DESPUÉS DEL MAPEO INICIAL.
 # Este es el "Vigilante" en tiempo real que mantiene la DB actualizada.
 
+import threading
 import time
 import os
+from concurrent.futures import ThreadPoolExecutor
 from watchdog.observers import Observer
+from watchdog.observers.polling import PollingObserver
 from watchdog.events import FileSystemEventHandler
 from pathlib import Path
 
 # Importamos nuestras herramientas
 try:
     from src import gestor_db
+    from src import mapeador_interactivo
     from src import utils
-    from src.config_scanner import (
-        CARPETAS_RAIZ_A_ESCANEAR, 
-        CARPETAS_IGNORADAS, EXTENSIONES_IGNORADAS,
-        EXTENSIONES_PERMITIDAS
-    )
+    from src.config_scanner import CARPETAS_RAIZ_A_ESCANEAR, UNIDADES_DE_RED, INTERVALO_SONDEO_RED
+    from src.filtro_rutas import FILTRO_MONITOR, PERMITIDO, DESCONOCIDO, extension_de
+    from src.monitores.cola_eventos import ColaEventosCoalescente
     
 except ImportError:
     # Fallback por si la ruta de importación falla
     import gestor_db
+    import mapeador_interactivo
     import utils
     # Necesitamos las mismas listas de seguridad
+    from config_scanner import CARPETAS_RAIZ_A_ESCANEAR, UNIDADES_DE_RED, INTERVALO_SONDEO_RED
+    from filtro_rutas import FILTRO_MONITOR, PERMITIDO, DESCONOCIDO, extension_de
+    from cola_eventos import ColaEventosCoalescente
 
-def estimar_tokens(ruta_archivo):
-    """Calcula el peso en tokens solo para archivos permitidos."""
-    try:
-        path_obj = Path(ruta_archivo)
-        ext = path_obj.suffix.lower()
-        
-        # 1. Solo calcular si la extensión está en la lista de PERMITIDAS
-        if ext not in EXTENSIONES_PERMITIDAS:
-            return 0 
-        
-        # 2. Si es una extensión permitida, estimar el peso
-        tamano = os.path.getsize(ruta_archivo)
-        return int(tamano / 4) # Regla: 1 token ~= 4 caracteres
-    except:
-        return 0
+# Con la cola de eventos llena, las carpetas de los eventos perdidos se reescanean
+# (mapeador_interactivo.reescanear_carpetas) cuando ha pasado la ráfaga.
+ESPERA_REESCANEO_DESBORDE = 60  # Segundos desde el primer evento perdido hasta el reescaneo
+MAX_CARPETAS_DESBORDADAS = 1000 # Con más carpetas distintas se reescanea la raíz entera
 
 class GestorEventosHandler(FileSystemEventHandler):
-    # ... (El método __init__ y es_ruta_segura se mantienen igual) ...
-    def __init__(self):
+    """
+    Los métodos on_* corren en el hilo de watchdog: solo filtran y encolan.
+    El hash y la escritura en la DB ('procesar_evento') los hacen los hilos de
+    la cola de eventos, una vez por ráfaga de cambios del mismo archivo.
+    Borrados y movimientos no necesitan hash: van a un único hilo aparte
+    (en orden de llegada) que solo toca rutas y lápidas en la DB.
+    Si la cola se llena no se espera (watchdog perdería eventos del SO): se apunta la
+    carpeta del evento y se reescanea después de forma incremental.
+    """
+    def __init__(self, raices=CARPETAS_RAIZ_A_ESCANEAR):
         super().__init__()
-        self.carpetas_ignoradas = CARPETAS_IGNORADAS
-        self.extensiones_ignoradas = EXTENSIONES_IGNORADAS
-
-    def es_ruta_segura(self, ruta_str):
-        # ... (Usa la versión corregida que te di antes) ...
-        ruta_path = Path(ruta_str)
-        extension = ruta_path.suffix.lower()
-        filename = ruta_path.name
-
-        # CRITERIO DE PORTABILIDAD: Ignorar archivos temporales (Windows/Linux)
-        if (extension in self.extensiones_ignoradas or 
-            filename.startswith("~$") or      # Windows Office temps
-            filename.startswith("~") or       # Otros bloqueos de Windows
-            filename.startswith(".")):        # Archivos ocultos/temporales en Linux/macOS
-            return False
-    
-        partes_ruta = set(Path(ruta_str).parts)
-        if not self.carpetas_ignoradas.isdisjoint(partes_ruta): return False
-        return True
+        # Mismo motor de filtrado que el mapeador (reglas compiladas una sola vez)
+        self.filtro = FILTRO_MONITOR
+        # Decisiones del Puesto de Control (las refresca también cada reescaneo por desborde)
+        mapeador_interactivo.cargar_decisiones()
+        self.raices = tuple(str(raiz) for raiz in raices)
+        self.cola = ColaEventosCoalescente(self.procesar_evento)
+        self.cola.iniciar()
+        self.rutas = ThreadPoolExecutor(max_workers=1, thread_name_prefix="Vigilante-Rutas")
+        self._lock_desborde = threading.Lock()
+        self._desbordadas = set() # Carpetas con eventos que no cupieron en la cola
+        self._reescaneo = None    # threading.Timer del próximo reescaneo
+        self._detenido = False
 
-    def procesar_evento(self, ruta_str, tipo_evento):
-        if not self.es_ruta_segura(ruta_str): return
+    def detener(self):
+        """Para los hilos de la cola de eventos y termina los borrados/movimientos ya recibidos."""
+        with self._lock_desborde:
+            self._detenido = True
+            if self._reescaneo is not None:
+                self._reescaneo.cancel()
+            if self._desbordadas:
+                print(f"ADVERTENCIA: {len(self._desbordadas)} carpetas con eventos perdidos sin reescanear "
+                      "(las recogerá el próximo mapeo).")
+        self.cola.detener()
+        self.rutas.shutdown(wait=True)
+
+    def decision_ruta(self, ruta_str):
+        """
+        Qué hacer con un archivo según el filtro y el Puesto de Control: 'procesar',
+        'pendiente' (extensión desconocida sin decidir) o None si no se vigila.
+        """
+        # CRITERIO DE PORTABILIDAD: el filtro del monitor ignora además archivos
+        # temporales de Windows ("~$", "~") y ocultos/temporales de Linux/macOS (".")
+        if self.filtro.ruta_ignorada(ruta_str, self.raices):
+            return None
+        # Igual que el mapeador: sin extensión no se inventaría. Así los temporales
+        # de Office ("A1B2C3D4") no roban el activo al renombrarse sobre el original.
+        estado, extension = self.filtro.clasificar_archivo(os.path.basename(ruta_str))
+        if estado == PERMITIDO:
+            return 'procesar'
+        if estado != DESCONOCIDO:
+            return None
+        decision = mapeador_interactivo.manejar_decision_archivo(ruta_str, extension)
+        if decision == 'pendiente':
+            return 'pendiente'
+        return 'procesar' if decision == 'procesar_siempre' else None
+
+    def dentro_de_raices(self, ruta_str):
+        return ruta_str.startswith(self.raices)
+
+    def carpeta_vigilable(self, carpeta):
+        """Una carpeta cuenta si está bajo alguna raíz y ni ella ni sus padres están en la blacklist."""
+        # La barra final hace que 'ruta_ignorada' trate el nombre de la carpeta como un padre más
+        return self.dentro_de_raices(carpeta) and not self.filtro.ruta_ignorada(os.path.join(carpeta, ""), self.raices)
+
+    def _en_hilo_rutas(self, funcion, *args):
+        futuro = self.rutas.submit(funcion, *args)
+        futuro.add_done_callback(_avisar_error(funcion.__name__))
+
+    def encolar_evento(self, ruta_str, tipo_evento):
+        decision = self.decision_ruta(ruta_str)
+        if decision == 'procesar':
+            self._encolar(ruta_str, tipo_evento)
+        elif decision == 'pendiente':
+            self._en_hilo_rutas(self.apuntar_pendiente, ruta_str)
+
+    def _encolar(self, ruta_str, tipo_evento):
+        if not self.cola.encolar(ruta_str, tipo_evento):
+            self._apuntar_desborde(ruta_str)
 
+    # --- DESBORDE DE LA COLA (reescaneo incremental) ---
+
+    def _apuntar_desborde(self, ruta_str):
+        carpeta = os.path.dirname(ruta_str)
+        with self._lock_desborde:
+            if len(self._desbordadas) >= MAX_CARPETAS_DESBORDADAS and carpeta not in self._desbordadas:
+                carpeta = next((raiz for raiz in self.raices if carpeta.startswith(raiz)), carpeta)
+            self._desbordadas.add(carpeta)
+            if self._reescaneo is None and not self._detenido:
+                print(f"ADVERTENCIA: Cola de eventos llena; lo perdido se reescaneará en {ESPERA_REESCANEO_DESBORDE} s.")
+                self._programar_reescaneo()
+
+    def _programar_reescaneo(self):
+        """Con _lock_desborde cogido."""
+        self._reescaneo = threading.Timer(ESPERA_REESCANEO_DESBORDE, self.reescanear_desbordadas)
+        self._reescaneo.daemon = True
+        self._reescaneo.start()
+
+    def reescanear_desbordadas(self):
+        """Escaneo incremental de las carpetas apuntadas por desborde. Devuelve cuántas."""
+        with self._lock_desborde:
+            carpetas, self._desbordadas = _sin_anidadas(self._desbordadas), set()
+        if carpetas:
+            print(f"Monitor: reescaneando {len(carpetas)} carpetas con eventos perdidos...")
+            try:
+                mapeador_interactivo.reescanear_carpetas([Path(carpeta) for carpeta in carpetas])
+            except Exception as e:
+                print(f"Error en el vigilante (reescaneo): {e}")
+        with self._lock_desborde:
+            # Lo que se perdió durante el reescaneo espera a la siguiente ronda
+            self._reescaneo = None
+            if self._desbordadas and not self._detenido:
+                self._programar_reescaneo()
+        return len(carpetas)
+
+    def procesar_evento(self, ruta_str, tipo_evento):
         path_obj = Path(ruta_str)
         if not path_obj.exists(): return # Si fue borrado muy rápido
 
         print(f"Monitor: {tipo_evento} -> {path_obj.name}")
         
         # 1. Calcular datos extendidos
-        hash_val = utils.calcular_hash_archivo(path_obj)
-        peso = os.path.getsize(path_obj)
-        tokens = estimar_tokens(path_obj)
+        try:
+            stat_archivo = os.stat(ruta_str)
+        except OSError:
+            return
+        peso = stat_archivo.st_size
+        huellas = utils.calcular_huellas(path_obj, peso)
+        tokens = utils.estimar_tokens(path_obj, peso)
         
-        # 2. Insertar en Activos (Inventario)
-        if hash_val:
-            gestor_db.insertar_activo_completo(
+        # 2. Insertar en Activos (Inventario). Devuelve el ID recién creado/actualizado.
+        if huellas:
+            hash_parcial, hash_val, nivel_hash = huellas
+            id_activo = gestor_db.insertar_activo_completo(
                 ruta=ruta_str,
                 nombre=path_obj.name,
                 ext=path_obj.suffix.lower(),
                 peso=peso,
                 tokens_est=tokens,
-                hash_val=hash_val
+                hash_val=hash_val,
+                mtime_ns=stat_archivo.st_mtime_ns,
+                inodo=utils.inodo_de(stat_archivo),
+                hash_parcial=hash_parcial,
+                nivel_hash=nivel_hash
             )
             
-            # 3. Registrar la Acción (Diario de a Bordo) - Buscamos el ID recién creado/actualizado para vincularlo
-            activo = gestor_db.get_activo_por_ruta(ruta_str)
-            if activo:
-                id_activo = activo[0] # Asumiendo que ID es la primera columna
+            # 3. Registrar la Acción (Diario de a Bordo) vinculada al activo
+            if id_activo:
                 gestor_db.insertar_registro_accion(
                     tipo=f"ARCHIVO_{tipo_evento}", # CREADO o MODIFICADO
                     contexto=path_obj.name,
                     id_activo=id_activo
                 )
 
+    def apuntar_pendiente(self, ruta_str):
+        """Como en el mapeo: la extensión sin decidir no se inventaría, espera en Archivos_Pendientes."""
+        try:
+            stat_archivo = os.stat(ruta_str)
+        except OSError:
+            return
+        nombre = os.path.basename(ruta_str)
+        gestor_db.registrar_archivos_pendientes(
+            [(ruta_str, extension_de(nombre), stat_archivo.st_size, stat_archivo.st_mtime_ns)]
+        )
+
+    # --- BORRADOS Y MOVIMIENTOS (sin re-hash) ---
+
+    def procesar_borrado(self, ruta_str):
+        activo = gestor_db.get_activo_por_ruta(ruta_str)
+        marcados = gestor_db.marcar_activos_eliminados([ruta_str])
+        # En Windows el borrado de una carpeta puede llegar como si fuera un archivo:
+        # el rango por prefijo es un acceso al índice, así que se intenta siempre.
+        marcados += gestor_db.marcar_carpeta_eliminada(ruta_str)
+        if marcados:
+            print(f"Monitor: ELIMINADO -> {os.path.basename(ruta_str)} ({marcados} activos)")
+            gestor_db.insertar_registro_accion(
+                tipo="ARCHIVO_ELIMINADO",
+                contexto=os.path.basename(ruta_str),
+                id_activo=activo[0] if activo else None
+            )
+
+    def procesar_movimiento(self, origen, destino, tipo_pendiente):
+        nombre = os.path.basename(destino)
+        id_activo = gestor_db.mover_activo(origen, destino, nombre, extension_de(nombre))
+        if id_activo:
+            print(f"Monitor: MOVIDO -> {os.path.basename(origen)} => {nombre}")
+            gestor_db.insertar_registro_accion(tipo="ARCHIVO_MOVIDO", contexto=f"{origen} -> {destino}", id_activo=id_activo)
+            if tipo_pendiente:
+                self._encolar(destino, tipo_pendiente) # Tenía cambios sin procesar
+        else:
+            # El origen no estaba inventariado (ej. temporal de guardado renombrado
+            # sobre el original): el destino sí necesita su huella.
+            self._encolar(destino, tipo_pendiente or "MODIFICADO")
+
+    def procesar_movimiento_carpeta(self, origen, destino):
+        movidos = gestor_db.mover_carpeta_activos(origen, destino)
+        if movidos:
+            print(f"Monitor: CARPETA MOVIDA -> {origen} => {destino} ({movidos} activos)")
+            gestor_db.insertar_registro_accion(tipo="CARPETA_MOVIDA", contexto=f"{origen} -> {destino}")
+
+    # --- EVENTOS DE WATCHDOG ---
+
     def on_created(self, event):
-        if not event.is_directory: self.procesar_evento(event.src_path, "CREADO")
+        if not event.is_directory: self.encolar_evento(event.src_path, "CREADO")
 
     def on_modified(self, event):
-        if not event.is_directory: self.procesar_evento(event.src_path, "MODIFICADO")
+        if not event.is_directory: self.encolar_evento(event.src_path, "MODIFICADO")
+
+    def on_deleted(self, event):
+        ruta_str = event.src_path
+        self.cola.cancelar(ruta_str)
+        self.cola.cancelar_carpeta(ruta_str)
+        self._en_hilo_rutas(self.procesar_borrado, ruta_str)
+
+    def on_moved(self, event):
+        origen, destino = event.src_path, event.dest_path
+        if event.is_directory:
+            if self.carpeta_vigilable(destino):
+                self.cola.mover_carpeta(origen, destino)
+                self._en_hilo_rutas(self.procesar_movimiento_carpeta, origen, destino)
+            else:
+                # Movida fuera de las raíces o a una carpeta ignorada: como un borrado
+                self.cola.cancelar_carpeta(origen)
+                self._en_hilo_rutas(self.procesar_borrado, origen)
+            return
+        tipo_pendiente = self.cola.cancelar(origen)
+        decision = self.decision_ruta(destino) if self.dentro_de_raices(destino) else None
+        if decision == 'procesar':
+            self._en_hilo_rutas(self.procesar_movimiento, origen, destino, tipo_pendiente)
+        else:
+            # Renombrado a temporal/ignorado o sacado de las raíces: sale del inventario
+            self._en_hilo_rutas(self.procesar_borrado, origen)
+            if decision == 'pendiente':
+                self._en_hilo_rutas(self.apuntar_pendiente, destino)
+
+
+def _sin_anidadas(carpetas):
+    """Quita las carpetas que cuelgan de otra del conjunto (el reescaneo ya es recursivo)."""
+    elegidas = []
+    for carpeta in carpetas:
+        actual = carpeta
+        while True:
+            padre = os.path.dirname(actual)
+            if padre == actual:
+                elegidas.append(carpeta)
+                break
+            if padre in carpetas:
+                break
+            actual = padre
+    return elegidas
+
+def _avisar_error(etiqueta):
+    """Callback para los futuros del hilo de rutas: que un fallo no pase desapercibido."""
+    def _callback(futuro):
+        error = futuro.exception()
+        if error:
+            print(f"Error en el vigilante ({etiqueta}): {error}")
+    return _callback
+
+def es_raiz_de_red(raiz):
+    """True para Google Drive (G:) y rutas UNC: ahí los eventos nativos no son fiables."""
+    return str(raiz).upper().startswith(UNIDADES_DE_RED)
+
+
+# --- EJECUCIÓN DEL VIGILANTE ---
+
+class VigilanteArchivos:
+    """
+    Arranca un único observador para todas las raíces locales (un hilo) y, si hay
+    raíces de red, un observador por sondeo para ellas. Todas comparten el mismo
+    manejador y por tanto la misma cola de eventos.
+    Pensado para incrustarse en un proceso largo: iniciar() / detener().
+    """
+    def __init__(self, raices=CARPETAS_RAIZ_A_ESCANEAR, intervalo_sondeo=INTERVALO_SONDEO_RED):
+        self.raices = [Path(raiz) for raiz in raices]
+        self.intervalo_sondeo = intervalo_sondeo
+        self.manejador = None
+        self.observadores = []
+
+    def raices_existentes(self):
+        existentes = []
+        for raiz in self.raices:
+            if raiz.is_dir():
+                existentes.append(raiz)
+            else:
+                print(f"ADVERTENCIA: La ruta raíz no existe y no se vigilará: {raiz}")
+        return existentes
+
+    def iniciar(self):
+        """Programa las raíces y arranca los observadores. Devuelve cuántas raíces se vigilan."""
+        if self.observadores:
+            return sum(len(obs.emitters) for obs in self.observadores)
+        raices = self.raices_existentes()
+        if not raices:
+            return 0
+        self.manejador = GestorEventosHandler(raices)
+
+        locales, de_red = Observer(), PollingObserver(timeout=self.intervalo_sondeo)
+        for raiz in raices:
+            observador = de_red if es_raiz_de_red(raiz) else locales
+            try:
+                observador.schedule(self.manejador, str(raiz), recursive=True)
+            except OSError as e:
+                print(f"ADVERTENCIA: No se puede vigilar {raiz}: {e}")
+
+        self.observadores = [obs for obs in (locales, de_red) if obs.emitters]
+        for observador in self.observadores:
+            observador.start()
+        vigiladas = sum(len(obs.emitters) for obs in self.observadores)
+        print(f"Vigilante de archivos activo en {vigiladas} raíces.")
+        return vigiladas
+
+    def detener(self, timeout=5):
+        """Para los observadores y vacía la cola de borrados/movimientos."""
+        for observador in self.observadores:
+            observador.stop()
+        for observador in self.observadores:
+            observador.join(timeout)
+        self.observadores = []
+        if self.manejador:
+            self.manejador.detener()
+            self.manejador = None
+        gestor_db.sincronizar_escrituras()
+
+    def activo(self):
+        return any(obs.is_alive() for obs in self.observadores)
+
+    def estadisticas(self):
+        return self.manejador.cola.estadisticas() if self.manejador else {}
+
+
+def iniciar_monitor_archivos(raices=CARPETAS_RAIZ_A_ESCANEAR):
+    """
+    Bucle principal del vigilante (bloquea hasta Ctrl+C).
+    """
+    vigilante = VigilanteArchivos(raices)
+    if not vigilante.iniciar():
+        print("No hay ninguna raíz que vigilar.")
+        return
+    try:
+        while vigilante.activo():
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\nVigilante de archivos detenido por el usuario.")
+    finally:
+        vigilante.detener()
+
 
-# Añade el bloque if __name__ == "__main__" para probarlo
 if __name__ == "__main__":
-    # iniciar_monitor_archivos() # Descomentar para probar
-    pass
\ No newline at end of file
+    # python -m src.monitores.monitor_archivos (DESPUÉS del mapeo inicial)
+    iniciar_monitor_archivos()
\ No newline at end of file
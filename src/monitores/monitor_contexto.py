@@ -1,19 +1,52 @@
 # src/monitores/monitor_contexto.py
 # Este script vigila la ventana activa y registra el contexto en la DB.
+#
+# El foco se guarda como SESIONES (Sesiones_Foco: inicio, fin, duración, título y proceso),
+# no como una fila de Registros por cada cambio de ventana:
+# - Volver al mismo contexto (título + proceso) antes de GRACIA_REANUDACION reabre su sesión.
+# - Las sesiones de menos de MIN_SEGUNDOS_SESION (saltos de pestaña) no se guardan.
+# - Sin teclado ni ratón durante SEGUNDOS_INACTIVIDAD, la sesión se cierra cuando empezó
+#   la inactividad: ese rato no cuenta como foco.
+# Sondeo adaptativo: justo tras un cambio se mira cada INTERVALO_MIN (el usuario está
+# navegando); mientras nada cambia el intervalo crece hasta INTERVALO_MAX; con el usuario
+# inactivo, cada INTERVALO_INACTIVO.
+# Cada sesión nueva se enlaza con su activo al crearla (enlazador_activos: microsegundos, sin LLM).
 
+import ctypes
+import sys
 import time
+
+import psutil
 import pygetwindow as gw # Librería para obtener la ventana activa
 
 # Importamos las herramientas de la base de datos
 try:
+    from src import enlazador_activos
     from src import gestor_db
 except ImportError:
     # Fallback si se ejecuta de forma independiente
-    import gestor_db 
+    import enlazador_activos
+    import gestor_db
 
 # Tiempo de espera entre comprobaciones (en segundos).
-# Un valor bajo es más preciso, un valor alto consume menos CPU.
-TIEMPO_ENTRE_CHEQUEOS = 5
+# Un valor bajo es más preciso, un valor alto consume menos CPU: por eso se adapta.
+INTERVALO_MIN = 1
+INTERVALO_MAX = 15
+FACTOR_INTERVALO = 1.5          # Cada comprobación sin cambios alarga así el intervalo
+INTERVALO_INACTIVO = 30
+
+SEGUNDOS_INACTIVIDAD = 300      # Sin entrada del usuario durante esto = no está delante
+GRACIA_REANUDACION = 120        # Volver al mismo contexto antes de esto continúa la sesión
+MIN_SEGUNDOS_SESION = 10        # Sesiones más cortas no llegan a la DB
+GUARDAR_SESION_CADA = 60        # La sesión abierta se actualiza en la DB cada tanto
+MAX_HUECO = 120                 # Un hueco mayor entre comprobaciones (suspensión) corta la sesión
+
+TITULOS_IGNORADOS = {"", "Desktop", "Program Manager"}
+
+def _titulo_util(ventana):
+    # Filtramos títulos inútiles (ej. la barra de tareas o el escritorio)
+    titulo = (ventana.title or "").strip() if ventana else ""
+    return titulo if titulo not in TITULOS_IGNORADOS else None
 
 def obtener_ventana_activa():
     """
@@ -21,58 +54,216 @@ def obtener_ventana_activa():
     """
     try:
         # Intenta obtener la ventana en primer plano (funciona en la mayoría de OS)
-        ventana = gw.get_active_window()
-        
-        if ventana:
-            # Filtramos títulos inútiles (ej. la barra de tareas o el escritorio)
-            titulo = ventana.title
-            if titulo and titulo.strip() not in ["", "Desktop", "Program Manager"]:
-                return titulo.strip()
-                
+        titulo = _titulo_util(gw.get_active_window())
+        if titulo:
+            return titulo
+
     except Exception as e:
         # print(f"Error al obtener ventana activa: {e}")
         pass
-        
+
     return "DESCONOCIDO o INACTIVO"
 
+_nombres_proceso = {} # pid -> nombre del ejecutable
+
+def _proceso_de_ventana(ventana):
+    """Nombre del ejecutable dueño de la ventana (solo Windows; None si no se sabe)."""
+    hwnd = getattr(ventana, "_hWnd", None)
+    if sys.platform != "win32" or not hwnd:
+        return None
+    pid = ctypes.c_ulong()
+    ctypes.windll.user32.GetWindowThreadProcessId(hwnd, ctypes.byref(pid))
+    nombre = _nombres_proceso.get(pid.value)
+    if nombre is None:
+        try:
+            nombre = psutil.Process(pid.value).name()
+        except (psutil.Error, ValueError):
+            return None
+        if len(_nombres_proceso) > 1000:
+            _nombres_proceso.clear()
+        _nombres_proceso[pid.value] = nombre
+    return nombre
+
+def obtener_foco():
+    """(título, proceso) de la ventana activa, o (None, None) si no hay ninguna útil."""
+    try:
+        ventana = gw.get_active_window()
+        titulo = _titulo_util(ventana)
+        if titulo:
+            return titulo, _proceso_de_ventana(ventana)
+    except Exception:
+        pass
+    return None, None
+
+class _LASTINPUTINFO(ctypes.Structure):
+    _fields_ = [("cbSize", ctypes.c_uint), ("dwTime", ctypes.c_uint)]
+
+def segundos_inactivo():
+    """Segundos desde la última tecla o movimiento de ratón (solo Windows; None si no se sabe)."""
+    if sys.platform != "win32":
+        return None
+    info = _LASTINPUTINFO()
+    info.cbSize = ctypes.sizeof(info)
+    if not ctypes.windll.user32.GetLastInputInfo(ctypes.byref(info)):
+        return None
+    return ((ctypes.windll.kernel32.GetTickCount() - info.dwTime) & 0xFFFFFFFF) / 1000
+
+
+class SesionFoco:
+    """Un rato con el foco en el mismo contexto. Instantes en epoch, duración en segundos."""
+    def __init__(self, titulo, proceso, inicio):
+        self.id = None # ID_Sesion una vez guardada
+        self.titulo = titulo
+        self.proceso = proceso
+        self.inicio = inicio
+        self.fin = inicio
+        self.duracion = 0.0
+        self.reanudaciones = 0
+        self.guardada_en = None
+        self.id_activo = None
+        self.confianza = None
+
+    @property
+    def clave(self):
+        return (self.titulo, self.proceso)
+
+
+class SeguidorFoco:
+    """
+    Convierte las observaciones sueltas de la ventana activa en sesiones de foco.
+    'guardar' recibe (id, inicio, fin, duracion, titulo, proceso, reanudaciones, id_activo,
+    confianza) y devuelve el ID de la sesión; por defecto gestor_db.guardar_sesion_foco.
+    'enlazar(titulo, proceso)' devuelve un enlazador_activos.Enlace; por defecto enlazar_titulo.
+    """
+    def __init__(self, guardar=None, enlazar=None, gracia=GRACIA_REANUDACION, min_segundos=MIN_SEGUNDOS_SESION,
+                 guardar_cada=GUARDAR_SESION_CADA, max_hueco=MAX_HUECO):
+        self.guardar = guardar or gestor_db.guardar_sesion_foco
+        self.enlazar = enlazar or enlazador_activos.enlazar_titulo
+        self.gracia = gracia
+        self.min_segundos = min_segundos
+        self.guardar_cada = guardar_cada
+        self.max_hueco = max_hueco
+        self.actual = None
+        self._cerradas = {} # clave -> última SesionFoco cerrada con esa clave (para reanudarla)
+
+        # Contadores
+        self.observaciones = 0
+        self.cambios = 0
+        self.reanudadas = 0
+        self.escrituras = 0
+
+    def _persistir(self, sesion, ahora):
+        if sesion.duracion < self.min_segundos:
+            return
+        sesion.id = self.guardar(
+            sesion.id, sesion.inicio, sesion.fin, sesion.duracion, sesion.titulo, sesion.proceso,
+            sesion.reanudaciones, sesion.id_activo, sesion.confianza
+        )
+        sesion.guardada_en = ahora
+        self.escrituras += 1
+
+    def cerrar(self, instante):
+        """Cierra la sesión en curso en 'instante' (puede ser anterior a la última observación)."""
+        sesion, self.actual = self.actual, None
+        if sesion is None:
+            return
+        if instante < sesion.fin:
+            sesion.duracion = max(0.0, sesion.duracion - (sesion.fin - instante))
+            sesion.fin = max(instante, sesion.inicio)
+        self._persistir(sesion, instante)
+        self._cerradas[sesion.clave] = sesion
+
+    def observar(self, titulo, proceso, ahora):
+        """Anota que a las 'ahora' (epoch) el foco está en (titulo, proceso). True si ha cambiado."""
+        self.observaciones += 1
+        sesion = self.actual
+        if sesion is not None and ahora - sesion.fin > self.max_hueco:
+            self.cerrar(sesion.fin) # Suspensión o bloqueo: el hueco no es foco
+            sesion = None
+        if sesion is None and titulo is None:
+            return False # Sigue sin ventana útil
+        if sesion is not None and sesion.clave == (titulo, proceso):
+            sesion.duracion += ahora - sesion.fin
+            sesion.fin = ahora
+            if sesion.id is None or ahora - sesion.guardada_en >= self.guardar_cada:
+                self._persistir(sesion, ahora)
+            return False
+
+        if sesion is not None:
+            sesion.duracion += ahora - sesion.fin # Hasta ahora seguía con el foco (a lo sumo un intervalo)
+            sesion.fin = ahora
+            self.cerrar(ahora)
+        self.cambios += 1
+        # Olvida las sesiones cerradas que ya no se pueden reanudar
+        self._cerradas = {c: s for c, s in self._cerradas.items() if ahora - s.fin <= self.gracia}
+        if titulo is None:
+            return sesion is not None
+        anterior = self._cerradas.pop((titulo, proceso), None)
+        if anterior is not None:
+            anterior.reanudaciones += 1
+            anterior.fin = ahora # El hueco era otra ventana: no suma a la duración
+            self.actual = anterior
+            self.reanudadas += 1
+        else:
+            self.actual = SesionFoco(titulo, proceso, ahora)
+            try:
+                enlace = self.enlazar(titulo, proceso)
+                self.actual.id_activo, self.actual.confianza = enlace.id_activo, enlace.confianza
+            except Exception as e:
+                print(f"Error enlazando '{titulo}' con su activo: {e}") # Se queda para el enlazado histórico
+        return True
+
+    def estadisticas(self):
+        return {
+            "observaciones": self.observaciones,
+            "cambios": self.cambios,
+            "reanudadas": self.reanudadas,
+            "escrituras": self.escrituras,
+        }
+
+
 def iniciar_monitor_contexto():
     """
     Bucle principal del monitor de contexto.
     """
     print("Iniciando monitor de contexto...")
-    ultimo_titulo = ""
-    
+
     # Nos aseguramos de que la DB esté lista antes de empezar
     gestor_db.inicializar_base_de_datos()
+    seguidor = SeguidorFoco()
+    intervalo = INTERVALO_MIN
 
     try:
         while True:
-            titulo_actual = obtener_ventana_activa()
-            
-            # Solo registramos si el título ha cambiado (la acción ha cambiado)
-            if titulo_actual and titulo_actual != ultimo_titulo:
-                
-                print(f"Contexto cambiado: -> {titulo_actual}")
-                
-                # 1. Insertamos el nuevo registro en la DB
-                gestor_db.insertar_registro_accion(
-                    tipo='FOCO_VENTANA', # Acción clave para el asistente
-                    contexto=titulo_actual,
-                    id_activo=None # Lo dejamos en NULL. El LLM lo vinculará después.
-                )
-                
-                # 2. Actualizamos el último título
-                ultimo_titulo = titulo_actual
-            
+            ahora = time.time()
+            inactivo = segundos_inactivo()
+            if inactivo is not None and inactivo >= SEGUNDOS_INACTIVIDAD:
+                if seguidor.actual is not None:
+                    print(f"Usuario inactivo: se cierra '{seguidor.actual.titulo}'")
+                    seguidor.cerrar(ahora - inactivo)
+                intervalo = INTERVALO_INACTIVO
+            else:
+                titulo, proceso = obtener_foco()
+                # Solo cambia la sesión si el contexto ha cambiado (la acción ha cambiado)
+                if seguidor.observar(titulo, proceso, ahora):
+                    if titulo:
+                        print(f"Contexto cambiado: -> {titulo}")
+                    intervalo = INTERVALO_MIN
+                else:
+                    intervalo = min(intervalo * FACTOR_INTERVALO, INTERVALO_MAX)
+
             # Esperamos para reducir el consumo de CPU
-            time.sleep(TIEMPO_ENTRE_CHEQUEOS)
+            time.sleep(intervalo)
 
     except KeyboardInterrupt:
         print("\nMonitor de Contexto detenido por el usuario.")
     except Exception as e:
         print(f"Error crítico en monitor_contexto: {e}")
+    finally:
+        seguidor.cerrar(time.time())
+        print(f"Foco: {seguidor.estadisticas()}")
 
 
 if __name__ == "__main__":
     # Si ejecutamos este archivo directamente para probarlo:
-    iniciar_monitor_contexto()
\ No newline at end of file
+    iniciar_monitor_contexto()
@@ -1,62 +1,328 @@
 # src/monitores/monitor_recursos.py
+import heapq
 import psutil
+import threading
 import time
+from collections import namedtuple
+from operator import itemgetter
 from src import gestor_db
+from src.monitores.metricas_recursos import INTERVALO_METRICAS, SERIE_METRICAS, MedidorCPU
 
 # Umbrales para generar una alerta (ajustables)
 UMBRAL_CPU = 85.0
 UMBRAL_RAM = 90.0
 INTERVALO_CHEQUEO = 10 # Segundos
 
+# Programas de primer plano que no deben notar el trabajo en segundo plano (indexado, LLM pesado).
+# Nombre del ejecutable en minúsculas y sin ".exe".
+PROCESOS_PRIMER_PLANO = {
+    "acad", "revit", "3dsmax", "blender", "sketchup", "rhino", "archicad", "lumion", "twinmotion",
+}
+UMBRAL_CPU_PRIMER_PLANO = 20.0 # % de CPU a partir del cual uno de ellos está "trabajando"
+MIN_SEGUNDOS_ENTRE_MUESTRAS = 1.0 # Muestras más seguidas reutilizan la última (sistema y procesos)
+MUESTRAS_ENTRE_LECTURAS_COMPLETAS = 6 # Cada cuántas muestras se relee RSS y E/S de los procesos dormidos
+
+# Una fila de la muestra de procesos. 'cpu' en % de un núcleo (como psutil: puede pasar de 100)
+# desde la muestra anterior; 'bytes_leidos'/'bytes_escritos', E/S de disco en ese intervalo
+# ('segundos'). En un proceso recién visto 'cpu' y los deltas son None: aún no hay con qué comparar.
+MuestraProceso = namedtuple("MuestraProceso", "pid nombre cpu rss bytes_leidos bytes_escritos segundos")
+
+class _ProcesoSeguido:
+    __slots__ = ("proceso", "nombre", "cpu_total", "rss", "io", "instante")
+
+    def __init__(self, proceso, nombre):
+        self.proceso = proceso
+        self.nombre = nombre
+        self.cpu_total = None
+        self.rss = None
+        self.io = None
+        self.instante = None
+
+class MuestreadorProcesos:
+    """
+    Muestra periódica de los procesos del sistema, pensada para llamarse cada pocos segundos
+    con cientos de procesos vivos:
+    - Conserva los psutil.Process entre muestras (el nombre se lee una vez) y calcula la CPU
+      con la diferencia de cpu_times: desde la segunda muestra de cada proceso, el % es real
+      (un Process nuevo en cada vuelta siempre da 0.0 en su primer cpu_percent).
+    - Un proceso que no ha gastado CPU desde la muestra anterior no ha podido crecer ni hacer
+      E/S: su RSS y sus contadores de E/S solo se releen cada MUESTRAS_ENTRE_LECTURAS_COMPLETAS.
+    - Los procesos sin permiso (servicios del sistema en Windows) se recuerdan y no se reintentan.
+    - Los más activos salen con heapq.nlargest, sin ordenar la lista entera.
+    Seguro entre hilos: lo comparten el bucle de alertas y 'sistema_ocupado'.
+    """
+    def __init__(self, con_io=True, min_segundos=MIN_SEGUNDOS_ENTRE_MUESTRAS):
+        self.con_io = con_io
+        self.min_segundos = min_segundos
+        self._lock = threading.Lock()
+        self._seguidos = {}    # pid -> _ProcesoSeguido
+        self._denegados = set() # pids sin permiso para leer su CPU
+        self._sin_io = set()    # pids sin permiso para leer su E/S
+        self._ultima = {}       # pid -> MuestraProceso
+        self._instante = None
+
+        # Coste propio
+        self.muestras = 0
+        self.segundos_cpu = 0.0
+
+    def _leer(self, seguido, completa):
+        """(cpu_total, rss, io) del proceso; rss/io se reutilizan si no hace falta releerlos."""
+        proceso = seguido.proceso
+        tiempos = proceso.cpu_times()
+        cpu_total = tiempos.user + tiempos.system
+        if not completa and cpu_total == seguido.cpu_total:
+            return cpu_total, seguido.rss, seguido.io # Dormido: sin oneshot (cuesta más que la lectura)
+        with proceso.oneshot():
+            rss = proceso.memory_info().rss
+            io = None
+            if self.con_io and proceso.pid not in self._sin_io:
+                try:
+                    io = proceso.io_counters()
+                except (psutil.AccessDenied, AttributeError, NotImplementedError):
+                    self._sin_io.add(proceso.pid) # Sin permiso o sin soporte (macOS)
+        return cpu_total, rss, io
+
+    def _muestra(self, pid, seguido, cpu_total, rss, io, ahora):
+        if seguido.cpu_total is None:
+            return MuestraProceso(pid, seguido.nombre, None, rss, None, None, None)
+        segundos = ahora - seguido.instante
+        cpu = (cpu_total - seguido.cpu_total) / segundos * 100 if segundos > 0 else 0.0
+        leidos = escritos = None
+        if io is not None and seguido.io is not None:
+            leidos = io.read_bytes - seguido.io.read_bytes
+            escritos = io.write_bytes - seguido.io.write_bytes
+        return MuestraProceso(pid, seguido.nombre, cpu, rss, leidos, escritos, segundos)
+
+    def muestrear(self):
+        """
+        Toma una muestra y devuelve {pid: MuestraProceso}. Si la anterior tiene menos de
+        'min_segundos', devuelve esa (los deltas necesitan un intervalo con sentido).
+        """
+        with self._lock:
+            ahora = time.monotonic()
+            if self._instante is not None and ahora - self._instante < self.min_segundos:
+                return self._ultima
+            inicio_cpu = time.thread_time()
+            completa = self.muestras % MUESTRAS_ENTRE_LECTURAS_COMPLETAS == 0
+            vivos = set(psutil.pids())
+            for pid in self._seguidos.keys() - vivos:
+                del self._seguidos[pid]
+            self._denegados &= vivos
+            self._sin_io &= vivos
+
+            muestras = {}
+            for pid in vivos:
+                if pid in self._denegados:
+                    continue
+                seguido = self._seguidos.get(pid)
+                try:
+                    if seguido is None:
+                        proceso = psutil.Process(pid)
+                        seguido = self._seguidos[pid] = _ProcesoSeguido(proceso, proceso.name())
+                    cpu_total, rss, io = self._leer(seguido, completa)
+                    if seguido.cpu_total is not None and cpu_total < seguido.cpu_total:
+                        # El PID se ha reutilizado: otro proceso, se empieza de cero
+                        proceso = psutil.Process(pid)
+                        seguido = self._seguidos[pid] = _ProcesoSeguido(proceso, proceso.name())
+                        cpu_total, rss, io = self._leer(seguido, True)
+                except psutil.NoSuchProcess:
+                    self._seguidos.pop(pid, None)
+                    continue
+                except psutil.AccessDenied:
+                    self._seguidos.pop(pid, None)
+                    self._denegados.add(pid)
+                    continue
+                muestras[pid] = self._muestra(pid, seguido, cpu_total, rss, io, ahora)
+                seguido.cpu_total, seguido.rss, seguido.io, seguido.instante = cpu_total, rss, io, ahora
+
+            self._ultima = muestras
+            self._instante = ahora
+            self.muestras += 1
+            self.segundos_cpu += time.thread_time() - inicio_cpu
+            return muestras
+
+    def top(self, k=5, clave="cpu"):
+        """Los 'k' procesos con más 'clave' (cpu, rss, bytes_leidos, bytes_escritos) en la última muestra."""
+        indice = MuestraProceso._fields.index(clave)
+        with self._lock:
+            candidatos = [m for m in self._ultima.values() if m[indice] is not None]
+        return heapq.nlargest(k, candidatos, key=itemgetter(indice))
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "procesos": len(self._seguidos),
+                "sin_permiso": len(self._denegados),
+                "muestras": self.muestras,
+                "ms_cpu_por_muestra": 1000 * self.segundos_cpu / max(self.muestras, 1),
+            }
+
+MUESTREADOR_PROCESOS = MuestreadorProcesos()
+
 def obtener_proceso_principal():
-    """Identifica el proceso con mayor consumo de CPU."""
+    """Identifica el proceso con mayor consumo de CPU (desde la muestra anterior)."""
     try:
-        # psutil.process_iter es portable en Linux y Windows
-        # Atributos: CPU, Memoria, Nombre
-        procs = sorted(
-            (p for p in psutil.process_iter(['name', 'cpu_percent', 'memory_percent'])),
-            key=lambda p: p.info['cpu_percent'],
-            reverse=True
-        )
+        MUESTREADOR_PROCESOS.muestrear()
+        top = MUESTREADOR_PROCESOS.top(1)
         # Devolvemos el nombre del proceso y su % de CPU
-        if procs and procs[0].info['cpu_percent'] > 5.0:
-            return procs[0].info['name'], procs[0].info['cpu_percent']
+        if top and top[0].cpu > 5.0:
+            return top[0].nombre, top[0].cpu
         return "N/A", 0
     except Exception as e:
         print(f"Error al obtener procesos: {e}")
         return "N/A", 0
 
+def _nombre_proceso(nombre):
+    nombre = (nombre or "").lower()
+    return nombre[:-4] if nombre.endswith(".exe") else nombre
+
+def procesos_primer_plano_activos():
+    """[(nombre, % CPU)] de los programas de PROCESOS_PRIMER_PLANO que están consumiendo CPU."""
+    activos = []
+    try:
+        for muestra in MUESTREADOR_PROCESOS.muestrear().values():
+            if _nombre_proceso(muestra.nombre) not in PROCESOS_PRIMER_PLANO:
+                continue
+            if (muestra.cpu or 0) >= UMBRAL_CPU_PRIMER_PLANO:
+                activos.append((muestra.nombre, muestra.cpu))
+    except Exception as e:
+        print(f"Error al obtener procesos: {e}")
+    return activos
+
+_lock_muestra = threading.Lock()
+_ultima_muestra = (0.0, None) # (instante, motivo)
+# Un medidor por llamador: cada uno mide la CPU desde SU lectura anterior
+_cpu_ocupado = MedidorCPU()
+_cpu_alertas = MedidorCPU()
+
+def sistema_ocupado():
+    """
+    Devuelve el motivo (texto) si ahora no conviene lanzar trabajo pesado en segundo plano
+    (CPU o RAM por encima de los umbrales, o un programa de CAD/3D trabajando), o None si está libre.
+    Barata de llamar en bucle: como mucho una muestra real cada MIN_SEGUNDOS_ENTRE_MUESTRAS.
+    """
+    global _ultima_muestra
+    with _lock_muestra:
+        instante, motivo = _ultima_muestra
+        if time.monotonic() - instante < MIN_SEGUNDOS_ENTRE_MUESTRAS:
+            return motivo
+        cpu_uso = _cpu_ocupado.porcentaje() # Desde la llamada anterior
+        ram_uso = psutil.virtual_memory().percent
+        motivo = None
+        if cpu_uso > UMBRAL_CPU:
+            motivo = f"CPU={cpu_uso:.1f}%"
+        elif ram_uso > UMBRAL_RAM:
+            motivo = f"RAM={ram_uso:.1f}%"
+        else:
+            pesados = procesos_primer_plano_activos()
+            if pesados:
+                motivo = ", ".join(f"{nombre} ({cpu:.0f}% CPU)" for nombre, cpu in pesados)
+        _ultima_muestra = (time.monotonic(), motivo)
+        return motivo
+
+def esperar_sistema_libre(max_espera=None, intervalo=5, detener=None):
+    """
+    Bloquea mientras 'sistema_ocupado' (como mucho 'max_espera' segundos, None = sin límite,
+    o hasta que se active el threading.Event 'detener'). Devuelve True si el sistema quedó libre.
+    """
+    limite = None if max_espera is None else time.monotonic() + max_espera
+    while sistema_ocupado():
+        if limite is not None and time.monotonic() >= limite:
+            return False
+        espera = intervalo if limite is None else min(intervalo, max(0.0, limite - time.monotonic()))
+        if detener is not None:
+            if detener.wait(espera):
+                return False
+        else:
+            time.sleep(espera)
+    return True
+
+def _registrar_alerta():
+    cpu_uso = _cpu_alertas.porcentaje() # Desde la alerta anterior
+    ram_uso = psutil.virtual_memory().percent
+    proceso_top, cpu_proceso = obtener_proceso_principal()
+
+    if cpu_uso > UMBRAL_CPU or ram_uso > UMBRAL_RAM:
+        # Generar el mensaje detallado para la DB
+        contexto = (
+            f"ALERTA_RECURSOS: CPU={cpu_uso:.1f}%, RAM={ram_uso:.1f}%. "
+            f"Proceso principal: {proceso_top} ({cpu_proceso:.1f}%)."
+        )
+
+        # Registrar la alerta en la DB (para que el LLM la lea)
+        gestor_db.insertar_registro_accion(
+            tipo="ALERTA_RECURSOS",
+            contexto=contexto,
+            id_activo=None
+        )
+        print(f"🚨 ALERTA REGISTRADA: {contexto}")
+
+    # El trabajo en segundo plano (indexado, LLM pesado) no espera a esta alerta:
+    # consulta 'sistema_ocupado' él mismo antes de cada paso.
+
 def iniciar_monitor_recursos():
+    """
+    Cada INTERVALO_METRICAS guarda la carga en la serie temporal (metricas_recursos); cada
+    INTERVALO_CHEQUEO muestrea los procesos y registra una alerta si se pasan los umbrales.
+    """
     print("🚀 Iniciando Monitor de Recursos...")
-    while True:
-        cpu_uso = psutil.cpu_percent(interval=None)
-        ram_uso = psutil.virtual_memory().percent
-        proceso_top, cpu_proceso = obtener_proceso_principal()
-        
-        alerta = False
-        contexto = ""
-
-        if cpu_uso > UMBRAL_CPU or ram_uso > UMBRAL_RAM:
-            alerta = True
-            
-            # Generar el mensaje detallado para la DB
-            contexto = (
-                f"ALERTA_RECURSOS: CPU={cpu_uso:.1f}%, RAM={ram_uso:.1f}%. "
-                f"Proceso principal: {proceso_top} ({cpu_proceso:.1f}%)."
-            )
-            
-            # Registrar la alerta en la DB (para que el LLM la lea)
-            gestor_db.insertar_registro_accion(
-                tipo="ALERTA_RECURSOS", 
-                contexto=contexto, 
-                id_activo=None
-            )
-            print(f"🚨 ALERTA REGISTRADA: {contexto}")
-
-        # Aquí irá la lógica futura para pausar el LLM pesado si hay una alerta
-        # Por ahora, solo registra.
-
-        time.sleep(INTERVALO_CHEQUEO)
+    # Nos aseguramos de que la DB (y la tabla Metricas_Recursos) esté lista antes de empezar
+    gestor_db.inicializar_base_de_datos()
+    # Primera muestra sin alertas: sin ella la CPU de cada proceso saldría a 0
+    _cpu_alertas.porcentaje()
+    MUESTREADOR_PROCESOS.muestrear()
+    SERIE_METRICAS.muestrear()
+    siguiente = time.monotonic()
+    proximo_chequeo = siguiente + INTERVALO_CHEQUEO
+    muestras_vistas = MUESTREADOR_PROCESOS.muestras
+    try:
+        while True:
+            # Ritmo fijo sin deriva; tras una suspensión se sigue desde ahora, sin recuperar vueltas
+            siguiente = max(siguiente + INTERVALO_METRICAS, time.monotonic() - INTERVALO_METRICAS)
+            time.sleep(max(0.0, siguiente - time.monotonic()))
+            if time.monotonic() >= proximo_chequeo:
+                proximo_chequeo = time.monotonic() + INTERVALO_CHEQUEO
+                _registrar_alerta()
+            # El proceso top solo va en los segundos en que se midió (la alerta o 'sistema_ocupado'
+            # muestrearon): repetir una muestra vieja le pondría un proceso que quizá ya no está
+            top = ()
+            if MUESTREADOR_PROCESOS.muestras != muestras_vistas:
+                muestras_vistas = MUESTREADOR_PROCESOS.muestras
+                top = MUESTREADOR_PROCESOS.top(1)
+            SERIE_METRICAS.muestrear(*((top[0].nombre, top[0].cpu) if top else ()))
+    finally:
+        SERIE_METRICAS.volcar()
+
+def medir_coste_muestreador(muestras=10, intervalo=1.0):
+    """
+    CPU que gasta el propio muestreo con los procesos que haya vivos ahora, comparado con
+    recorrer psutil.process_iter y ordenarlo todo en cada vuelta (lo que se hacía antes).
+    """
+    muestreador = MuestreadorProcesos(min_segundos=0)
+    muestreador.muestrear() # Primera muestra: crea los Process y lee los nombres
+    primera_ms = 1000 * muestreador.segundos_cpu
+    muestreador.segundos_cpu, muestreador.muestras = 0.0, 0
+    referencia = 0.0
+    for _ in range(muestras):
+        time.sleep(intervalo)
+        muestreador.muestrear()
+        inicio = time.thread_time()
+        sorted(psutil.process_iter(['name', 'cpu_percent', 'memory_percent']),
+               key=lambda p: p.info['cpu_percent'] or 0, reverse=True)
+        referencia += time.thread_time() - inicio
+    ms_muestra = 1000 * muestreador.segundos_cpu / muestras
+    print(f"Procesos: {len(psutil.pids())} | primera muestra: {primera_ms:.1f} ms CPU")
+    print(f"Muestreador: {ms_muestra:.1f} ms CPU por muestra "
+          f"({ms_muestra / (10 * INTERVALO_CHEQUEO):.3f}% de un núcleo cada {INTERVALO_CHEQUEO} s)")
+    print(f"process_iter + sorted: {1000 * referencia / muestras:.1f} ms CPU por vuelta")
+    for muestra in muestreador.top(5):
+        print(f"  {muestra.nombre} (pid {muestra.pid}): {muestra.cpu:.1f}% CPU, "
+              f"{muestra.rss // 2**20} MB, E/S {muestra.bytes_leidos}/{muestra.bytes_escritos} B")
 
 if __name__ == "__main__":
-    iniciar_monitor_recursos()
\ No newline at end of file
+    # python -m src.monitores.monitor_recursos [--coste]
+    import sys
+    if "--coste" in sys.argv:
+        medir_coste_muestreador()
+    else:
+        iniciar_monitor_recursos()
\ No newline at end of file
@@ -0,0 +1,166 @@
+# src/pipeline_escaneo.py
+# Pipeline por etapas para el mapeador: recorrer, hashear y guardar EN PARALELO.
+#
+#   [Recorrido]  --cola_entrada-->  [N hilos de huella] --cola_salida-->  [Sumidero DB]
+#     1 hilo          (acotada)        hashlib suelta         (acotada)     hilo llamante
+#                                      el GIL al hashear                    insertar_activos_lote
+#
+# Así el disco no espera a la CPU ni la CPU al disco, y en SSD/NVMe el hash
+# escala con los núcleos. Las colas acotadas frenan al recorrido si el hash
+# o la DB van por detrás (no se llena la RAM con millones de rutas).
+
+import queue
+import threading
+import time
+
+try:
+    from src import gestor_db
+    from src import utils
+    from src.config_scanner import HILOS_HASH, TAM_COLA_ESCANEO, INTERVALO_PROGRESO
+except ImportError:
+    import gestor_db
+    import utils
+    from config_scanner import HILOS_HASH, TAM_COLA_ESCANEO, INTERVALO_PROGRESO
+
+_FIN = object()  # Marca de fin de cola (una por hilo de hash)
+
+
+class PipelineEscaneo:
+    """
+    Recibe una 'fuente' (iterable de registros de activo SIN huella, ver
+    gestor_db.ACTIVO_POR_DEFECTO), completa 'hash_parcial' / 'hash_val' / 'nivel_hash'
+    en un pool de hilos y vuelca los resultados por lotes en la DB desde un único sumidero.
+    """
+    def __init__(self, fuente, hilos_hash=HILOS_HASH, tam_cola=TAM_COLA_ESCANEO,
+                 intervalo_progreso=INTERVALO_PROGRESO, funcion_huella=utils.calcular_huellas):
+        self.fuente = fuente
+        self.hilos_hash = max(1, hilos_hash)
+        self.intervalo_progreso = intervalo_progreso
+        self.funcion_huella = funcion_huella
+        self.cola_entrada = queue.Queue(maxsize=tam_cola)
+        self.cola_salida = queue.Queue(maxsize=tam_cola)
+        self.detener = threading.Event()
+        self.error_recorrido = None
+        self._lock_contadores = threading.Lock()
+
+        # Contadores (solo los escribe su etapa; el sumidero los lee para el progreso)
+        self.encolados = 0
+        self.hasheados = 0
+        self.errores_hash = 0
+        self.bytes_hasheados = 0
+        self.guardados = 0
+        self.inicio = None
+
+    # --- ETAPAS ---
+
+    def _poner(self, cola, elemento):
+        """put() que no se queda colgado para siempre si se ha pedido parar."""
+        while not self.detener.is_set():
+            try:
+                cola.put(elemento, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _etapa_recorrido(self):
+        try:
+            for registro in self.fuente:
+                if not self._poner(self.cola_entrada, registro):
+                    return
+                self.encolados += 1
+        except Exception as e:
+            self.error_recorrido = e
+        finally:
+            if not self.detener.is_set():
+                for _ in range(self.hilos_hash):
+                    self.cola_entrada.put(_FIN)
+
+    def _etapa_hash(self):
+        lock = self._lock_contadores
+        while True:
+            registro = self.cola_entrada.get()
+            if self.detener.is_set():
+                return
+            if registro is _FIN:
+                self.cola_salida.put(_FIN)
+                return
+            huellas = self.funcion_huella(registro["ruta"], registro["peso"])
+            with lock:
+                if huellas is None:
+                    self.errores_hash += 1
+                    continue
+                self.hasheados += 1
+                self.bytes_hasheados += registro.get("peso") or 0
+            registro["hash_parcial"], registro["hash_val"], registro["nivel_hash"] = huellas
+            if not self._poner(self.cola_salida, registro):
+                return
+
+    def _resultados(self):
+        """Generador que consume la cola de salida hasta que terminan todos los hilos de hash."""
+        fines = 0
+        ultimo_aviso = time.monotonic()
+        while fines < self.hilos_hash:
+            try:
+                registro = self.cola_salida.get(timeout=0.5)
+            except queue.Empty:
+                registro = None
+            if registro is _FIN:
+                fines += 1
+            elif registro is not None:
+                self.guardados += 1
+                yield registro
+            if time.monotonic() - ultimo_aviso >= self.intervalo_progreso:
+                self.informar_progreso()
+                ultimo_aviso = time.monotonic()
+
+    # --- CONTROL ---
+
+    def ejecutar(self):
+        """
+        Arranca las etapas y bloquea hasta terminar. El sumidero corre en el hilo
+        llamante. Devuelve las estadísticas finales (ver 'estadisticas').
+        """
+        self.inicio = time.monotonic()
+        hilos = [threading.Thread(target=self._etapa_recorrido, name="Escaneo-Recorrido", daemon=True)]
+        hilos += [
+            threading.Thread(target=self._etapa_hash, name=f"Escaneo-Hash-{i}", daemon=True)
+            for i in range(self.hilos_hash)
+        ]
+        for hilo in hilos:
+            hilo.start()
+        try:
+            gestor_db.insertar_activos_lote(self._resultados())
+        except BaseException:
+            # Ctrl+C o error en la DB: paramos el recorrido y los hilos de hash
+            self.detener.set()
+            raise
+        for hilo in hilos:
+            hilo.join()
+        if self.error_recorrido:
+            print(f"Error en el recorrido del escaneo: {self.error_recorrido}")
+        self.informar_progreso(final=True)
+        return self.estadisticas()
+
+    def estadisticas(self):
+        segundos = max(time.monotonic() - self.inicio, 1e-9) if self.inicio else 0
+        return {
+            "encolados": self.encolados,
+            "hasheados": self.hasheados,
+            "errores_hash": self.errores_hash,
+            "guardados": self.guardados,
+            "megabytes": self.bytes_hasheados / (1024 ** 2),
+            "segundos": segundos,
+            "archivos_por_segundo": self.hasheados / segundos if segundos else 0,
+            "mb_por_segundo": self.bytes_hasheados / (1024 ** 2) / segundos if segundos else 0,
+        }
+
+    def informar_progreso(self, final=False):
+        e = self.estadisticas()
+        etiqueta = "Escaneo terminado" if final else "Escaneando"
+        print(
+            f"{etiqueta}: {e['hasheados']} hasheados / {e['encolados']} encolados, "
+            f"{e['guardados']} guardados, {e['errores_hash']} errores | "
+            f"{e['archivos_por_segundo']:.1f} arch/s, {e['mb_por_segundo']:.1f} MB/s | "
+            f"colas: entrada={self.cola_entrada.qsize()} salida={self.cola_salida.qsize()}"
+        )
@@ -0,0 +1,271 @@
+# src/resumidor.py
+# Rellena Activos.Resumen_Ejecutivo por lotes (lo lee el contexto del LLM, ver gestor_ollama.CacheContexto).
+#
+#   activos sin resumen --> texto --+-- pequeños: varios en UN prompt ("### DOC n") --+--> pool de N
+#                                   +-- grandes: uno por prompt (recortado)          --+    llamadas a Ollama
+#                                                                                          |
+#   Activos.Resumen_Ejecutivo <-- una transacción cada TAM_LOTE_ESCRITURA resúmenes <------+
+#
+# Agrupar los pequeños ahorra lo más caro de cada llamada en local: cargar el prompt de
+# instrucciones y el viaje de ida y vuelta. La concurrencia está acotada (Ollama atiende
+# OLLAMA_NUM_PARALLEL peticiones a la vez por modelo; más solo hace cola en el servidor).
+
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+try:
+    from src import estimador_tokens
+    from src import extractores
+    from src import gestor_db
+    from src import gestor_ollama
+except ImportError:
+    import estimador_tokens
+    import extractores
+    import gestor_db
+    import gestor_ollama
+
+MODELO_RESUMENES = gestor_ollama.MODELO_LIGERO
+CONCURRENCIA_RESUMENES = 2      # Llamadas simultáneas a Ollama (<= gestor_ollama.CONEXIONES_OLLAMA)
+MAX_TOKENS_DOC_PEQUENO = 1500   # Por debajo, el documento viaja agrupado con otros
+MAX_TOKENS_GRUPO = 6000         # Tokens de documentos por prompt agrupado
+MAX_DOCS_GRUPO = 8              # Documentos por prompt agrupado (más y el modelo se salta alguno)
+MAX_TOKENS_DOC_GRANDE = 6000    # Los grandes se recortan (principio + final) a este tamaño
+TAM_PAGINA_RESUMENES = 200      # Activos leídos de la DB de una vez
+TAM_LOTE_ESCRITURA = 50         # Resúmenes por transacción
+OPCIONES_RESUMEN = {"temperature": 0.2, "num_ctx": 8192}
+
+INSTRUCCIONES_RESUMEN = (
+    "Eres el archivero de un estudio de arquitectura e ingeniería. Resume el documento en "
+    "2 o 3 frases (máximo 60 palabras) en español: qué es, de qué proyecto u obra y para qué sirve. "
+    "Sin introducciones ni comentarios."
+)
+INSTRUCCIONES_GRUPO = (
+    "Eres el archivero de un estudio de arquitectura e ingeniería. Resume CADA documento en "
+    "2 o 3 frases (máximo 60 palabras) en español: qué es, de qué proyecto u obra y para qué sirve. "
+    "Responde solo con una línea '### DOC n' (el número del documento) seguida de su resumen, "
+    "para todos los documentos y en el mismo orden."
+)
+_CABECERA_DOC = re.compile(r"^[ \t]*#{1,4}[ \t]*DOC[ \t]*(\d+)[ \t]*:?[ \t]*(.*)$", re.IGNORECASE | re.MULTILINE)
+
+
+# --- PROMPTS ---
+
+def estimar_tokens_texto(texto):
+    return estimador_tokens.estimar_tokens_texto(texto, MODELO_RESUMENES)
+
+def recortar_texto(texto, max_tokens=MAX_TOKENS_DOC_GRANDE):
+    """Si no cabe, se queda con el principio (3/4) y el final (1/4): portada/índice y conclusiones."""
+    max_caracteres = max_tokens * 4 # Corte barato por caracteres (el texto entero puede ser enorme)
+    if len(texto) <= max_caracteres:
+        return texto
+    cabeza = max_caracteres * 3 // 4
+    return texto[:cabeza] + "\n[...]\n" + texto[-(max_caracteres - cabeza):]
+
+def prompt_individual(activo, texto):
+    return (
+        f"{INSTRUCCIONES_RESUMEN}\n\nArchivo: {activo['Ruta_Absoluta']}\n"
+        f"--- CONTENIDO ---\n{recortar_texto(texto)}\n--- FIN ---\n\nResumen:"
+    )
+
+def prompt_grupo(documentos):
+    partes = [INSTRUCCIONES_GRUPO]
+    for n, (activo, texto) in enumerate(documentos, 1):
+        partes.append(f"\n### DOC {n}\nArchivo: {activo['Ruta_Absoluta']}\n{texto}")
+    return "\n".join(partes) + "\n\nResúmenes:"
+
+def separar_resumenes(respuesta, num_documentos):
+    """Respuesta agrupada -> {n: resumen} (n desde 1). Los documentos que falten no aparecen."""
+    cabeceras = list(_CABECERA_DOC.finditer(respuesta))
+    resumenes = {}
+    for i, cabecera in enumerate(cabeceras):
+        n = int(cabecera.group(1))
+        fin = cabeceras[i + 1].start() if i + 1 < len(cabeceras) else len(respuesta)
+        texto = (cabecera.group(2) + "\n" + respuesta[cabecera.end():fin]).strip()
+        if 1 <= n <= num_documentos and texto and n not in resumenes:
+            resumenes[n] = texto
+    return resumenes
+
+def agrupar_documentos(documentos, max_tokens=MAX_TOKENS_GRUPO, max_docs=MAX_DOCS_GRUPO,
+                       max_tokens_pequeno=MAX_TOKENS_DOC_PEQUENO):
+    """
+    [(activo, texto)] -> lista de tareas: cada tarea es una lista de documentos.
+    Los grandes van solos; los pequeños se juntan hasta 'max_tokens' o 'max_docs'.
+    """
+    tareas, grupo, tokens_grupo = [], [], 0
+    for activo, texto in documentos:
+        tokens = estimar_tokens_texto(texto)
+        if tokens > max_tokens_pequeno:
+            tareas.append([(activo, texto)])
+            continue
+        if grupo and (tokens_grupo + tokens > max_tokens or len(grupo) >= max_docs):
+            tareas.append(grupo)
+            grupo, tokens_grupo = [], 0
+        grupo.append((activo, texto))
+        tokens_grupo += tokens
+    if grupo:
+        tareas.append(grupo)
+    return tareas
+
+
+# --- RESUMIDOR ---
+
+class ResumidorLotes:
+    """
+    Resume los activos sin Resumen_Ejecutivo con 'concurrencia' llamadas simultáneas.
+    'ejecutar' devuelve las estadísticas (ver 'estadisticas'): documentos/min y tokens/s
+    para dimensionar una pasada nocturna.
+    """
+    def __init__(self, modelo=MODELO_RESUMENES, concurrencia=CONCURRENCIA_RESUMENES, cliente=None,
+                 opciones=OPCIONES_RESUMEN):
+        self.modelo = modelo
+        self.concurrencia = max(1, concurrencia)
+        self.cliente = cliente or gestor_ollama.obtener_cliente()
+        self.opciones = opciones
+        self._por_guardar = []
+        self.inicio = None
+
+        # Contadores (solo los toca el hilo que llama a 'ejecutar')
+        self.documentos = 0
+        self.sin_texto = 0
+        self.resumidos = 0
+        self.guardados = 0
+        self.fallidos = 0
+        self.llamadas = 0
+        self.llamadas_agrupadas = 0
+        self.tokens_prompt = 0
+        self.tokens_generados = 0
+        self.segundos_generando = 0.0  # Suma de eval_duration (tiempo de GPU/CPU generando)
+
+    # --- LLAMADAS (hilos del pool) ---
+
+    def _llamar(self, prompt):
+        metricas = {}
+        respuesta = self.cliente.generar(prompt, self.modelo, self.opciones, metricas=metricas)
+        return respuesta, metricas
+
+    def _resumir(self, documentos):
+        """Una tarea: devuelve ({índice en 'documentos': resumen}, métricas)."""
+        if len(documentos) == 1:
+            respuesta, metricas = self._llamar(prompt_individual(*documentos[0]))
+            respuesta = respuesta.strip()
+            return ({0: respuesta} if respuesta else {}), metricas
+        respuesta, metricas = self._llamar(prompt_grupo(documentos))
+        return {n - 1: r for n, r in separar_resumenes(respuesta, len(documentos)).items()}, metricas
+
+    # --- RESULTADOS (hilo llamante) ---
+
+    def _anotar_metricas(self, metricas, agrupada):
+        self.llamadas += 1
+        self.llamadas_agrupadas += agrupada
+        self.tokens_prompt += metricas.get("prompt_eval_count") or 0
+        self.tokens_generados += metricas.get("eval_count") or 0
+        self.segundos_generando += (metricas.get("eval_duration") or 0) / 1e9
+
+    def _anotar_resumen(self, activo, resumen):
+        self.resumidos += 1
+        self._por_guardar.append((resumen, activo["ID_Activo"], activo["Mtime_ns"]))
+        if len(self._por_guardar) >= TAM_LOTE_ESCRITURA:
+            self._volcar()
+
+    def _volcar(self):
+        filas, self._por_guardar = self._por_guardar, []
+        try:
+            self.guardados += gestor_db.guardar_resumenes(filas)
+        except Exception as e:
+            print(f"Error guardando {len(filas)} resúmenes: {e}")
+
+    def _leer_documentos(self, activos):
+        textos = extractores.extraer_lote(activos) # En paralelo y con caché por contenido
+        documentos = []
+        for activo in activos:
+            texto, _ = textos.get(activo["ID_Activo"], (None, None))
+            if texto and texto.strip():
+                documentos.append((activo, recortar_texto(texto.strip()))) # No guardar en RAM más de lo que viaja
+            else:
+                self.sin_texto += 1
+        return documentos
+
+    def _procesar_pagina(self, pool, documentos):
+        futuros = {pool.submit(self._resumir, tarea): tarea for tarea in agrupar_documentos(documentos)}
+        while futuros:
+            futuro = next(as_completed(futuros))
+            tarea = futuros.pop(futuro)
+            try:
+                resumenes, metricas = futuro.result()
+            except Exception as e:
+                print(f"Error resumiendo {len(tarea)} documento(s) ({tarea[0][0]['Ruta_Absoluta']}...): {e}")
+                self.fallidos += len(tarea)
+                continue
+            self._anotar_metricas(metricas, len(tarea) > 1)
+            for i, (activo, texto) in enumerate(tarea):
+                if i in resumenes:
+                    self._anotar_resumen(activo, resumenes[i])
+                elif len(tarea) > 1:
+                    # El modelo se saltó este documento del grupo: va solo
+                    futuros[pool.submit(self._resumir, [(activo, texto)])] = [(activo, texto)]
+                else:
+                    self.fallidos += 1
+
+    def ejecutar(self, limite=None):
+        """Resume hasta 'limite' activos (None = todos los que falten). Devuelve las estadísticas."""
+        self.inicio = time.monotonic()
+        ultimo_id = 0
+        with ThreadPoolExecutor(max_workers=self.concurrencia, thread_name_prefix="Resumidor") as pool:
+            while limite is None or self.documentos < limite:
+                tam = TAM_PAGINA_RESUMENES if limite is None else min(TAM_PAGINA_RESUMENES, limite - self.documentos)
+                activos = gestor_db.obtener_activos_sin_resumen(tam, desde_id=ultimo_id)
+                if not activos:
+                    break
+                ultimo_id = activos[-1]["ID_Activo"]
+                self.documentos += len(activos)
+                self._procesar_pagina(pool, self._leer_documentos(activos))
+                self.informar_progreso()
+        self._volcar()
+        self.informar_progreso(final=True)
+        return self.estadisticas()
+
+    def estadisticas(self):
+        segundos = max(time.monotonic() - self.inicio, 1e-9) if self.inicio else 0
+        return {
+            "documentos": self.documentos,
+            "sin_texto": self.sin_texto,
+            "resumidos": self.resumidos,
+            "guardados": self.guardados,
+            "fallidos": self.fallidos,
+            "llamadas": self.llamadas,
+            "llamadas_agrupadas": self.llamadas_agrupadas,
+            "tokens_prompt": self.tokens_prompt,
+            "tokens_generados": self.tokens_generados,
+            "segundos": segundos,
+            "documentos_por_minuto": self.resumidos / segundos * 60 if segundos else 0,
+            # Rendimiento total de la pasada (con la concurrencia) y velocidad del modelo por llamada
+            "tokens_por_segundo": (self.tokens_prompt + self.tokens_generados) / segundos if segundos else 0,
+            "tokens_generados_por_segundo": self.tokens_generados / segundos if segundos else 0,
+            "tokens_por_segundo_modelo": (
+                self.tokens_generados / self.segundos_generando if self.segundos_generando else 0
+            ),
+        }
+
+    def informar_progreso(self, final=False):
+        e = self.estadisticas()
+        etiqueta = "Resúmenes terminados" if final else "Resumiendo"
+        print(
+            f"{etiqueta}: {e['resumidos']}/{e['documentos']} resumidos, {e['guardados']} guardados, "
+            f"{e['fallidos']} fallidos, {e['sin_texto']} sin texto | {e['llamadas']} llamadas "
+            f"({e['llamadas_agrupadas']} agrupadas) | {e['documentos_por_minuto']:.1f} docs/min, "
+            f"{e['tokens_por_segundo']:.0f} tokens/s ({e['tokens_generados_por_segundo']:.1f} generados/s, "
+            f"modelo {e['tokens_por_segundo_modelo']:.1f} tokens/s)"
+        )
+
+
+def resumir_pendientes(limite=None, modelo=MODELO_RESUMENES, concurrencia=CONCURRENCIA_RESUMENES):
+    return ResumidorLotes(modelo, concurrencia).ejecutar(limite)
+
+
+if __name__ == "__main__":
+    # python -m src.resumidor [límite]
+    import sys
+    gestor_db.inicializar_base_de_datos()
+    resumir_pendientes(int(sys.argv[1]) if len(sys.argv) > 1 else None)
+    gestor_db.cerrar_conexiones()
@@ -0,0 +1,187 @@
+# src/trabajador_indexado.py
+# Trabajador en segundo plano que consume la cola de activos 'Pendiente' (ver indice_vectorial.py).
+#
+#   Pendiente --reclamar (lote)--> Procesando --indexar--> Indexado / Sin_Texto / Error
+#
+# - Reclama por lotes con un UPDATE ... RETURNING atómico (gestor_db.reclamar_activos_pendientes)
+#   y extrae el texto del lote en paralelo (extractores.extraer_lote).
+# - Antes de cada activo pregunta a monitor_recursos.sistema_ocupado(): con la CPU o la RAM por
+#   encima de los umbrales, o con AutoCAD/Revit/... trabajando, devuelve el resto del lote a
+#   'Pendiente' y se pausa hasta que el PC quede libre.
+# - Aun con el PC libre va "a medio gas": tras cada activo descansa una fracción de lo que tardó.
+# - Si el proceso muere a medias, al arrancar de nuevo lo que quedó en 'Procesando' vuelve a
+#   'Pendiente'. Lo terminado (Indexado, Sin_Texto, Error) no se repite.
+# - Sin nada pendiente, purga del índice y de Fragmentos los activos borrados
+#   (indice_vectorial.purgar_eliminados): su texto no debe volver a llegar al LLM.
+
+import threading
+import time
+
+try:
+    from src import extractores
+    from src import gestor_db
+    from src import indice_vectorial
+    from src.monitores import monitor_recursos
+except ImportError:
+    import extractores
+    import gestor_db
+    import indice_vectorial
+    from monitores import monitor_recursos
+
+TAM_LOTE_INDEXADO = 20          # Activos reclamados de una vez
+SEGUNDOS_SIN_TRABAJO = 30       # Espera cuando no queda nada 'Pendiente'
+SEGUNDOS_PAUSA_OCUPADO = 15     # Cada cuánto se vuelve a mirar si el PC sigue ocupado
+FACTOR_DESCANSO = 0.5           # Tras un activo que tardó T segundos, descansa T * FACTOR_DESCANSO
+
+
+class TrabajadorIndexado:
+    """
+    Hilo que indexa los activos pendientes sin molestar al usuario.
+    'ocupado()' devuelve un motivo (texto) o None; por defecto monitor_recursos.sistema_ocupado.
+    """
+    def __init__(self, tam_lote=TAM_LOTE_INDEXADO, ocupado=None, indice=None, embedder=None,
+                 factor_descanso=FACTOR_DESCANSO, segundos_sin_trabajo=SEGUNDOS_SIN_TRABAJO,
+                 segundos_pausa=SEGUNDOS_PAUSA_OCUPADO):
+        self.tam_lote = max(1, tam_lote)
+        self.ocupado = ocupado or monitor_recursos.sistema_ocupado
+        self.indice = indice
+        self.embedder = embedder
+        self.factor_descanso = factor_descanso
+        self.segundos_sin_trabajo = segundos_sin_trabajo
+        self.segundos_pausa = segundos_pausa
+        self._detener = threading.Event()
+        self._hilo = None
+
+        # Contadores
+        self.por_estado = {}
+        self.recuperados = 0
+        self.devueltos = 0
+        self.purgados = 0
+        self.pausas = 0
+        self.motivo_pausa = None
+        self.error = None
+
+    # --- BUCLE ---
+
+    def _pausar(self, motivo):
+        if motivo != self.motivo_pausa:
+            print(f"Indexado en pausa: sistema ocupado ({motivo})")
+            self.pausas += 1
+        self.motivo_pausa = motivo
+        self._detener.wait(self.segundos_pausa)
+
+    def _devolver(self, activos):
+        """Lo reclamado y no empezado vuelve a 'Pendiente' (otro lote lo cogerá)."""
+        for activo in activos:
+            if gestor_db.terminar_activo(activo["ID_Activo"], indice_vectorial.ESTADO_PENDIENTE):
+                self.devueltos += 1
+
+    def _purgar(self):
+        try:
+            purgados = indice_vectorial.purgar_eliminados(self.indice)
+        except Exception as e:
+            print(f"Error purgando activos eliminados del índice: {e}")
+            return
+        if purgados:
+            print(f"Indexado: {purgados} activos eliminados salen del índice.")
+            self.purgados += purgados
+
+    def _extraer_lote(self, lote):
+        """Extrae el texto de todo el lote en paralelo: luego cada activo lo encuentra en la caché."""
+        try:
+            extractores.extraer_lote(lote)
+        except Exception as e:
+            print(f"Error extrayendo el lote (se reintentará activo a activo): {e}")
+
+    def _procesar_lote(self, lote):
+        self._extraer_lote(lote)
+        for i, activo in enumerate(lote):
+            motivo = None if self._detener.is_set() else self.ocupado()
+            if self._detener.is_set() or motivo:
+                self._devolver(lote[i:])
+                if motivo:
+                    self._pausar(motivo)
+                return
+            inicio = time.monotonic()
+            try:
+                estado = indice_vectorial.indexar_y_clasificar(activo, self.indice, self.embedder)
+            except BaseException:
+                self._devolver(lote[i:])
+                raise
+            gestor_db.terminar_activo(activo["ID_Activo"], estado)
+            self.por_estado[estado] = self.por_estado.get(estado, 0) + 1
+            if self.factor_descanso:
+                self._detener.wait((time.monotonic() - inicio) * self.factor_descanso)
+
+    def _bucle(self):
+        self.recuperados = gestor_db.recuperar_activos_procesando()
+        if self.recuperados:
+            print(f"Indexado: {self.recuperados} activos a medias de la sesión anterior vuelven a 'Pendiente'.")
+        while not self._detener.is_set():
+            motivo = self.ocupado()
+            if motivo:
+                self._pausar(motivo)
+                continue
+            if self.motivo_pausa:
+                print("Indexado reanudado: sistema libre.")
+                self.motivo_pausa = None
+            lote = gestor_db.reclamar_activos_pendientes(self.tam_lote)
+            if not lote:
+                self._purgar()
+                self._detener.wait(self.segundos_sin_trabajo)
+                continue
+            try:
+                self._procesar_lote(lote)
+            except ValueError as e:
+                # Índice vectorial de otro modelo de embeddings: hace falta intervención manual
+                print(f"Indexado detenido: {e}")
+                self.error = e
+                return
+
+    # --- CONTROL ---
+
+    def iniciar(self):
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="TrabajadorIndexado", daemon=True)
+        self._hilo.start()
+
+    def detener(self, timeout=None):
+        """Termina el activo en curso, devuelve el resto del lote a 'Pendiente' y para."""
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout)
+
+    def activo(self):
+        return self._hilo is not None and self._hilo.is_alive()
+
+    def estadisticas(self):
+        return {
+            "por_estado": dict(self.por_estado),
+            "recuperados": self.recuperados,
+            "devueltos": self.devueltos,
+            "purgados": self.purgados,
+            "pausas": self.pausas,
+            "en_pausa": self.motivo_pausa,
+            "cola": gestor_db.contar_activos_por_estado(),
+        }
+
+
+def iniciar_trabajador_indexado():
+    print("Iniciando trabajador de indexado...")
+    gestor_db.inicializar_base_de_datos()
+    trabajador = TrabajadorIndexado()
+    trabajador.iniciar()
+    try:
+        while trabajador.activo():
+            time.sleep(60)
+            print(f"Indexado: {trabajador.estadisticas()}")
+    except KeyboardInterrupt:
+        print("\nDeteniendo trabajador de indexado...")
+    finally:
+        trabajador.detener()
+        gestor_db.cerrar_conexiones()
+
+
+if __name__ == "__main__":
+    # python -m src.trabajador_indexado
+    iniciar_trabajador_indexado()
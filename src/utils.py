@@ -2,6 +2,22 @@
 # Herramientas genéricas que usarán varios scripts.
 
 import hashlib
+import os
+from collections import deque, namedtuple
+
+try:
+    from src.config_scanner import (
+        EXTENSIONES_PERMITIDAS, MODO_HUELLA,
+        BYTES_POR_TOKEN_TEXTO, BYTES_POR_TOKEN_EXTENSION, EXTENSIONES_SIN_TEXTO,
+    )
+except ImportError:
+    from config_scanner import (
+        EXTENSIONES_PERMITIDAS, MODO_HUELLA,
+        BYTES_POR_TOKEN_TEXTO, BYTES_POR_TOKEN_EXTENSION, EXTENSIONES_SIN_TEXTO,
+    )
+
+# Huella parcial: se leen 3 muestras de este tamaño (principio, medio y final)
+TAM_MUESTRA_HUELLA = 65536
 
 def calcular_hash_archivo(ruta_archivo):
     """
@@ -29,4 +45,157 @@ def calcular_hash_archivo(ruta_archivo):
         return None
     except Exception as e:
         print(f"Error (hash) desconocido en {ruta_archivo}: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def calcular_huella_parcial(ruta_archivo, tamano):
+    """
+    Huella BARATA de un archivo: SHA-256 del tamaño + 64kb del principio,
+    64kb del medio y 64kb del final. Lee como mucho 192kb aunque el archivo
+    pese varios GB (.dwg, .blend, .rvt...).
+    Si dos archivos tienen distinta huella parcial, seguro que son distintos;
+    si coinciden, hay que confirmarlo con el hash completo.
+    """
+    h = hashlib.sha256(str(tamano).encode())
+    try:
+        with open(ruta_archivo, 'rb') as file:
+            for posicion in (0, max(0, tamano // 2 - TAM_MUESTRA_HUELLA // 2), max(0, tamano - TAM_MUESTRA_HUELLA)):
+                file.seek(posicion)
+                h.update(file.read(TAM_MUESTRA_HUELLA))
+        return h.hexdigest()
+    except FileNotFoundError:
+        print(f"Error (huella): Archivo no encontrado en {ruta_archivo}")
+        return None
+    except PermissionError:
+        print(f"Error (huella): No hay permisos para leer {ruta_archivo}")
+        return None
+    except Exception as e:
+        print(f"Error (huella) desconocido en {ruta_archivo}: {e}")
+        return None
+
+def calcular_huellas(ruta_archivo, tamano, modo=MODO_HUELLA):
+    """
+    Huella por niveles para el inventario. Devuelve (hash_parcial, hash_completo, nivel)
+    o None si no se pudo leer el archivo.
+    - Archivos pequeños (<= 3 muestras) o modo 'completo': se lee todo y el nivel es 'Completo'
+      (la huella parcial es el propio hash completo).
+    - Resto en modo 'escalonado': solo huella parcial, nivel 'Parcial'. El hash completo
+      se calcula después, solo si hace falta (ver huellas.py).
+    """
+    if modo == "completo" or tamano <= 3 * TAM_MUESTRA_HUELLA:
+        hash_completo = calcular_hash_archivo(ruta_archivo)
+        if hash_completo is None:
+            return None
+        return hash_completo, hash_completo, "Completo"
+    hash_parcial = calcular_huella_parcial(ruta_archivo, tamano)
+    if hash_parcial is None:
+        return None
+    return hash_parcial, None, "Parcial"
+
+def estimar_tokens(ruta_archivo, peso=None):
+    """
+    Calcula el peso en tokens solo para archivos permitidos.
+    Si ya conocemos el tamaño (p. ej. del stat del mapeador) se pasa en 'peso'
+    para no volver a preguntar al disco.
+    Es una estimación previa por formato (ver config_scanner, sección 7); cuando se
+    extrae el texto, el conteo real (estimador_tokens) la sustituye.
+    """
+    try:
+        ext = os.path.splitext(str(ruta_archivo))[1].lower()
+        
+        # 1. Solo calcular si la extensión está en la lista de PERMITIDAS y tiene texto
+        if ext not in EXTENSIONES_PERMITIDAS or ext in EXTENSIONES_SIN_TEXTO:
+            return 0 
+        
+        # 2. Si es una extensión permitida, estimar el peso según su formato
+        tamano = peso if peso is not None else os.path.getsize(ruta_archivo)
+        return int(tamano / BYTES_POR_TOKEN_EXTENSION.get(ext, BYTES_POR_TOKEN_TEXTO))
+    except:
+        return 0
+
+
+# --- RECORRIDO DE CARPETAS (os.scandir) ---
+# Registro ligero de cada entrada. Los datos salen del DirEntry: en Windows el listado
+# de la carpeta ya trae tamaño y fechas, así que no hay una ida y vuelta extra al disco
+# (o a la unidad de red) por archivo como con Path(...) + getsize/exists.
+EntradaArchivo = namedtuple("EntradaArchivo", "ruta nombre tamano mtime_ns inodo es_dir")
+
+def inodo_de(st):
+    """st_ino de un stat, recortado a 63 bits (cabe en un INTEGER de SQLite). None si el SO no lo da."""
+    return (st.st_ino & ((1 << 63) - 1)) or None
+
+def inodo_archivo(ruta):
+    """Inodo (file-id en Windows) de una ruta con un stat propio. None si no existe o no se sabe."""
+    try:
+        return inodo_de(os.stat(ruta))
+    except OSError:
+        return None
+
+def entrada_archivo(ruta):
+    """EntradaArchivo de una ruta suelta (hace un stat). None si ya no existe."""
+    try:
+        st = os.stat(ruta)
+    except OSError:
+        return None
+    ruta = str(ruta)
+    return EntradaArchivo(ruta, os.path.basename(ruta), st.st_size, st.st_mtime_ns, inodo_de(st), False)
+
+def recorrer_directorio(raiz, modo="profundidad", seguir_enlaces=False, carpeta_ignorada=None,
+                        incluir_carpetas=False, errores=None):
+    """
+    Recorre 'raiz' de forma iterativa (sin recursión) y devuelve EntradaArchivo.
+    - modo: "profundidad" (pila, DFS) o "anchura" (cola, BFS).
+    - seguir_enlaces: si es False los enlaces simbólicos se saltan; si es True se siguen,
+      sin entrar dos veces en la misma carpeta (evita bucles).
+    - carpeta_ignorada(nombre) -> bool: poda las carpetas antes de entrar en ellas.
+    - incluir_carpetas: devolver también las carpetas (es_dir=True).
+    - errores: lista donde se apuntan los OSError (carpetas ilegibles), como onerror de os.walk.
+    """
+    pendientes = deque([str(raiz)])
+    siguiente = pendientes.pop if modo == "profundidad" else pendientes.popleft
+    visitadas = set()
+    if seguir_enlaces:
+        try:
+            st = os.stat(raiz)
+            visitadas.add((st.st_dev, st.st_ino))
+        except OSError:
+            pass
+
+    while pendientes:
+        carpeta = siguiente()
+        try:
+            iterador = os.scandir(carpeta)
+        except OSError as e:
+            if errores is not None:
+                errores.append(e)
+            continue
+
+        subcarpetas = []
+        with iterador:
+            for entrada in iterador:
+                try:
+                    es_enlace = entrada.is_symlink()
+                    if es_enlace and not seguir_enlaces:
+                        continue
+                    if entrada.is_dir(follow_symlinks=seguir_enlaces):
+                        if carpeta_ignorada and carpeta_ignorada(entrada.name):
+                            continue
+                        if seguir_enlaces:
+                            st = entrada.stat()
+                            if (st.st_dev, st.st_ino) in visitadas:
+                                continue
+                            visitadas.add((st.st_dev, st.st_ino))
+                        subcarpetas.append(entrada.path)
+                        if incluir_carpetas:
+                            yield EntradaArchivo(entrada.path, entrada.name, 0, 0, None, True)
+                        continue
+                    st = entrada.stat(follow_symlinks=seguir_enlaces)
+                except OSError as e:
+                    if errores is not None:
+                        errores.append(e)
+                    continue
+                # st_ino vale 0 en Windows desde DirEntry (pedirlo costaría otra llamada): quien
+                # lo necesite lo pide con 'inodo_archivo' solo para los archivos nuevos o cambiados
+                yield EntradaArchivo(entrada.path, entrada.name, st.st_size, st.st_mtime_ns, inodo_de(st), False)
+
+        # En profundidad se apilan al revés para visitarlas en el orden del listado
+        pendientes.extend(reversed(subcarpetas) if modo == "profundidad" else subcarpetas)
@@ -0,0 +1,81 @@
+# tests/test_planes_consulta.py
+# Las consultas calientes (gestor_db.CONSULTAS_CALIENTES) deben seguir usando índices cuando
+# el planificador de SQLite tiene estadísticas (ANALYZE) de una DB llena, no solo con la DB vacía.
+
+import random
+import sqlite3
+
+import pytest
+
+from src import gestor_db
+
+ESTADOS = ["Pendiente", "Indexado", "Sin_Texto", "Error"]
+
+# Estadísticas de una DB grande: filas por tabla y, por índice, filas que comparte cada valor
+FILAS_POR_TABLA = {"Activos": 2_000_000, "Registros": 5_000_000, "Sesiones_Foco": 800_000}
+FILAS_POR_VALOR = {
+    "idx_activos_estado": 500_000,       # Cuatro estados: muy poco selectivo
+    "idx_activos_huella": 20,
+    "idx_activos_hash": 2,
+    "idx_registros_activo": 50,
+    "idx_registros_timestamp": 1,
+    "idx_activos_fecha_modificacion": 1,
+    "idx_sesiones_fin": 1,
+}
+
+
+@pytest.fixture
+def conexion(tmp_path, monkeypatch):
+    monkeypatch.setattr(gestor_db, "DB_PATH", tmp_path / "memoria.db")
+    gestor_db.inicializar_base_de_datos()
+    conn = sqlite3.connect(gestor_db.DB_PATH)
+    yield conn
+    conn.close()
+    gestor_db.cerrar_conexiones()
+
+
+def _llenar(conn, n=20_000):
+    azar = random.Random(7)
+    conn.executemany("""
+        INSERT INTO Activos (Ruta_Absoluta, Nombre_Archivo, Extension, Peso_Bytes, Hash_Contenido,
+            Hash_Parcial, Mtime_ns, Estado_Procesamiento, Fecha_Modificacion_DB)
+        VALUES (?, ?, '.dwg', ?, ?, ?, ?, ?, ?)
+    """, [
+        (f"C:/Proyectos/Obra{i % 300}/Plano_{i}.dwg", f"Plano_{i}.dwg", azar.randrange(10**6),
+         f"{i:064x}", f"{i:016x}", i, azar.choice(ESTADOS),
+         gestor_db._marca_tiempo_utc(1.7e9 + i * 60))
+        for i in range(n)
+    ])
+    conn.executemany("""
+        INSERT INTO Registros (Timestamp, Tipo_Evento, Contexto_Crudo, ID_Activo_Asociado)
+        VALUES (?, 'FOCO_VENTANA', ?, ?)
+    """, [(gestor_db._marca_tiempo_utc(1.7e9 + i * 7), f"Plano_{i % n}.dwg - AutoCAD", i % n + 1)
+          for i in range(3 * n)])
+    conn.executemany("""
+        INSERT INTO Sesiones_Foco (Inicio, Fin, Duracion_Segundos, Titulo, Proceso)
+        VALUES (?, ?, 60, ?, 'acad.exe')
+    """, [(gestor_db._marca_tiempo_utc(1.7e9 + i * 90), gestor_db._marca_tiempo_utc(1.7e9 + i * 90 + 60),
+           f"Plano_{i}.dwg - AutoCAD") for i in range(n)])
+    conn.commit()
+
+
+def test_planes_con_db_llena(conexion):
+    _llenar(conexion)
+    conexion.execute("ANALYZE")
+    assert gestor_db.verificar_planes_consulta(conexion) == {}
+
+
+def test_planes_con_estadisticas_de_millones_de_filas(conexion):
+    conexion.execute("ANALYZE") # Crea sqlite_stat1
+    conexion.execute("DELETE FROM sqlite_stat1")
+    filas = []
+    for indice, tabla in conexion.execute("SELECT name, tbl_name FROM sqlite_master WHERE type = 'index'").fetchall():
+        total = FILAS_POR_TABLA.get(tabla, 1000)
+        columnas = len(conexion.execute(f"PRAGMA index_info('{indice}')").fetchall())
+        por_valor = 1 if indice.startswith("sqlite_autoindex") else FILAS_POR_VALOR.get(indice, 10)
+        filas.append((tabla, indice, " ".join([str(total)] + [str(por_valor)] * columnas)))
+    filas += [(tabla, None, str(total)) for tabla, total in FILAS_POR_TABLA.items()]
+    conexion.executemany("INSERT INTO sqlite_stat1 (tbl, idx, stat) VALUES (?, ?, ?)", filas)
+    conexion.commit()
+    conexion.execute("ANALYZE sqlite_master") # Recarga sqlite_stat1 sin recalcularla
+    assert gestor_db.verificar_planes_consulta(conexion) == {}